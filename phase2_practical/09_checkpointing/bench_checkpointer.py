@@ -0,0 +1,126 @@
+"""
+基准测试：SqliteSaver vs WalSqliteSaver 的并发读写吞吐
+=====================================================
+
+每个并发的 thread_id 在自己的线程中：
+- 写阶段：put 检查点（带 messages 条消息）+ put_writes 两条待写入，重复 turns 轮
+- 读阶段：get_tuple 读取最新检查点，重复 turns 次
+
+分别统计每秒操作数和单次操作的 p50 / p95 延迟。两种存储使用相同的表结构和序列化格式。
+
+运行：
+    python bench_checkpointer.py                          # 并发 1 / 8 / 64，每个会话 50 轮
+    python bench_checkpointer.py --concurrency 1 8 64 --turns 100 --messages 40
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR / "checkpoint_utils"))
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.base.id import uuid6
+from langgraph.checkpoint.sqlite import SqliteSaver
+from wal_saver import WalSqliteSaver
+
+SAVERS = {
+    "SqliteSaver": lambda path: SqliteSaver.from_conn_string(path),
+    "WalSqliteSaver": lambda path: WalSqliteSaver.from_conn_string(path, readers=8),
+}
+
+
+def make_messages(count):
+    return [
+        (HumanMessage if i % 2 == 0 else AIMessage)(content=f"第 {i} 条消息：请帮我查询订单 12345 的物流信息，谢谢。")
+        for i in range(count)
+    ]
+
+
+def run_phase(workers, task):
+    """workers 个线程同时开始执行 task(worker)，返回 (总耗时, 所有操作的延迟列表)"""
+    barrier = threading.Barrier(workers)
+    latencies = []
+    lock = threading.Lock()
+
+    def run(worker):
+        barrier.wait()
+        local = task(worker)
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(run, range(workers)))
+    return time.perf_counter() - started, latencies
+
+
+def bench(name, concurrency, turns, messages, folder):
+    history = make_messages(messages)
+    path = str(Path(folder) / f"{name}_{concurrency}.sqlite")
+    with SAVERS[name](path) as saver:
+        def write(worker):
+            config = {"configurable": {"thread_id": f"user_{worker}", "checkpoint_ns": ""}}
+            latencies = []
+            for turn in range(turns):
+                checkpoint = empty_checkpoint()
+                checkpoint["id"] = str(uuid6())
+                checkpoint["channel_values"] = {"messages": history}
+                started = time.perf_counter()
+                config = saver.put(config, checkpoint, {"source": "loop", "step": turn}, {})
+                saver.put_writes(config, [("messages", history[-1]), ("branch:to:model", None)], task_id=f"task_{turn}")
+                latencies.append(time.perf_counter() - started)
+            return latencies
+
+        def read(worker):
+            config = {"configurable": {"thread_id": f"user_{worker}"}}
+            latencies = []
+            for _ in range(turns):
+                started = time.perf_counter()
+                assert saver.get_tuple(config) is not None
+                latencies.append(time.perf_counter() - started)
+            return latencies
+
+        write_seconds, write_latencies = run_phase(concurrency, write)
+        read_seconds, read_latencies = run_phase(concurrency, read)
+        stats = getattr(saver, "stats", None)
+
+    operations = concurrency * turns
+    return {
+        "put_per_sec": operations / write_seconds,
+        "put_p50_ms": statistics.median(write_latencies) * 1000,
+        "put_p95_ms": statistics.quantiles(write_latencies, n=20)[-1] * 1000,
+        "get_per_sec": operations / read_seconds,
+        "get_p50_ms": statistics.median(read_latencies) * 1000,
+        "get_p95_ms": statistics.quantiles(read_latencies, n=20)[-1] * 1000,
+        "avg_batch": stats.avg_batch if stats else 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SqliteSaver vs WalSqliteSaver 并发读写吞吐")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64], help="并发的 thread_id 数")
+    parser.add_argument("--turns", type=int, default=50, help="每个会话的写入 / 读取次数")
+    parser.add_argument("--messages", type=int, default=20, help="每个检查点中的消息数")
+    args = parser.parse_args()
+
+    print(f"每个会话 {args.turns} 轮，每个检查点 {args.messages} 条消息（put = put + put_writes）\n")
+    print(f"{'存储':<16}{'并发':>5}{'put/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'get/s':>10}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'每次提交':>9}")
+    with tempfile.TemporaryDirectory() as folder:
+        for concurrency in args.concurrency:
+            for name in SAVERS:
+                r = bench(name, concurrency, args.turns, args.messages, folder)
+                print(f"{name:<16}{concurrency:>5}{r['put_per_sec']:>10.0f}{r['put_p50_ms']:>9.2f}{r['put_p95_ms']:>9.2f}"
+                      f"{r['get_per_sec']:>10.0f}{r['get_p50_ms']:>9.2f}{r['get_p95_ms']:>9.2f}{r['avg_batch']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
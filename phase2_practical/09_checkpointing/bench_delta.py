@@ -0,0 +1,121 @@
+"""
+基准测试：完整状态检查点 vs 增量检查点（DeltaMessagesState）
+========================================================
+
+用离线假模型跑一个 n 轮的会话（每轮一条用户消息 + 一条回复），统计：
+- 数据库大小、checkpoints / writes 表的字节数
+- 写放大：写入的字节数 / 消息本身序列化后的字节数
+- 每轮耗时，以及最后读取一次完整状态（get_state）的耗时
+
+完整状态的大小随轮数平方增长，超过 --full-max 轮时不实际运行，按平方关系由最大的实测结果估算。
+
+运行：
+    python bench_delta.py                               # 50 / 500 / 5000 轮
+    python bench_delta.py --turns 50 500 --snapshot-every 20 100
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR / "checkpoint_utils"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "shared"))
+
+from typing import Annotated
+
+from langchain.agents import AgentState, create_agent
+from langchain_core.messages import AnyMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+from delta_state import delta_messages
+from fake_chat_model import FakeChatModel
+
+
+def delta_schema(snapshot_every):
+    class DeltaState(AgentState):
+        messages: Annotated[list[AnyMessage], delta_messages(snapshot_every)]
+    return DeltaState
+
+
+def run(path, turns, state_schema=None):
+    with SqliteSaver.from_conn_string(path) as saver:
+        kwargs = {"state_schema": state_schema} if state_schema else {}
+        agent = create_agent(model=FakeChatModel(responses=["好的，订单 12345 已发货，预计明天送达。"]),
+                             tools=[], checkpointer=saver, **kwargs)
+        config = {"configurable": {"thread_id": "long_user"}}
+        started = time.perf_counter()
+        for i in range(turns):
+            agent.invoke({"messages": [{"role": "user", "content": f"第 {i} 轮：请帮我查询订单 12345 的物流信息"}]},
+                         config)
+        turn_ms = (time.perf_counter() - started) * 1000 / turns
+        started = time.perf_counter()
+        messages = agent.get_state(config).values["messages"]
+        read_ms = (time.perf_counter() - started) * 1000
+        saver.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    serde = JsonPlusSerializer()
+    payload = sum(len(serde.dumps_typed(m)[1]) for m in messages)
+    with sqlite3.connect(path) as conn:
+        checkpoint_bytes = conn.execute("SELECT COALESCE(SUM(LENGTH(checkpoint)), 0) FROM checkpoints").fetchone()[0]
+        write_bytes = conn.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM writes").fetchone()[0]
+    assert len(messages) == turns * 2
+    return {
+        "db_bytes": os.path.getsize(path),
+        "checkpoint_bytes": checkpoint_bytes,
+        "write_bytes": write_bytes,
+        "amplification": (checkpoint_bytes + write_bytes) / payload,
+        "turn_ms": turn_ms,
+        "read_ms": read_ms,
+        "estimated": False,
+    }
+
+
+def estimate(measured, measured_turns, turns):
+    """完整状态：检查点字节数按轮数平方增长，其余线性增长"""
+    scale, square = turns / measured_turns, (turns / measured_turns) ** 2
+    checkpoint_bytes = measured["checkpoint_bytes"] * square
+    write_bytes = measured["write_bytes"] * scale
+    payload = (measured["checkpoint_bytes"] + measured["write_bytes"]) / measured["amplification"] * scale
+    return {
+        "db_bytes": measured["db_bytes"] * square,
+        "checkpoint_bytes": checkpoint_bytes,
+        "write_bytes": write_bytes,
+        "amplification": (checkpoint_bytes + write_bytes) / payload,
+        "turn_ms": measured["turn_ms"] * scale,
+        "read_ms": measured["read_ms"] * scale,
+        "estimated": True,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="完整状态检查点 vs 增量检查点")
+    parser.add_argument("--turns", type=int, nargs="+", default=[50, 500, 5000], help="会话轮数")
+    parser.add_argument("--snapshot-every", type=int, nargs="+", default=[100], help="增量通道的快照间隔")
+    parser.add_argument("--full-max", type=int, default=500, help="完整状态实际运行的最大轮数，更多时估算")
+    args = parser.parse_args()
+
+    print(f"{'方式':<20}{'轮数':>6}{'数据库':>12}{'checkpoints':>13}{'writes':>11}{'写放大':>9}{'每轮 ms':>9}{'读取 ms':>9}")
+    with tempfile.TemporaryDirectory() as folder:
+        largest_full = None
+        for turns in sorted(args.turns):
+            rows = []
+            if turns <= args.full_max:
+                largest_full = (turns, run(str(Path(folder) / f"full_{turns}.sqlite"), turns))
+                rows.append(("完整状态", largest_full[1]))
+            elif largest_full:
+                rows.append(("完整状态（估算）", estimate(largest_full[1], largest_full[0], turns)))
+            for every in args.snapshot_every:
+                path = str(Path(folder) / f"delta_{every}_{turns}.sqlite")
+                rows.append((f"增量 快照/{every}", run(path, turns, delta_schema(every))))
+            for name, r in rows:
+                print(f"{name:<20}{turns:>6}{r['db_bytes'] / 2**20:>10.1f}MB{r['checkpoint_bytes'] / 2**20:>11.1f}MB"
+                      f"{r['write_bytes'] / 2**20:>9.1f}MB{r['amplification']:>8.0f}x{r['turn_ms']:>9.1f}{r['read_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
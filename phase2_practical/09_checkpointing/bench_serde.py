@@ -0,0 +1,129 @@
+"""
+基准测试：检查点序列化器的大小和编解码耗时
+=========================================
+
+用离线假模型重放 main.py 示例 6（持久化客服系统）的对话：每位客户三条消息
+（查询订单 → 给出订单号、调用 get_order_status → 下午再问订单到哪了），
+用 SqliteSaver 记录所有检查点和待写入，然后对这些数据比较：
+- JsonPlusSerializer（SqliteSaver 默认，msgpack 不压缩）
+- CompressedSerializer（msgpack + zstd）
+- CompressedSerializer + 字典（用前一半客户的数据训练，在后一半客户上统计）
+
+统计每个检查点 / 每条待写入的平均字节数，以及单次编码、解码的平均耗时（微秒）。
+
+运行：
+    python bench_serde.py                                  # 400 位客户
+    python bench_serde.py --customers 1000 --dict-size 32768 --level 3
+"""
+
+import argparse
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR / "checkpoint_utils"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "shared"))
+
+from langchain.agents import create_agent
+from langchain_core.messages import ToolMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+from compressed_serde import CompressedSerializer, train_dictionary
+from fake_chat_model import FakeChatModel, tool_call
+from main import get_order_status
+
+# 与示例 6 相同的系统提示
+SYSTEM_PROMPT = """你是客服助手。
+特点：
+- 记住客户之前的咨询
+- 友好、耐心
+- 使用工具查询订单"""
+
+GREETINGS = ["你好，我想查询订单", "您好，帮我查一下订单", "在吗？我想问一下我的订单"]
+FOLLOW_UPS = ["我的订单到哪了？", "订单现在什么状态？", "之前那个订单送到哪里了？"]
+
+
+def respond(messages, tools):
+    """按示例 6 的流程回复：工具结果之后总结，消息里有订单号时调用工具，否则询问订单号"""
+    last = messages[-1]
+    if isinstance(last, ToolMessage):
+        return f"您的订单状态：{last.content}。还有其他可以帮您的吗？"
+    text = last.content if isinstance(last.content, str) else ""
+    digits = "".join(c for c in text if c.isdigit())
+    if digits:
+        return tool_call("get_order_status", order_id=digits)
+    if any(isinstance(m, ToolMessage) for m in messages):
+        return "根据上午的查询记录，您的订单已发货，预计明天送达，请耐心等待。"
+    return "您好！很高兴为您服务，请提供一下您的订单号。"
+
+
+def record(path, customers, seed=0):
+    """跑 customers 位客户的会话，返回 [(客户, 表名, 类型, 数据)]"""
+    rng = random.Random(seed)
+    with SqliteSaver.from_conn_string(path) as saver:
+        agent = create_agent(model=FakeChatModel(respond=respond), tools=[get_order_status],
+                             system_prompt=SYSTEM_PROMPT, checkpointer=saver)
+        for i in range(customers):
+            config = {"configurable": {"thread_id": f"customer_{i}"}}
+            order_id = rng.choice(["12345", "67890", str(rng.randint(10000, 99999))])
+            for message in (rng.choice(GREETINGS), f"订单号是 {order_id}", rng.choice(FOLLOW_UPS)):
+                agent.invoke({"messages": [{"role": "user", "content": message}]}, config)
+    with sqlite3.connect(path) as conn:
+        rows = [("checkpoints", *r) for r in conn.execute("SELECT thread_id, type, checkpoint FROM checkpoints")]
+        rows += [("writes", *r) for r in conn.execute("SELECT thread_id, type, value FROM writes")]
+    return [(int(thread.split("_")[1]), table, type_, blob) for table, thread, type_, blob in rows]
+
+
+def measure(serde, objects):
+    """返回 (平均字节数, 编码 µs, 解码 µs)"""
+    started = time.perf_counter()
+    encoded = [serde.dumps_typed(obj) for obj in objects]
+    encode_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for item in encoded:
+        serde.loads_typed(item)
+    decode_seconds = time.perf_counter() - started
+    count = len(objects)
+    return sum(len(data) for _, data in encoded) / count, encode_seconds / count * 1e6, decode_seconds / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查点序列化器的大小和编解码耗时")
+    parser.add_argument("--customers", type=int, default=400, help="客户（会话）数，一半用于训练字典")
+    parser.add_argument("--dict-size", type=int, default=16 * 1024, help="字典大小（字节）")
+    parser.add_argument("--level", type=int, default=3, help="zstd 压缩级别")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        rows = record(str(Path(folder) / "customer_service.sqlite"), args.customers)
+
+    plain = JsonPlusSerializer()
+    half = args.customers // 2
+    train = [blob for customer, _, _, blob in rows if customer < half]
+    dictionary = train_dictionary(train, size=args.dict_size)
+    serdes = {
+        "JsonPlusSerializer": plain,
+        "zstd": CompressedSerializer(level=args.level),
+        "zstd + 字典": CompressedSerializer(dictionary=dictionary, level=args.level),
+    }
+
+    print(f"{args.customers} 位客户，前 {half} 位训练字典（{len(train)} 个样本，字典 {args.dict_size // 1024} KB），"
+          f"后 {args.customers - half} 位统计\n")
+    print(f"{'数据':<14}{'序列化器':<22}{'平均字节':>10}{'压缩比':>8}{'编码 µs':>10}{'解码 µs':>10}")
+    for table, label in [("checkpoints", "检查点"), ("writes", "待写入")]:
+        objects = [plain.loads_typed((type_, blob)) for customer, t, type_, blob in rows
+                   if t == table and customer >= half]
+        baseline = None
+        for name, serde in serdes.items():
+            size, encode_us, decode_us = measure(serde, objects)
+            baseline = baseline or size
+            print(f"{label + f'（{len(objects)}）':<14}{name:<22}{size:>10.0f}{baseline / size:>7.1f}x"
+                  f"{encode_us:>10.1f}{decode_us:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
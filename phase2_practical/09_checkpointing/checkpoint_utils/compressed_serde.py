@@ -0,0 +1,131 @@
+"""
+压缩的检查点序列化器：msgpack + zstd（可选训练字典）
+==================================================
+
+SqliteSaver 默认用 JsonPlusSerializer 把检查点和待写入序列化成 msgpack，原样存进 BLOB。
+消息里大量重复的字段名、类名（"lc"、"kwargs"、"langchain_core"、"additional_kwargs" ...）
+和相同的系统提示、工具结果，每个检查点都要存一遍。
+
+CompressedSerializer 包装任意序列化器（默认 JsonPlusSerializer）：
+- 序列化结果不小于 min_size 时用 zstd 压缩；可以用同类数据训练一个共享字典，对几百字节的小对象也有效
+- 类型字段加上 "+zstd" 后缀（与 LangGraph 的 EncryptedSerializer 相同的约定），数据前加 5 字节头：
+  版本号（1 字节）+ 字典 id（4 字节，0 表示不用字典）
+- 读取时类型没有 "+zstd" 后缀的旧数据直接交给内部序列化器，已有的数据库不需要迁移
+- 字典用 save_dictionary / load_dictionary 保存为文件；读取旧字典压缩的数据时，
+  把旧字典也传给 dictionaries 参数
+
+用法：
+    serde = CompressedSerializer()                          # 不用字典
+    with SqliteSaver.from_conn_string("checkpoints.sqlite") as checkpointer:
+        checkpointer.serde = serde                          # 或 WalSqliteSaver(path, serde=serde)
+
+    dictionary = train_dictionary(samples, size=16 * 1024)  # samples：已有的检查点数据（bytes）
+    save_dictionary(dictionary, "checkpoint.dict")
+    serde = CompressedSerializer(dictionary=load_dictionary("checkpoint.dict"))
+"""
+
+import struct
+import threading
+from pathlib import Path
+
+import zstandard
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+SUFFIX = "+zstd"
+VERSION = 1
+_HEADER = struct.Struct(">BI")       # 版本号, 字典 id
+
+
+def train_dictionary(samples, size=16 * 1024):
+    """用样本（bytes 列表，例如 JsonPlusSerializer 序列化的检查点）训练 zstd 字典"""
+    samples = [s for s in samples if s]
+    if len(samples) < 8:
+        raise ValueError(f"训练字典至少需要 8 个样本，当前 {len(samples)} 个")
+    return zstandard.train_dictionary(size, samples)
+
+
+def save_dictionary(dictionary, path):
+    Path(path).write_bytes(dictionary.as_bytes())
+
+
+def load_dictionary(path):
+    return zstandard.ZstdCompressionDict(Path(path).read_bytes())
+
+
+class CompressedSerializer:
+    """
+    压缩的序列化器（实现 LangGraph 的 SerializerProtocol：dumps_typed / loads_typed）
+
+    参数:
+        serde: 内部序列化器，默认 JsonPlusSerializer（msgpack）
+        dictionary: 写入时使用的 zstd 字典（None 表示不用字典）
+        dictionaries: 读取时额外可用的字典（例如更换字典前的旧字典）
+        level: zstd 压缩级别
+        min_size: 小于该字节数的数据不压缩
+    """
+
+    def __init__(self, serde=None, dictionary=None, dictionaries=(), level=3, min_size=64):
+        self.serde = serde or JsonPlusSerializer()
+        self.dictionary = dictionary
+        self.level = level
+        self.min_size = min_size
+        self._dict_id = dictionary.dict_id() if dictionary is not None else 0
+        self._dictionaries = {d.dict_id(): d for d in (*dictionaries, *([dictionary] if dictionary else []))}
+        # zstd 的压缩 / 解压对象不是线程安全的，每个线程各用一份
+        self._local = threading.local()
+
+    def _compressor(self):
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary)
+        return compressor
+
+    def _decompressor(self, dict_id):
+        cache = getattr(self._local, "decompressors", None)
+        if cache is None:
+            cache = self._local.decompressors = {}
+        if dict_id not in cache:
+            if dict_id and dict_id not in self._dictionaries:
+                raise ValueError(f"缺少 id 为 {dict_id} 的压缩字典，请通过 dictionaries 参数传入")
+            cache[dict_id] = zstandard.ZstdDecompressor(dict_data=self._dictionaries.get(dict_id))
+        return cache[dict_id]
+
+    def dumps_typed(self, obj):
+        type_, data = self.serde.dumps_typed(obj)
+        if len(data) < self.min_size:
+            return type_, data
+        return type_ + SUFFIX, _HEADER.pack(VERSION, self._dict_id) + self._compressor().compress(data)
+
+    def loads_typed(self, data):
+        type_, payload = data
+        if not type_.endswith(SUFFIX):
+            return self.serde.loads_typed(data)
+        version, dict_id = _HEADER.unpack_from(payload)
+        if version != VERSION:
+            raise ValueError(f"不支持的压缩格式版本: {version}")
+        raw = self._decompressor(dict_id).decompress(payload[_HEADER.size:])
+        return self.serde.loads_typed((type_[:-len(SUFFIX)], raw))
+
+
+# 测试：压缩后的消息能还原，未压缩的旧数据仍可读取
+if __name__ == "__main__":
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    plain = JsonPlusSerializer()
+    conversations = [
+        [HumanMessage(f"你好，我想查询订单 {10000 + i}"), AIMessage(f"您的订单 {10000 + i} 已发货，预计明天送达。")]
+        for i in range(200)
+    ]
+    samples = [plain.dumps_typed(c)[1] for c in conversations]
+    dictionary = train_dictionary(samples[:100], size=4096)
+
+    for name, serde in [("JsonPlusSerializer", plain),
+                        ("zstd", CompressedSerializer()),
+                        ("zstd + 字典", CompressedSerializer(dictionary=dictionary))]:
+        encoded = [serde.dumps_typed(c) for c in conversations[100:]]
+        assert all(serde.loads_typed(e) == c for e, c in zip(encoded, conversations[100:]))
+        print(f"{name:<20} 平均 {sum(len(b) for _, b in encoded) / len(encoded):6.0f} 字节  类型 {encoded[0][0]}")
+
+    old_row = plain.dumps_typed(conversations[0])
+    assert CompressedSerializer(dictionary=dictionary).loads_typed(old_row) == conversations[0]
+    print("未压缩的旧数据可以直接读取")
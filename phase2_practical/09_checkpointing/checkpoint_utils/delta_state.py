@@ -0,0 +1,97 @@
+"""
+增量检查点：messages 只存新增的消息 + 定期快照
+=============================================
+
+默认的 Agent 状态中 messages 是普通的 reducer 通道：每一步的检查点都带着完整的消息列表。
+会话有 n 轮时，第 n 轮的每个检查点都要序列化、写入 n 轮的全部消息，数据库大小随轮数平方增长
+（demo_context_problem.py 中 50 轮对话已经能看出来）。
+
+LangGraph 的 DeltaChannel（beta）把通道值换成一个标记：
+- 每一步只把新增的消息写入 writes 表（这一步本来就要写）
+- 每 snapshot_every 次更新写一次完整快照
+- 读取时沿 parent_checkpoint_id 找到最近的快照，按顺序重放之后的写入（SqliteSaver.get_delta_channel_history）
+
+本模块提供 messages 的增量通道和对应的 Agent 状态，作为 create_agent(state_schema=...) 传入即可，
+SqliteSaver、WalSqliteSaver、InMemorySaver 都支持。旧会话中的完整列表会被当作快照，可以继续读写。
+
+snapshot_every 越小，读取时重放的写入越少，但快照占用的空间越多。
+
+用法：
+    from delta_state import DeltaMessagesState
+
+    agent = create_agent(model=model, tools=[...], checkpointer=checkpointer, state_schema=DeltaMessagesState)
+
+    # 自定义快照间隔
+    class MyState(AgentState):
+        messages: Annotated[list[AnyMessage], delta_messages(snapshot_every=20)]
+"""
+
+from typing import Annotated
+
+from langchain.agents import AgentState
+from langchain_core.messages import AnyMessage, RemoveMessage
+from langgraph.channels.delta import DeltaChannel
+from langgraph.graph.message import add_messages
+
+DEFAULT_SNAPSHOT_EVERY = 100
+
+
+def add_messages_batch(messages, writes):
+    """
+    DeltaChannel 的 reducer：按顺序把一批写入合并进消息列表，结果与逐个调用 add_messages 相同
+
+    add_messages 每次调用都要遍历整个列表，重放几十个写入时逐个调用是 O(写入数 × 消息数)；
+    这里把相邻的普通写入拼成一次调用，只在含 RemoveMessage 的写入处分段（删除后再添加同一 id 的顺序与逐个调用一致）
+    """
+    result = messages if messages is not None else []
+    pending = []
+    for write in writes:
+        items = write if isinstance(write, list) else [write]
+        if any(isinstance(m, RemoveMessage) for m in items):
+            if pending:
+                result, pending = add_messages(result, pending), []
+            result = add_messages(result, items)
+        else:
+            pending.extend(items)
+    return add_messages(result, pending) if pending else result
+
+
+def delta_messages(snapshot_every=DEFAULT_SNAPSHOT_EVERY):
+    """messages 的增量通道：每 snapshot_every 次更新写一次完整快照"""
+    return DeltaChannel(add_messages_batch, snapshot_frequency=snapshot_every)
+
+
+class DeltaMessagesState(AgentState):
+    """create_agent 的状态：messages 增量存储，每 100 次更新一次快照"""
+    messages: Annotated[list[AnyMessage], delta_messages()]
+
+
+# 测试：同样 100 轮对话，对比两种状态的数据库大小和读取结果
+if __name__ == "__main__":
+    import os
+    import sys
+    import tempfile
+    from pathlib import Path
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "shared"))
+    from langchain.agents import create_agent
+    from langgraph.checkpoint.sqlite import SqliteSaver
+    from fake_chat_model import FakeChatModel
+
+    def conversation(path, turns, state_schema=None):
+        with SqliteSaver.from_conn_string(path) as saver:
+            kwargs = {"state_schema": state_schema} if state_schema else {}
+            agent = create_agent(model=FakeChatModel(), tools=[], checkpointer=saver, **kwargs)
+            config = {"configurable": {"thread_id": "long_user"}}
+            for i in range(turns):
+                agent.invoke({"messages": [{"role": "user", "content": f"这是第 {i} 条消息"}]}, config)
+            return agent.get_state(config).values["messages"]
+
+    with tempfile.TemporaryDirectory() as folder:
+        full_path, delta_path = str(Path(folder) / "full.sqlite"), str(Path(folder) / "delta.sqlite")
+        full = conversation(full_path, 100)
+        delta = conversation(delta_path, 100, DeltaMessagesState)
+        assert [m.content for m in full] == [m.content for m in delta]
+        print(f"100 轮对话，{len(delta)} 条消息，两种方式读取的结果相同")
+        print(f"  完整状态: {os.path.getsize(full_path) / 1024:8.0f} KB")
+        print(f"  增量存储: {os.path.getsize(delta_path) / 1024:8.0f} KB")
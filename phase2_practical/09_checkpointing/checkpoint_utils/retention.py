@@ -0,0 +1,392 @@
+"""
+检查点保留策略与压缩：定期清理长期运行的 SQLite 检查点库
+====================================================
+
+SqliteSaver 保存每个会话每一步的检查点和待写入，从不删除，数据库只增不减。
+run_retention 按保留策略删除旧数据：
+- keep_last：每个会话（thread_id + checkpoint_ns）只保留最近 N 个检查点
+- max_age：只保留比该时长更新的检查点（最新的检查点总是保留，整个会话的删除交给 idle_ttl）
+- idle_ttl：最后一个检查点早于该时长的会话整个删除
+
+检查点 id 是 uuid6，本身带有创建时间，判断时间不需要解码检查点。
+
+执行方式：
+- 先用只读查询按 thread_id 分页扫描（WAL 模式下不阻塞写入），再分批删除：
+  每批最多 batch_size 个检查点（连同它们的 writes）一个短事务，批之间可以 pause 让出写锁
+- 删除空闲会话前在同一事务里再确认一次它仍然空闲，扫描之后又有新对话的会话不会被误删
+- 增量通道（DeltaChannel / DeltaMessagesState）：保留的检查点要从祖先的 writes 重放出消息，
+  一直到最近的快照。删除前沿 parent_checkpoint_id 向上检查，把到快照为止的祖先和它们的 writes 一起保留
+  （计入 protected），不会留下读不出消息的检查点
+- vacuum="incremental"：分批 PRAGMA incremental_vacuum 归还空闲页（需要数据库是 auto_vacuum=INCREMENTAL）；
+  vacuum="full"：VACUUM 重建整个文件并切换到 auto_vacuum=INCREMENTAL，之后可以一直用增量方式。
+  VACUUM 期间整个库被锁住，只适合停机维护时执行
+- dry_run=True 只统计会删除多少，不做修改
+
+用法：
+    from retention import RetentionPolicy, run_retention
+
+    report = run_retention("checkpoints.sqlite", RetentionPolicy(keep_last=20, idle_ttl=timedelta(days=90)),
+                           vacuum="incremental")
+    print(report)
+
+    # 命令行
+    python checkpoint_utils/retention.py checkpoints.sqlite --keep-last 20 --max-age 30d --idle-ttl 90d --dry-run
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+# uuid 的时间戳从 1582-10-15 起按 100 纳秒计数，与 Unix 时间相差的计数
+_UUID_EPOCH_OFFSET = 0x01B21DD213814000
+_DURATION = re.compile(r"^(\d+(?:\.\d+)?)([smhdw])$")
+_DURATION_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+DELTA_COUNTERS_KEY = "counters_since_delta_snapshot"
+
+
+@dataclass
+class RetentionPolicy:
+    """保留策略；三项都是 None 时不删除任何数据"""
+    keep_last: int | None = None
+    max_age: timedelta | None = None
+    idle_ttl: timedelta | None = None
+
+    def __post_init__(self):
+        if self.keep_last is not None and self.keep_last < 1:
+            raise ValueError("keep_last 至少为 1（删除整个会话请用 idle_ttl）")
+
+
+@dataclass
+class RetentionReport:
+    """一次清理的统计"""
+    threads_scanned: int = 0
+    threads_deleted: int = 0
+    checkpoints_deleted: int = 0
+    writes_deleted: int = 0
+    protected: int = 0              # 本应删除、但增量通道还要用到而保留的检查点
+    batches: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+    freed_bytes: int = 0            # 删除后数据库内的空闲页（VACUUM 前文件不会变小，空闲页会被之后的写入复用）
+    seconds: float = 0.0
+    dry_run: bool = False
+    notes: list = field(default_factory=list)
+
+    @property
+    def reclaimed_bytes(self):
+        return max(self.bytes_before - self.bytes_after, 0)
+
+    def __str__(self):
+        prefix = "[dry run] 将删除" if self.dry_run else "删除"
+        lines = [
+            f"{prefix} {self.threads_deleted} 个空闲会话、{self.checkpoints_deleted} 个检查点、{self.writes_deleted} 条 writes"
+            f"（扫描 {self.threads_scanned} 个会话，{self.batches} 批，{self.seconds:.2f}s）",
+            f"增量通道需要而保留的检查点: {self.protected}",
+            f"文件大小: {self.bytes_before / 2**20:.1f}MB -> {self.bytes_after / 2**20:.1f}MB"
+            f"（归还 {self.reclaimed_bytes / 2**20:.1f}MB，库内空闲 {self.freed_bytes / 2**20:.1f}MB）",
+        ]
+        return "\n".join(lines + [f"注意: {note}" for note in self.notes])
+
+
+def checkpoint_time(checkpoint_id):
+    """从 uuid6 的检查点 id 取出创建时间（Unix 秒）；不是 uuid6 时返回 None"""
+    try:
+        value = uuid.UUID(checkpoint_id)
+    except (TypeError, ValueError):
+        return None
+    if value.version != 6:
+        return None
+    ticks = (value.time_low << 28) | (value.time_mid << 12) | (value.time_hi_version & 0x0FFF)
+    return (ticks - _UUID_EPOCH_OFFSET) / 1e7
+
+
+def checkpoint_id_at(timestamp):
+    """Unix 时间对应的最小 uuid6 检查点 id：按字符串比较，checkpoint_id >= 它的检查点都不早于该时间"""
+    ticks = int(timestamp * 1e7) + _UUID_EPOCH_OFFSET
+    return f"{ticks >> 28:08x}-{(ticks >> 12) & 0xFFFF:04x}-6{ticks & 0x0FFF:03x}-8000-000000000000"
+
+
+def parse_duration(text):
+    """"90d" / "12h" / "30m" / "45s" / "2w" -> timedelta"""
+    match = _DURATION.match(text.strip())
+    if not match:
+        raise ValueError(f"无法识别的时长: {text!r}（例如 30d、12h、2w）")
+    return timedelta(**{_DURATION_UNITS[match.group(2)]: float(match.group(1))})
+
+
+def _database_bytes(path):
+    return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+
+
+def _pragma(conn, pragma):
+    return conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+
+
+class _Job:
+    """一次清理：扫描、判断、分批删除"""
+
+    def __init__(self, conn, policy, *, batch_size, pause, dry_run, now, serde, report):
+        self.conn = conn
+        self.policy = policy
+        self.batch_size = batch_size
+        self.pause = pause
+        self.dry_run = dry_run
+        self.now = now
+        self.serde = serde
+        self.report = report
+        self.pending = []           # [(thread_id, checkpoint_ns, checkpoint_id)]
+        self.idle = set()           # dry run 时已计入删除的空闲会话
+
+    # ------------------------------------------------------------------
+    # 空闲会话
+    # ------------------------------------------------------------------
+    def delete_idle_threads(self):
+        cutoff = self.now - self.policy.idle_ttl.total_seconds()
+        after = ""
+        while True:
+            rows = self.conn.execute(
+                "SELECT thread_id, MAX(checkpoint_id) FROM checkpoints WHERE thread_id > ? "
+                "GROUP BY thread_id ORDER BY thread_id LIMIT ?",
+                (after, self.batch_size),
+            ).fetchall()
+            if not rows:
+                return
+            after = rows[-1][0]
+            for thread_id, latest in rows:
+                created = checkpoint_time(latest)
+                if created is not None and created < cutoff:
+                    self._delete_thread(thread_id, latest)
+
+    def _delete_thread(self, thread_id, latest):
+        """分批删除整个会话；每批在事务里确认没有比 latest 更新的检查点"""
+        if self.dry_run:
+            self.idle.add(thread_id)
+            self.report.threads_deleted += 1
+            self.report.checkpoints_deleted += self.conn.execute(
+                "SELECT COUNT(*) FROM checkpoints WHERE thread_id = ?", (thread_id,)).fetchone()[0]
+            self.report.writes_deleted += self.conn.execute(
+                "SELECT COUNT(*) FROM writes WHERE thread_id = ?", (thread_id,)).fetchone()[0]
+            return
+        while True:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                newer = self.conn.execute("SELECT 1 FROM checkpoints WHERE thread_id = ? AND checkpoint_id > ? LIMIT 1",
+                                          (thread_id, latest)).fetchone()
+                if newer:
+                    self.conn.execute("COMMIT")
+                    self.report.notes.append(f"会话 {thread_id} 在清理期间有新的检查点，已跳过")
+                    return
+                writes = self.conn.execute(
+                    "DELETE FROM writes WHERE rowid IN (SELECT rowid FROM writes WHERE thread_id = ? LIMIT ?)",
+                    (thread_id, self.batch_size)).rowcount
+                checkpoints = 0
+                if writes < self.batch_size:
+                    checkpoints = self.conn.execute(
+                        "DELETE FROM checkpoints WHERE rowid IN "
+                        "(SELECT rowid FROM checkpoints WHERE thread_id = ? LIMIT ?)",
+                        (thread_id, self.batch_size - writes)).rowcount
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            if writes + checkpoints == 0:
+                self.report.threads_deleted += 1
+                return
+            self.report.writes_deleted += writes
+            self.report.checkpoints_deleted += checkpoints
+            self.report.batches += 1
+            self._yield()
+
+    # ------------------------------------------------------------------
+    # 每个会话内的旧检查点
+    # ------------------------------------------------------------------
+    def prune_threads(self):
+        after = ("", "")
+        while True:
+            rows = self.conn.execute(
+                "SELECT thread_id, checkpoint_ns, COUNT(*) FROM checkpoints WHERE (thread_id, checkpoint_ns) > (?, ?) "
+                "GROUP BY thread_id, checkpoint_ns ORDER BY thread_id, checkpoint_ns LIMIT ?",
+                (*after, self.batch_size),
+            ).fetchall()
+            if not rows:
+                break
+            after = rows[-1][:2]
+            for thread_id, checkpoint_ns, count in rows:
+                if thread_id in self.idle:
+                    continue
+                self.report.threads_scanned += 1
+                if self.policy.max_age is not None or count > (self.policy.keep_last or count):
+                    self._prune_thread(thread_id, checkpoint_ns)
+        self._flush()
+
+    def _prune_thread(self, thread_id, checkpoint_ns):
+        rows = self.conn.execute(
+            "SELECT checkpoint_id, parent_checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC",
+            (thread_id, checkpoint_ns),
+        ).fetchall()
+        parents = dict(rows)
+        keep_last = self.policy.keep_last or len(rows)
+        cutoff = self.now - self.policy.max_age.total_seconds() if self.policy.max_age is not None else None
+        kept = set()
+        for index, (checkpoint_id, _) in enumerate(rows):
+            created = checkpoint_time(checkpoint_id)
+            too_old = cutoff is not None and created is not None and created < cutoff
+            if index == 0 or (index < keep_last and not too_old):
+                kept.add(checkpoint_id)
+        if len(kept) == len(rows):
+            return
+
+        # 保留的检查点中，父检查点要被删除的是“边界”：从边界向上保留到增量通道的快照为止
+        for checkpoint_id in [c for c in kept if parents[c] is not None and parents[c] not in kept]:
+            for ancestor in self._delta_ancestors(thread_id, checkpoint_ns, checkpoint_id, parents):
+                if ancestor not in kept:
+                    kept.add(ancestor)
+                    self.report.protected += 1
+        self.pending.extend((thread_id, checkpoint_ns, c) for c, _ in rows if c not in kept)
+        if len(self.pending) >= self.batch_size:
+            self._flush()
+
+    def _load(self, thread_id, checkpoint_ns, checkpoint_id):
+        return self.conn.execute(
+            "SELECT type, checkpoint, metadata FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "AND checkpoint_id = ?",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchone()
+
+    def _delta_ancestors(self, thread_id, checkpoint_ns, checkpoint_id, parents):
+        """
+        checkpoint_id 的增量通道要用到的祖先：沿父检查点向上，直到每个增量通道都在 channel_values 中有快照
+
+        增量通道的名字来自 metadata 的 counters_since_delta_snapshot；不用增量通道的会话不会解码任何检查点
+        """
+        type_, blob, metadata = self._load(thread_id, checkpoint_ns, checkpoint_id)
+        channels = set(json.loads(metadata or b"{}").get(DELTA_COUNTERS_KEY) or {})
+        if not channels:
+            return []
+        channels -= set(self.serde.loads_typed((type_, blob)).get("channel_values") or {})
+        needed, current = [], parents.get(checkpoint_id)
+        while channels and current in parents and current not in needed:
+            needed.append(current)
+            type_, blob, _ = self._load(thread_id, checkpoint_ns, current)
+            channels -= set(self.serde.loads_typed((type_, blob)).get("channel_values") or {})
+            current = parents[current]
+        return needed
+
+    def _flush(self):
+        """把待删除的检查点分批删除，每批一个短事务"""
+        while self.pending:
+            batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            self.report.batches += 1
+            self.report.checkpoints_deleted += len(batch)
+            if self.dry_run:
+                self.report.writes_deleted += sum(
+                    self.conn.execute("SELECT COUNT(*) FROM writes WHERE thread_id = ? AND checkpoint_ns = ? "
+                                      "AND checkpoint_id = ?", key).fetchone()[0]
+                    for key in batch
+                )
+                continue
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                before = self.conn.total_changes
+                self.conn.executemany(
+                    "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", batch)
+                self.report.writes_deleted += self.conn.total_changes - before
+                self.conn.executemany(
+                    "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", batch)
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self._yield()
+
+    def _yield(self):
+        if self.pause:
+            time.sleep(self.pause)
+
+    # ------------------------------------------------------------------
+    # 归还空间
+    # ------------------------------------------------------------------
+    def vacuum(self, mode):
+        if mode == "full":
+            self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self.conn.execute("VACUUM")
+        elif mode == "incremental":
+            if _pragma(self.conn, "auto_vacuum") != 2:
+                self.report.notes.append("数据库不是 auto_vacuum=INCREMENTAL，未执行增量回收；先用 vacuum='full' 执行一次")
+                return
+            while _pragma(self.conn, "freelist_count"):
+                # execute 只执行一步（归还一页），executescript 会执行到结束
+                self.conn.executescript(f"PRAGMA incremental_vacuum({self.batch_size})")
+                self.report.batches += 1
+                self._yield()
+        elif mode is not None:
+            raise ValueError(f"vacuum 只能是 None、'incremental' 或 'full'，当前为 {mode!r}")
+
+
+def run_retention(path, policy, *, batch_size=500, pause=0.0, vacuum=None, dry_run=False, now=None, serde=None):
+    """
+    按保留策略清理检查点库，返回 RetentionReport
+
+    参数:
+        path: 数据库文件路径
+        policy: RetentionPolicy
+        batch_size: 每个删除事务最多删除的检查点数（也是扫描的分页大小、每次增量回收的页数）
+        pause: 每批之间暂停的秒数，给在线的写入让出锁
+        vacuum: None / "incremental" / "full"
+        dry_run: 只统计不删除
+        now: 当前时间（Unix 秒，默认 time.time()）
+        serde: 解码增量通道的检查点时使用的序列化器（与写入时相同，例如 CompressedSerializer；默认 JsonPlusSerializer）
+    """
+    if vacuum not in (None, "incremental", "full"):
+        raise ValueError(f"vacuum 只能是 None、'incremental' 或 'full'，当前为 {vacuum!r}")
+    started = time.perf_counter()
+    report = RetentionReport(dry_run=dry_run, bytes_before=_database_bytes(path))
+    conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        free_before = _pragma(conn, "freelist_count")
+        job = _Job(conn, policy, batch_size=batch_size, pause=pause, dry_run=dry_run,
+                   now=time.time() if now is None else now, serde=serde or JsonPlusSerializer(), report=report)
+        if policy.idle_ttl is not None:
+            job.delete_idle_threads()
+        if policy.keep_last is not None or policy.max_age is not None:
+            job.prune_threads()
+        report.freed_bytes = (_pragma(conn, "freelist_count") - free_before) * _pragma(conn, "page_size")
+        if not dry_run:
+            job.vacuum(vacuum)
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+    report.bytes_after = _database_bytes(path)
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按保留策略清理 SQLite 检查点库")
+    parser.add_argument("path", help="数据库文件路径")
+    parser.add_argument("--keep-last", type=int, help="每个会话保留最近 N 个检查点")
+    parser.add_argument("--max-age", type=parse_duration, help="只保留比该时长更新的检查点，例如 30d")
+    parser.add_argument("--idle-ttl", type=parse_duration, help="删除空闲超过该时长的会话，例如 90d")
+    parser.add_argument("--batch-size", type=int, default=500, help="每个删除事务最多删除的检查点数")
+    parser.add_argument("--pause", type=float, default=0.0, help="每批之间暂停的秒数")
+    parser.add_argument("--vacuum", choices=["incremental", "full"], help="删除后归还空间")
+    parser.add_argument("--dry-run", action="store_true", help="只统计不删除")
+    args = parser.parse_args(argv)
+
+    policy = RetentionPolicy(keep_last=args.keep_last, max_age=args.max_age, idle_ttl=args.idle_ttl)
+    print(run_retention(args.path, policy, batch_size=args.batch_size, pause=args.pause,
+                        vacuum=args.vacuum, dry_run=args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
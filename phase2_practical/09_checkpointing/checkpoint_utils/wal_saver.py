@@ -0,0 +1,340 @@
+"""
+WAL 模式 + 连接池的 SQLite 检查点存储
+====================================
+
+SqliteSaver.from_conn_string(db_path) 只有一个连接，所有读写都在同一把锁上排队，
+并发的多个用户（thread_id）互相等待；每次 put 单独提交一次事务，默认 synchronous=FULL，每次提交都要 fsync。
+
+WalSqliteSaver 是 SqliteSaver 的子类，表结构和序列化格式不变（同一个数据库文件两者可以互相读取）：
+- WAL 日志模式 + synchronous=NORMAL：提交只追加 WAL，不再每次 fsync（断电时可能丢失最后几次提交，进程崩溃不会）
+- 读连接池：get_tuple / list 从池中取只读连接，多个线程同时读，不阻塞写入
+- 单个写线程：put / put_writes / delete_thread 在调用线程里序列化好，交给写线程；
+  写线程把排队的写入合并到一个事务里提交（组提交），每个写入用 SAVEPOINT 隔离，一个失败不影响同批的其他写入；
+  调用方等到自己的写入提交后才返回，之后的读取一定能读到
+- 预编译语句：SQL 文本固定，sqlite3 按连接缓存编译好的语句（cached_statements），重复执行不再解析
+- 支持 aget_tuple / alist / aput / aput_writes（在线程池中执行），可以配合 AsyncAgentRunner 使用
+
+用法：
+    with WalSqliteSaver.from_conn_string("checkpoints.sqlite", readers=4) as checkpointer:
+        agent = create_agent(model=model, tools=[], checkpointer=checkpointer)
+        agent.invoke(..., {"configurable": {"thread_id": "user_1"}})
+        print(checkpointer.stats)
+"""
+
+import asyncio
+import json
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from dataclasses import dataclass
+from typing import cast
+
+from langgraph.checkpoint.base import WRITES_IDX_MAP, CheckpointMetadata, CheckpointTuple, get_checkpoint_metadata
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.utils import search_where
+
+UPSERT_CHECKPOINT_SQL = (
+    "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, "
+    "checkpoint, metadata) VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+_WRITES_COLUMNS = "(thread_id, checkpoint_ns, checkpoint_id, task_id, task_path, idx, channel, type, value)"
+UPSERT_WRITES_SQL = f"INSERT OR REPLACE INTO writes {_WRITES_COLUMNS} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+INSERT_WRITES_SQL = f"INSERT OR IGNORE INTO writes {_WRITES_COLUMNS} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+# 按 (task_path, task_id, idx) 排序，与执行时应用同一步写入的顺序一致
+PENDING_WRITES_SQL = (
+    "SELECT task_id, channel, type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? "
+    "ORDER BY task_path, task_id, idx"
+)
+
+_STATEMENT_CACHE = 256
+
+
+@dataclass
+class WriterStats:
+    """写线程的累计统计"""
+    jobs: int = 0
+    commits: int = 0
+    failures: int = 0
+    max_batch: int = 0
+    commit_seconds: float = 0.0
+
+    @property
+    def avg_batch(self):
+        return self.jobs / self.commits if self.commits else 0.0
+
+    def __str__(self):
+        return (f"写入 {self.jobs} 次，提交 {self.commits} 次（平均每次 {self.avg_batch:.1f} 个，最多 {self.max_batch}），"
+                f"失败 {self.failures}；提交耗时共 {self.commit_seconds:.2f}s")
+
+
+class _WriteJob:
+    __slots__ = ("statements", "done", "error")
+
+    def __init__(self, statements):
+        self.statements = statements        # [(sql, 参数, 是否 executemany)]
+        self.done = threading.Event()
+        self.error = None
+
+
+def _connect(path, *, readonly=False, cache_mb=16, mmap_mb=256):
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, cached_statements=_STATEMENT_CACHE)
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute(f"PRAGMA cache_size=-{cache_mb * 1024}")
+    conn.execute(f"PRAGMA mmap_size={mmap_mb * 1024 * 1024}")
+    if readonly:
+        conn.execute("PRAGMA query_only=ON")
+    else:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+class WalSqliteSaver(SqliteSaver):
+    """
+    WAL 模式、读连接池、单写线程组提交的 SqliteSaver
+
+    参数:
+        path: 数据库文件路径（不支持 ":memory:"，各连接看不到同一个内存库）
+        readers: 读连接池大小
+        max_batch: 一次提交最多合并的写入数
+        serde: 序列化器（默认与 SqliteSaver 相同）
+    """
+
+    def __init__(self, path, *, readers=4, max_batch=256, serde=None):
+        if str(path) == ":memory:" or str(path).startswith("file::memory:"):
+            raise ValueError("WalSqliteSaver 需要数据库文件路径，内存数据库请使用 SqliteSaver 或 InMemorySaver")
+        if readers < 1 or max_batch < 1:
+            raise ValueError("readers / max_batch 必须大于 0")
+        super().__init__(_connect(path), serde=serde)
+        self.path = str(path)
+        self.max_batch = max_batch
+        self.stats = WriterStats()
+        self.setup()
+
+        self._readers = queue.LifoQueue()
+        self._reader_slots = threading.Semaphore(readers)
+        self._all_readers = []
+        self._readers_lock = threading.Lock()
+
+        self._jobs = queue.SimpleQueue()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="wal-saver-writer", daemon=True)
+        self._writer.start()
+
+    @classmethod
+    @contextmanager
+    def from_conn_string(cls, conn_string, **kwargs):
+        """与 SqliteSaver.from_conn_string 相同的用法，退出时关闭写线程和所有连接"""
+        saver = cls(conn_string, **kwargs)
+        try:
+            yield saver
+        finally:
+            saver.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._jobs.put(None)
+        self._writer.join()
+        with self._readers_lock:
+            for conn in self._all_readers:
+                conn.close()
+            self._all_readers.clear()
+        self.conn.close()
+
+    # ------------------------------------------------------------------
+    # 读：连接池
+    # ------------------------------------------------------------------
+    @contextmanager
+    def _reader(self):
+        self._reader_slots.acquire()
+        try:
+            try:
+                conn = self._readers.get_nowait()
+            except queue.Empty:
+                conn = _connect(self.path, readonly=True)
+                with self._readers_lock:
+                    self._all_readers.append(conn)
+            try:
+                yield conn
+            finally:
+                self._readers.put(conn)
+        finally:
+            self._reader_slots.release()
+
+    @contextmanager
+    def cursor(self, transaction=True):
+        """只读游标来自连接池；写入不走这里（见 _submit）"""
+        if transaction:
+            raise RuntimeError("WalSqliteSaver 的写入由写线程执行，请使用 put / put_writes / delete_thread")
+        with self._reader() as conn, closing(conn.cursor()) as cur:
+            yield cur
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        # 与 SqliteSaver.list 相同，但待写入（writes）的查询使用同一个读连接，而不是 self.conn
+        where, params = search_where(config, filter, before)
+        query = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata "
+                 f"FROM checkpoints {where} ORDER BY checkpoint_id DESC")
+        if limit is not None:
+            query += " LIMIT ?"
+            params = (*params, limit)
+        with self._reader() as conn, closing(conn.cursor()) as cur, closing(conn.cursor()) as wcur:
+            cur.execute(query, params)
+            for thread_id, checkpoint_ns, checkpoint_id, parent_id, type_, checkpoint, metadata in cur:
+                wcur.execute(PENDING_WRITES_SQL, (thread_id, checkpoint_ns, checkpoint_id))
+                yield CheckpointTuple(
+                    {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                      "checkpoint_id": checkpoint_id}},
+                    self.serde.loads_typed((type_, checkpoint)),
+                    cast(CheckpointMetadata, json.loads(metadata) if metadata is not None else {}),
+                    ({"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                       "checkpoint_id": parent_id}} if parent_id else None),
+                    [(task_id, channel, self.serde.loads_typed((wtype, value)))
+                     for task_id, channel, wtype, value in wcur],
+                )
+
+    # ------------------------------------------------------------------
+    # 写：单个写线程，组提交
+    # ------------------------------------------------------------------
+    def _submit(self, statements):
+        if self._closed:
+            raise RuntimeError("WalSqliteSaver 已关闭")
+        job = _WriteJob(statements)
+        self._jobs.put(job)
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+
+    def _write_loop(self):
+        stopping = False
+        while not stopping:
+            job = self._jobs.get()
+            if job is None:
+                break
+            batch = [job]
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            self._commit(batch)
+
+    def _commit(self, batch):
+        conn = self.conn
+        started = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for job in batch:
+                conn.execute("SAVEPOINT job")
+                try:
+                    for sql, params, many in job.statements:
+                        (conn.executemany if many else conn.execute)(sql, params)
+                    conn.execute("RELEASE job")
+                except Exception as e:   # 只回滚这一个写入
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    job.error = e
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for job in batch:
+                job.error = job.error or e
+        self.stats.jobs += len(batch)
+        self.stats.commits += 1
+        self.stats.failures += sum(job.error is not None for job in batch)
+        self.stats.max_batch = max(self.stats.max_batch, len(batch))
+        self.stats.commit_seconds += time.perf_counter() - started
+        for job in batch:
+            job.done.set()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        type_, serialized = self.serde.dumps_typed(checkpoint)
+        serialized_metadata = json.dumps(get_checkpoint_metadata(config, metadata), ensure_ascii=False).encode(
+            "utf-8", "ignore")
+        self._submit([(UPSERT_CHECKPOINT_SQL, (
+            str(thread_id), checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+            type_, serialized, serialized_metadata,
+        ), False)])
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                 "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        query = UPSERT_WRITES_SQL if all(w[0] in WRITES_IDX_MAP for w in writes) else INSERT_WRITES_SQL
+        configurable = config["configurable"]
+        rows = [
+            (str(configurable["thread_id"]), str(configurable["checkpoint_ns"]), str(configurable["checkpoint_id"]),
+             task_id, task_path, WRITES_IDX_MAP.get(channel, idx), channel, *self.serde.dumps_typed(value))
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        self._submit([(query, rows, True)])
+
+    def delete_thread(self, thread_id):
+        self._submit([
+            ("DELETE FROM checkpoints WHERE thread_id = ?", (str(thread_id),), False),
+            ("DELETE FROM writes WHERE thread_id = ?", (str(thread_id),), False),
+        ])
+
+    # ------------------------------------------------------------------
+    # 异步接口：在线程池中执行同步方法
+    # ------------------------------------------------------------------
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+# 测试：多线程并发写入和读取，写入被合并提交
+if __name__ == "__main__":
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    from pathlib import Path
+
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langgraph.checkpoint.base import empty_checkpoint
+    from langgraph.checkpoint.base.id import uuid6
+
+    def conversation(saver, thread_id, turns):
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+        messages = []
+        for turn in range(turns):
+            messages = messages + [HumanMessage(f"{thread_id} 第 {turn} 轮"), AIMessage(f"收到 {turn}")]
+            checkpoint = empty_checkpoint()
+            checkpoint["id"] = str(uuid6())
+            checkpoint["channel_values"] = {"messages": messages}
+            config = saver.put(config, checkpoint, {"source": "loop", "step": turn}, {})
+        return saver.get_tuple({"configurable": {"thread_id": thread_id}})
+
+    with tempfile.TemporaryDirectory() as folder:
+        with WalSqliteSaver.from_conn_string(str(Path(folder) / "wal.sqlite"), readers=4) as saver:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=16) as pool:
+                latest = list(pool.map(lambda i: conversation(saver, f"user_{i}", 20), range(16)))
+            elapsed = time.perf_counter() - started
+            print(f"16 个会话 × 20 轮写入: {elapsed:.2f}s")
+            print(f"最后一个检查点的消息数: {[len(t.checkpoint['channel_values']['messages']) for t in latest][:4]}...")
+            print(saver.stats)
+            history = list(saver.list({"configurable": {"thread_id": "user_3"}}, limit=3))
+            print(f"user_3 最近 3 个检查点: {[t.metadata['step'] for t in history]}")
@@ -19,22 +19,25 @@ LangChain 1.0 - Checkpointing (检查点持久化)
   3. invoke 后：LangGraph 自动调用 checkpointer.put(thread_id, state)
     - 将新的完整状态写入数据库
     - 数据库存储：(thread_id, timestamp, messages)
+    - 会话越长，每一步写入的完整状态越大；checkpoint_utils/delta_state.py 的
+      DeltaMessagesState 只写新增的消息 + 定期快照（见 README“性能工具”）
 """
 
-import os
-from dotenv import load_dotenv
-from langchain.chat_models import init_chat_model
-from langchain.agents import create_agent
+import asyncio
+import sys
+from pathlib import Path
 from langchain_core.tools import tool
-from langgraph.checkpoint.sqlite import SqliteSaver
 
-load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# 仓库根目录的 shared/（共享组件）
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "shared"))
+from async_runner import AsyncAgentRunner
 
-if not GROQ_API_KEY or GROQ_API_KEY == "your_groq_api_key_here_replace_this":
-    raise ValueError("请先设置 GROQ_API_KEY")
+# langgraph 和模型在第一次使用时才导入 / 创建
+from startup import get_model, lazy_import
 
-model = init_chat_model("groq:llama-3.3-70b-versatile", api_key=GROQ_API_KEY)
+create_agent = lazy_import("langchain.agents", "create_agent")
+SqliteSaver = lazy_import("langgraph.checkpoint.sqlite", "SqliteSaver")
+AsyncSqliteSaver = lazy_import("langgraph.checkpoint.sqlite.aio", "AsyncSqliteSaver")
 
 @tool
 def get_order_status(order_id: str) -> str:
@@ -65,7 +68,7 @@ def example_1_inmemory_limitation():
     from langgraph.checkpoint.memory import InMemorySaver
 
     agent = create_agent(
-        model=model,
+        model=get_model(),
         tools=[],
         checkpointer=InMemorySaver()
     )
@@ -114,7 +117,7 @@ def example_2_sqlite_saver():
 
     with SqliteSaver.from_conn_string(db_path) as checkpointer:
         agent = create_agent(
-            model=model,
+            model=get_model(),
             tools=[],
             checkpointer=checkpointer  # 使用 SQLite 持久化
         )
@@ -163,7 +166,7 @@ def example_3_verify_persistence():
 
     with SqliteSaver.from_conn_string(db_path) as checkpointer:
         agent = create_agent(
-            model=model,
+            model=get_model(),
             tools=[],
             checkpointer=checkpointer
         )
@@ -202,7 +205,7 @@ def example_4_multi_user_sessions():
 
     with SqliteSaver.from_conn_string(db_path) as checkpointer:
         agent = create_agent(
-            model=model,
+            model=get_model(),
             tools=[],
             checkpointer=checkpointer
         )
@@ -266,7 +269,7 @@ def example_5_tools_with_persistence():
 
     with SqliteSaver.from_conn_string(db_path) as checkpointer:
         agent = create_agent(
-            model=model,
+            model=get_model(),
             tools=[get_order_status],
             checkpointer=checkpointer
         )
@@ -312,7 +315,7 @@ def example_6_customer_service():
 
     with SqliteSaver.from_conn_string(db_path) as checkpointer:
         agent = create_agent(
-            model=model,
+            model=get_model(),
             tools=[get_order_status],
             system_prompt="""你是客服助手。
 特点：
@@ -406,6 +409,55 @@ SqliteSaver 创建方式：
     """)
 
 
+# ============================================================================
+# 示例 8：异步并发处理多个用户
+# ============================================================================
+def example_8_async_multi_user():
+    """
+    示例8：AsyncAgentRunner 并发处理多个用户的会话
+
+    - 不同 thread_id 并发执行，同一 thread_id 的轮次按顺序执行
+    - 全局并发上限 + 按模型提供方限速
+    - 异步运行需要 AsyncSqliteSaver（SqliteSaver 不支持 ainvoke）
+    """
+    print("\n" + "="*70)
+    print("示例 8：异步并发处理多个用户")
+    print("="*70)
+
+    db_path = "multi_user.sqlite"
+    # Groq 免费层级约 30 次/分钟：所有会话共享一个限速器
+    runner = AsyncAgentRunner(max_concurrency=8, rate_limits={"groq": 0.5})
+    limited_model = runner.limit_model(get_model())
+
+    turns = [
+        ("user_alice", "我是 Alice，我喜欢编程"),
+        ("user_bob", "我是 Bob，我喜欢设计"),
+        ("user_carol", "我是 Carol，我喜欢音乐"),
+        ("user_alice", "我喜欢什么？"),       # 在 Alice 的第一轮完成之后才执行
+        ("user_bob", "我喜欢什么？"),
+        ("user_carol", "我喜欢什么？"),
+    ]
+
+    async def run():
+        async with AsyncSqliteSaver.from_conn_string(db_path) as checkpointer:
+            runner.agent = create_agent(model=limited_model, tools=[], checkpointer=checkpointer)
+            return await runner.run_many(turns)
+
+    results = asyncio.run(run())
+    for (thread_id, message), result in zip(turns, results):
+        reply = result.output["messages"][-1].content if result.ok else f"[错误] {result.error}"
+        print(f"\n[{thread_id}] {message}")
+        print(f"  Agent: {reply}")
+        print(f"  排队 {result.queued_ms:.0f} ms，运行 {result.run_ms:.0f} ms")
+
+    print(f"\n{runner.stats}")
+
+    print(f"\n关键点：")
+    print("  - run_many 并发执行，结果按提交顺序返回")
+    print("  - 同一 thread_id 的轮次不会同时读写检查点")
+    print("  - rate_limits 按提供方共享限速器，每次模型调用前取得令牌")
+
+
 # ============================================================================
 # 主程序
 # ============================================================================
@@ -434,6 +486,9 @@ def main():
         input("\n按 Enter 继续...")
 
         example_7_sqlite_parameters()
+        input("\n按 Enter 继续...")
+
+        example_8_async_multi_user()
 
         print("\n" + "="*70)
         print(" 完成！")
@@ -1,75 +1,328 @@
 """
 简单测试：验证 SQLite 持久化功能
+
+测试 1 起不需要 API key；最后的 Agent 持久化测试需要 GROQ_API_KEY（或 CHAT_MODEL=fake:scripted）
 """
 
-import os
-from dotenv import load_dotenv
-from langchain.chat_models import init_chat_model
+import asyncio
+import atexit
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# 获取脚本所在目录
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR / "checkpoint_utils"))
+# 仓库根目录的 shared/（共享组件）
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "shared"))
+
 from langchain.agents import create_agent
 from langgraph.checkpoint.sqlite import SqliteSaver
+from startup import get_model
+from fake_chat_model import FakeChatModel
+
+TMP_DIR = Path(tempfile.mkdtemp(prefix="checkpoint_test_"))
+# 任何一个测试失败退出时也删除临时目录
+atexit.register(shutil.rmtree, TMP_DIR, ignore_errors=True)
+
+print("=" * 70)
+print("测试：检查点存储工具")
+print("=" * 70)
+
+
+# ============================================================================
+# 测试 1：WalSqliteSaver（WAL、读连接池、组提交）
+# ============================================================================
+print("\n--- 测试 1: WalSqliteSaver ---")
+
+from wal_saver import WalSqliteSaver
+
+wal_path = str(TMP_DIR / "wal.sqlite")
+with WalSqliteSaver.from_conn_string(wal_path, readers=2) as saver:
+    # 与 SqliteSaver 一样驱动 Agent：第二轮能看到第一轮的消息
+    agent = create_agent(model=FakeChatModel(), tools=[], checkpointer=saver)
+    config = {"configurable": {"thread_id": "wal_user"}}
+    agent.invoke({"messages": [{"role": "user", "content": "我叫王五"}]}, config)
+    result = agent.invoke({"messages": [{"role": "user", "content": "我叫什么？"}]}, config)
+    assert [m.content for m in result["messages"] if m.type == "human"] == ["我叫王五", "我叫什么？"]
+
+    # 多个线程并发写不同的会话：全部写入成功，写入被合并提交
+    def converse(i):
+        thread = {"configurable": {"thread_id": f"t{i}"}}
+        for turn in range(5):
+            agent.invoke({"messages": [{"role": "user", "content": f"t{i}:{turn}"}]}, thread)
+        return agent.get_state(thread).values["messages"]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        histories = list(pool.map(converse, range(8)))
+    assert all(len(h) == 10 for h in histories)
+    assert saver.stats.failures == 0 and saver.stats.commits < saver.stats.jobs
+
+    # 异步接口
+    async def async_turn():
+        return await agent.ainvoke({"messages": [{"role": "user", "content": "异步"}]}, {"configurable": {"thread_id": "async"}})
+
+    assert asyncio.run(async_turn())["messages"][-1].content == "收到: 异步"
+    saver.delete_thread("t0")
+    assert saver.get_tuple({"configurable": {"thread_id": "t0"}}) is None
+    print(f"  {saver.stats}")
+
+# 文件格式与 SqliteSaver 相同：用 SqliteSaver 打开可以读到同样的状态
+with SqliteSaver.from_conn_string(wal_path) as plain:
+    state = create_agent(model=FakeChatModel(), tools=[], checkpointer=plain).get_state(config)
+    assert len(state.values["messages"]) == 4
+
+print("[OK] WalSqliteSaver 测试通过")
+
+
+# ============================================================================
+# 测试 2：增量检查点（DeltaMessagesState）
+# ============================================================================
+print("\n--- 测试 2: 增量检查点 ---")
+
+import os
+from functools import reduce
+from typing import Annotated
+from langchain.agents import AgentState
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, RemoveMessage
+from langgraph.graph.message import add_messages
+from delta_state import DeltaMessagesState, add_messages_batch, delta_messages
+
+# 批量合并与逐个 add_messages 的结果相同（包括删除后重新添加同一 id）
+writes = [
+    [HumanMessage("a", id="1"), AIMessage("b", id="2")],
+    HumanMessage("c", id="3"),
+    [RemoveMessage(id="2")],
+    [AIMessage("b2", id="2"), HumanMessage("c2", id="3")],
+    [HumanMessage("d", id="4")],
+]
+expected = reduce(add_messages, writes, [])
+assert [(m.id, m.content) for m in add_messages_batch([], writes)] == [(m.id, m.content) for m in expected]
+assert [m.content for m in add_messages_batch(add_messages_batch([], writes[:2]), writes[2:])] == [m.content for m in expected]
+
+
+class FrequentSnapshotState(AgentState):
+    messages: Annotated[list[AnyMessage], delta_messages(snapshot_every=5)]
+
+
+def run_turns(path, thread_id, turns, state_schema=None, start=0):
+    with WalSqliteSaver.from_conn_string(path) as saver:
+        kwargs = {"state_schema": state_schema} if state_schema else {}
+        agent = create_agent(model=FakeChatModel(), tools=[], checkpointer=saver, **kwargs)
+        config = {"configurable": {"thread_id": thread_id}}
+        for i in range(start, start + turns):
+            agent.invoke({"messages": [{"role": "user", "content": f"第 {i} 条消息"}]}, config)
+        return [m.content for m in agent.get_state(config).values["messages"]]
+
+
+full_path, delta_path = str(TMP_DIR / "full.sqlite"), str(TMP_DIR / "delta.sqlite")
+full = run_turns(full_path, "long", 40)
+delta = run_turns(delta_path, "long", 40, FrequentSnapshotState)
+assert full == delta and len(delta) == 80
+assert os.path.getsize(delta_path) < os.path.getsize(full_path) / 2
+
+# 用完整状态写入的旧会话可以直接切换到增量状态继续
+continued = run_turns(full_path, "long", 3, DeltaMessagesState, start=40)
+assert continued == full + [text for i in range(40, 43) for text in (f"第 {i} 条消息", f"收到: 第 {i} 条消息")]
+print(f"  40 轮: 完整状态 {os.path.getsize(full_path) // 1024} KB，增量 {os.path.getsize(delta_path) // 1024} KB")
+print("[OK] 增量检查点测试通过")
+
+
+# ============================================================================
+# 测试 3：压缩序列化器（CompressedSerializer）
+# ============================================================================
+print("\n--- 测试 3: 压缩序列化器 ---")
 
-load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+import sqlite3
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from compressed_serde import CompressedSerializer, load_dictionary, save_dictionary, train_dictionary
 
-if not GROQ_API_KEY or GROQ_API_KEY == "your_groq_api_key_here_replace_this":
-    raise ValueError("请先设置 GROQ_API_KEY")
+# 用测试 2 写入的数据训练字典，保存后重新加载
+with sqlite3.connect(full_path) as conn:
+    samples = [row[0] for row in conn.execute("SELECT checkpoint FROM checkpoints")]
+save_dictionary(train_dictionary(samples, size=4096), TMP_DIR / "checkpoint.dict")
+serde = CompressedSerializer(dictionary=load_dictionary(TMP_DIR / "checkpoint.dict"))
+
+# 编解码还原；小数据不压缩；缺少字典时报错
+messages = [HumanMessage("你好，我想查询订单 12345"), AIMessage("您的订单已发货，预计明天送达。" * 3)]
+encoded = serde.dumps_typed(messages)
+assert encoded[0] == "msgpack+zstd" and serde.loads_typed(encoded) == messages
+assert serde.dumps_typed(None) == JsonPlusSerializer().dumps_typed(None)
+try:
+    CompressedSerializer().loads_typed(encoded)
+    raise AssertionError("缺少字典时应该报错")
+except ValueError:
+    pass
+
+# 旧数据库（未压缩）可以直接用压缩序列化器打开并继续写入，新旧数据混存
+with WalSqliteSaver.from_conn_string(full_path, serde=serde) as saver:
+    agent = create_agent(model=FakeChatModel(), tools=[], checkpointer=saver)
+    config = {"configurable": {"thread_id": "long"}}
+    before = len(agent.get_state(config).values["messages"])
+    agent.invoke({"messages": [{"role": "user", "content": "压缩后的新消息"}]}, config)
+    assert len(agent.get_state(config).values["messages"]) == before + 2
+with sqlite3.connect(full_path) as conn:
+    types = {row[0] for row in conn.execute("SELECT type FROM checkpoints")}
+assert types == {"msgpack", "msgpack+zstd"}
+print("[OK] 压缩序列化器测试通过")
+
+
+# ============================================================================
+# 测试 4：保留策略与压缩（run_retention）
+# ============================================================================
+print("\n--- 测试 4: 保留策略 ---")
+
+from datetime import timedelta
+from retention import RetentionPolicy, checkpoint_time, run_retention
+
+retention_path = str(TMP_DIR / "retention.sqlite")
+run_turns(retention_path, "plain", 20)
+run_turns(retention_path, "delta", 20, FrequentSnapshotState)
+
+
+def history(thread_id, state_schema):
+    with SqliteSaver.from_conn_string(retention_path) as saver:
+        agent = create_agent(model=FakeChatModel(), tools=[], checkpointer=saver, state_schema=state_schema)
+        return {s.config["configurable"]["checkpoint_id"]: [m.content for m in s.values.get("messages", [])]
+                for s in agent.get_state_history({"configurable": {"thread_id": thread_id}})}
+
+
+before = {"plain": history("plain", AgentState), "delta": history("delta", FrequentSnapshotState)}
+assert abs(checkpoint_time(max(before["plain"])) - time.time()) < 60
+
+# dry run 不修改数据库
+dry = run_retention(retention_path, RetentionPolicy(keep_last=4), dry_run=True)
+assert dry.checkpoints_deleted > 0 and history("plain", AgentState) == before["plain"]
+
+# 每个会话保留最近 4 个；增量会话额外保留到快照为止的祖先，保留下来的每个检查点读出的消息不变
+report = run_retention(retention_path, RetentionPolicy(keep_last=4), batch_size=16, vacuum="full")
+after = {"plain": history("plain", AgentState), "delta": history("delta", FrequentSnapshotState)}
+assert len(after["plain"]) == 4 and len(after["delta"]) == 4 + report.protected
+assert report.checkpoints_deleted == dry.checkpoints_deleted and report.batches > 1
+for thread_id in after:
+    assert all(before[thread_id][c] == messages for c, messages in after[thread_id].items())
+assert report.reclaimed_bytes > 0
+print(f"  {report}".replace("\n", "\n  "))
+
+# 增量会话清理后可以继续对话；空闲超过 TTL 的会话整个删除，之后增量回收空间
+assert len(run_turns(retention_path, "delta", 1, FrequentSnapshotState, start=20)) == 42
+idle = run_retention(retention_path, RetentionPolicy(idle_ttl=timedelta(days=30)),
+                     now=time.time() + 31 * 86400, vacuum="incremental")
+assert idle.threads_deleted == 2 and not idle.notes and history("plain", AgentState) == {}
+print("[OK] 保留策略测试通过")
+
+
+# ============================================================================
+# 测试 5：检查点查看工具（view_db.py）
+# ============================================================================
+print("\n--- 测试 5: 检查点查看工具 ---")
+
+from contextlib import closing
+import view_db
+
+with closing(view_db.connect(delta_path)) as conn:
+    saver = SqliteSaver(conn)
+    ids = [t.config["configurable"]["checkpoint_id"] for t in saver.list({"configurable": {"thread_id": "long"}})]
+
+    # 计数来自索引，字节数精确求和或抽样估算
+    exact = view_db.thread_stats(conn, exact=True)[0]
+    sampled = view_db.thread_stats(conn, exact=False, samples=50)[0]
+    assert exact.checkpoints == sampled.checkpoints == len(ids) and exact.recent == len(ids)
+    assert sampled.estimated and 0.5 < sampled.bytes / exact.bytes < 2
+
+    # 分页读取的历史与 SqliteSaver.list 相同
+    pages = list(view_db.iter_history(conn, "long", page_size=7))
+    assert [row[0] for page in pages for row in page] == ids and all(len(page) <= 7 for page in pages)
+
+    # 解码增量通道：每个检查点的消息与 Agent 读取的状态相同
+    agent = create_agent(model=FakeChatModel(), tools=[], checkpointer=saver, state_schema=FrequentSnapshotState)
+    for checkpoint_id in ids[::7]:
+        config = {"configurable": {"thread_id": "long", "checkpoint_id": checkpoint_id}}
+        _, values = view_db.load_checkpoint(conn, "long", checkpoint_id)
+        assert values.get("messages", []) == agent.get_state(config).values.get("messages", [])
+    assert view_db.find_checkpoint(conn, "long", prefix=ids[3][:20]) == ids[3]
+
+# 压缩的检查点（测试 3）用字典解码
+with closing(view_db.connect(full_path)) as conn:
+    _, values = view_db.load_checkpoint(conn, "long", view_db.find_checkpoint(conn, "long"), serde=serde)
+    assert values["messages"][-1].content == "收到: 压缩后的新消息"
+
+view_db.main([delta_path, "--stats", "--limit", "3"])
+print("[OK] 检查点查看工具测试通过")
 
-model = init_chat_model("groq:llama-3.3-70b-versatile", api_key=GROQ_API_KEY)
 
 print("=" * 70)
-print("测试：SqliteSaver 持久化功能")
+print("测试：SqliteSaver 持久化功能（需要 API key）")
 print("=" * 70)
 
-# 创建持久化 checkpointer（直接使用文件名，无需 sqlite:/// 前缀）
-db_path = "test_checkpoints.sqlite"
-
-# 使用 with 语句正确管理 SqliteSaver
-with SqliteSaver.from_conn_string(db_path) as checkpointer:  # 直接传文件名
-    # 创建 Agent
-    agent = create_agent(
-        model=model,
-        tools=[],
-        checkpointer=checkpointer
-    )
-
-    config = {"configurable": {"thread_id": "test_persistence"}}
-
-    print("\n第一轮对话：")
-    print("用户: 我叫王五")
-    response1 = agent.invoke(
-        {"messages": [{"role": "user", "content": "我叫王五"}]},
-        config=config
-    )
-    print(f"Agent: {response1['messages'][-1].content}")
-
-print("\n第二轮对话（模拟重启）：")
-print("[创建新的 agent 实例...]")
-
-# 模拟重启：创建新的 checkpointer 和 agent
-with SqliteSaver.from_conn_string(db_path) as checkpointer_new:  # 直接传文件名
-    agent_new = create_agent(
-        model=model,
-        tools=[],
-        checkpointer=checkpointer_new
-    )
-
-    print("用户: 我叫什么？")
-    response2 = agent_new.invoke(
-        {"messages": [{"role": "user", "content": "我叫什么？"}]},
-        config=config
-    )
-    print(f"Agent: {response2['messages'][-1].content}")
-
-    print("\n" + "=" * 70)
-    print("持久化状态：")
-    print(f"  数据库文件: {db_path}")
-    print(f"  thread_id: {config['configurable']['thread_id']}")
-    print(f"  总消息数: {len(response2['messages'])}")
-    print("=" * 70)
-
-    if "王五" in response2['messages'][-1].content:
-        print("\n[成功] 测试成功！Agent 记住了名字（持久化有效）。")
-    else:
-        print("\n[警告] Agent 可能没有正确记住")
+try:
+    model = get_model()
+except ValueError as e:
+    # 没有 API key：跳过（CHAT_MODEL=fake:scripted 时离线运行）
+    model = None
+    print(f"\n[SKIP] Agent 持久化测试跳过: {e}")
+
+if model is not None:
+    # 创建持久化 checkpointer（直接使用文件名，无需 sqlite:/// 前缀）
+    db_path = "test_checkpoints.sqlite"
+
+    # 使用 with 语句正确管理 SqliteSaver
+    with SqliteSaver.from_conn_string(db_path) as checkpointer:  # 直接传文件名
+        # 创建 Agent
+        agent = create_agent(
+            model=model,
+            tools=[],
+            checkpointer=checkpointer
+        )
+
+        config = {"configurable": {"thread_id": "test_persistence"}}
+
+        print("\n第一轮对话：")
+        print("用户: 我叫王五")
+        response1 = agent.invoke(
+            {"messages": [{"role": "user", "content": "我叫王五"}]},
+            config=config
+        )
+        print(f"Agent: {response1['messages'][-1].content}")
+
+    print("\n第二轮对话（模拟重启）：")
+    print("[创建新的 agent 实例...]")
+
+    # 模拟重启：创建新的 checkpointer 和 agent
+    with SqliteSaver.from_conn_string(db_path) as checkpointer_new:  # 直接传文件名
+        agent_new = create_agent(
+            model=model,
+            tools=[],
+            checkpointer=checkpointer_new
+        )
+
+        print("用户: 我叫什么？")
+        response2 = agent_new.invoke(
+            {"messages": [{"role": "user", "content": "我叫什么？"}]},
+            config=config
+        )
+        print(f"Agent: {response2['messages'][-1].content}")
+
+        print("\n" + "=" * 70)
+        print("持久化状态：")
+        print(f"  数据库文件: {db_path}")
+        print(f"  thread_id: {config['configurable']['thread_id']}")
+        print(f"  总消息数: {len(response2['messages'])}")
+        print("=" * 70)
+
+        if "王五" in response2['messages'][-1].content:
+            print("\n[成功] 测试成功！Agent 记住了名字（持久化有效）。")
+        else:
+            print("\n[警告] Agent 可能没有正确记住")
 
 print("\n测试完成！")
+print("\n已验证:")
+print("  [OK] WalSqliteSaver（WAL、读连接池、组提交、异步接口）")
+print("  [OK] 增量检查点（DeltaMessagesState，读取结果与完整状态相同，旧会话可继续）")
+print("  [OK] 压缩序列化器（zstd + 训练字典，未压缩的旧数据仍可读取）")
+print("  [OK] 保留策略（保留最近 N 个、空闲 TTL、增量会话不被截断、VACUUM 回收空间）")
+print("  [OK] 检查点查看工具（索引统计、分页历史、解码增量和压缩的检查点）")
+print(f"  [{'OK' if model is not None else 'SKIP'}] SqliteSaver 持久化（Agent 记住上一轮的内容）")
@@ -1,88 +1,376 @@
 """
-查看 SQLite 数据库内容的简单脚本
+检查点数据库查看工具
+==================
+
+查看 SqliteSaver / WalSqliteSaver 写入的检查点库，数据库路径可以任意指定（不指定时查看当前目录和本目录下 main.py 生成的数据库）：
+- 会话列表：每个会话（thread_id + checkpoint_ns）的检查点数、writes 数、字节数、最后活动时间
+- 历史：按检查点 id 分页（keyset 分页，只读取当前这一页），终端中按 Enter 翻页
+- 详情：解码一个检查点中的消息和待写入；支持 CompressedSerializer 压缩的数据（--dict 传入字典）
+  和增量通道（DeltaMessagesState：从快照重放祖先的 writes，与 Agent 读取的结果相同）
+- --stats：按字节数排序的会话、最近 --window 内每天的增长、数据库文件和空闲页
+
+只使用只读连接，可以在服务运行时查看。计数、时间范围和增长只扫描主键索引（检查点 id 是 uuid6，自带创建时间）；
+字节数在数据库小于 256MB 时精确求和，更大时按随机抽样的行估算（显示为 ≈，--exact 强制精确），
+几 GB 的数据库也能在一秒内返回。
+
+用法：
+    python view_db.py                                              # main.py 生成的数据库
+    python view_db.py checkpoints.sqlite --stats
+    python view_db.py checkpoints.sqlite --thread user_123          # 最近 20 个检查点
+    python view_db.py checkpoints.sqlite --thread user_123 --before 1f1c9dca-8342   # 从这个 id 往前翻页
+    python view_db.py checkpoints.sqlite --thread user_123 --show               # 解码最新的检查点
+    python view_db.py checkpoints.sqlite --thread user_123 --show 1f1c9dca-8342 --dict checkpoint.dict
 """
 
-import sqlite3
+import argparse
+import json
 import os
+import random
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
 
-def view_database(db_path):
-    """查看 SQLite 数据库的表和数据"""
-    if not os.path.exists(db_path):
-        print(f"❌ 数据库文件不存在：{db_path}")
-        return
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR / "checkpoint_utils"))
 
-    print(f"\n{'='*70}")
-    print(f"查看数据库：{os.path.basename(db_path)}")
-    print(f"{'='*70}")
+from retention import DELTA_COUNTERS_KEY, checkpoint_id_at, checkpoint_time, parse_duration
 
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+# 不指定路径时查看的数据库（main.py 的示例生成）
+EXAMPLE_DBS = ["checkpoints.sqlite", "multi_user.sqlite", "tools.sqlite", "customer_service.sqlite"]
+# 超过该大小时字节数改为抽样估算
+EXACT_MAX_BYTES = 256 * 2**20
+SAMPLES = 20000
 
-    # 查看所有表
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()
+_FIRST_LAST_SQL = (
+    "SELECT (SELECT MIN(checkpoint_id) FROM checkpoints WHERE thread_id = ?1 AND checkpoint_ns = ?2), "
+    "(SELECT MAX(checkpoint_id) FROM checkpoints WHERE thread_id = ?1 AND checkpoint_ns = ?2)"
+)
 
-    print(f"\n📋 数据库中的表：")
-    for table in tables:
-        print(f"  - {table[0]}")
 
-    # 查看每个表的数据
-    for table in tables:
-        table_name = table[0]
-        print(f"\n📊 表 '{table_name}' 的内容：")
+@dataclass
+class ThreadStats:
+    """一个会话（thread_id + checkpoint_ns）的统计"""
+    thread_id: str
+    checkpoint_ns: str
+    checkpoints: int
+    writes: int
+    bytes: float
+    first: float | None             # 第一个 / 最后一个检查点的创建时间（Unix 秒）
+    last: float | None
+    recent: int                     # 统计窗口内新增的检查点数
+    estimated: bool
+
+    @property
+    def name(self):
+        return f"{self.thread_id}[{self.checkpoint_ns}]" if self.checkpoint_ns else self.thread_id
+
+    def growth_per_day(self, window_days):
+        """窗口内每天新增的字节数（按该会话检查点的平均大小估算）"""
+        return self.bytes / self.checkpoints * self.recent / window_days if self.checkpoints else 0.0
+
+
+def connect(path):
+    """只读连接（不创建文件、不修改数据库）"""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"数据库文件不存在：{path}")
+    return sqlite3.connect(f"file:{Path(path).resolve().as_posix()}?mode=ro", uri=True, check_same_thread=False)
 
-        try:
-            cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-            count = cursor.fetchone()[0]
-            print(f"  记录数：{count}")
 
-            # 显示前5条记录
-            cursor.execute(f"SELECT * FROM {table_name} LIMIT 5")
-            rows = cursor.fetchall()
+def has_checkpoint_tables(conn):
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return {"checkpoints", "writes"} <= tables
 
-            if rows:
-                # 获取列名
-                cursor.execute(f"PRAGMA table_info({table_name})")
-                columns = [col[1] for col in cursor.fetchall()]
-                print(f"  列：{', '.join(columns)}")
 
-                print("\n  前5条记录：")
-                for i, row in enumerate(rows, 1):
-                    print(f"    [{i}] {row[:3]}...")  # 只显示前3个字段
-            else:
-                print("  （空表）")
+def _exact_bytes(conn, table, expr):
+    return {
+        (thread_id, ns): (total or 0, count)
+        for thread_id, ns, total, count in conn.execute(
+            f"SELECT thread_id, checkpoint_ns, SUM({expr}), COUNT(*) FROM {table} GROUP BY thread_id, checkpoint_ns")
+    }
 
-        except sqlite3.Error as e:
-            print(f"  ❌ 错误：{e}")
 
-    conn.close()
+def _sampled_bytes(conn, table, expr, samples, seed=0):
+    """按 rowid 随机抽样，返回 {会话: (抽样字节和, 抽样行数)}；行数足够少时等于精确值"""
+    low, high = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {table}").fetchone()
+    if low is None:
+        return {}
+    if high - low + 1 <= samples:
+        return _exact_bytes(conn, table, expr)
+    rowids = sorted(random.Random(seed).sample(range(low, high + 1), samples))
+    result = {}
+    for start in range(0, len(rowids), 5000):
+        chunk = rowids[start:start + 5000]
+        for thread_id, ns, size in conn.execute(
+                f"SELECT thread_id, checkpoint_ns, {expr} FROM {table} WHERE rowid IN ({','.join('?' * len(chunk))})",
+                chunk):
+            total, count = result.get((thread_id, ns), (0, 0))
+            result[(thread_id, ns)] = (total + (size or 0), count + 1)
+    return result
 
 
-def main():
-    """主函数"""
-    base_dir = "C:/Users/wangy/Desktop/temp/langchain_v1_study/phase2_practical/09_checkpointing"
+def _estimate(counts, sampled):
+    """每个会话的字节数：行数 × 该会话抽样行的平均大小（没有抽到时用全部抽样行的平均大小）"""
+    total = sum(s for s, _ in sampled.values())
+    rows = sum(n for _, n in sampled.values())
+    mean = total / rows if rows else 0.0
+    return {key: count * (sampled[key][0] / sampled[key][1] if key in sampled else mean) for key, count in counts.items()}
 
-    db_files = [
-        "checkpoints.sqlite",
-        "multi_user.sqlite",
-        "tools.sqlite",
-        "customer_service.sqlite"
+
+def thread_stats(conn, *, window_seconds=7 * 86400, exact=None, samples=SAMPLES, now=None):
+    """
+    所有会话的统计
+
+    计数、首末时间和窗口内新增数只扫描主键索引；字节数精确求和（exact=True）或抽样估算，
+    exact=None 时按数据库文件大小自动选择
+    """
+    cutoff = checkpoint_id_at((time.time() if now is None else now) - window_seconds)
+    counts = conn.execute(
+        "SELECT thread_id, checkpoint_ns, COUNT(*), COUNT(CASE WHEN checkpoint_id >= ? THEN 1 END) "
+        "FROM checkpoints GROUP BY thread_id, checkpoint_ns", (cutoff,)).fetchall()
+    # 在 GROUP BY 中求 MIN / MAX 要比较每一行；按会话在索引上各定位一次更快
+    checkpoints = {
+        (thread_id, ns): (count, *conn.execute(_FIRST_LAST_SQL, (thread_id, ns)).fetchone(), recent)
+        for thread_id, ns, count, recent in counts
+    }
+    writes = dict(
+        ((thread_id, ns), count) for thread_id, ns, count in
+        conn.execute("SELECT thread_id, checkpoint_ns, COUNT(*) FROM writes GROUP BY thread_id, checkpoint_ns")
+    )
+    if exact is None:
+        page_size, page_count = (conn.execute(f"PRAGMA {p}").fetchone()[0] for p in ("page_size", "page_count"))
+        exact = page_size * page_count <= EXACT_MAX_BYTES
+    if exact:
+        checkpoint_bytes = {k: v[0] for k, v in _exact_bytes(conn, "checkpoints", "LENGTH(checkpoint) + LENGTH(metadata)").items()}
+        write_bytes = {k: v[0] for k, v in _exact_bytes(conn, "writes", "LENGTH(value)").items()}
+    else:
+        checkpoint_bytes = _estimate({k: v[0] for k, v in checkpoints.items()},
+                                     _sampled_bytes(conn, "checkpoints", "LENGTH(checkpoint) + LENGTH(metadata)", samples))
+        write_bytes = _estimate(writes, _sampled_bytes(conn, "writes", "LENGTH(value)", samples))
+    return [
+        ThreadStats(thread_id, ns, count, writes.get((thread_id, ns), 0),
+                    checkpoint_bytes.get((thread_id, ns), 0) + write_bytes.get((thread_id, ns), 0),
+                    checkpoint_time(first), checkpoint_time(last), recent, not exact)
+        for (thread_id, ns), (count, first, last, recent) in checkpoints.items()
     ]
 
-    print("\n" + "="*70)
-    print(" SQLite 数据库查看工具")
-    print("="*70)
 
-    for db_file in db_files:
-        db_path = os.path.join(base_dir, db_file)
-        view_database(db_path)
+def iter_history(conn, thread_id, checkpoint_ns="", *, before=None, page_size=20):
+    """按检查点 id 从新到旧分页产出 [(id, 时间, step, source, 字节数, writes 数, 类型)]，只在需要下一页时查询"""
+    while True:
+        rows = conn.execute(
+            "SELECT checkpoint_id, LENGTH(checkpoint) + LENGTH(metadata), metadata, type, "
+            "(SELECT COUNT(*) FROM writes w WHERE w.thread_id = c.thread_id AND w.checkpoint_ns = c.checkpoint_ns "
+            "AND w.checkpoint_id = c.checkpoint_id) "
+            "FROM checkpoints c WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ? "
+            "ORDER BY checkpoint_id DESC LIMIT ?",
+            (thread_id, checkpoint_ns, before or "~", page_size),
+        ).fetchall()
+        if not rows:
+            return
+        page = []
+        for checkpoint_id, size, metadata, type_, writes in rows:
+            metadata = json.loads(metadata or b"{}")
+            page.append((checkpoint_id, checkpoint_time(checkpoint_id), metadata.get("step"), metadata.get("source"),
+                         size, writes, type_))
+        yield page
+        if len(rows) < page_size:
+            return
+        before = rows[-1][0]
+
+
+def find_checkpoint(conn, thread_id, checkpoint_ns="", prefix=None):
+    """按 id 前缀找检查点（用主键索引）；prefix 为 None 时返回最新的"""
+    if prefix is None:
+        row = conn.execute("SELECT MAX(checkpoint_id) FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+                           (thread_id, checkpoint_ns)).fetchone()
+    else:
+        row = conn.execute("SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                           "AND checkpoint_id >= ? ORDER BY checkpoint_id LIMIT 1",
+                           (thread_id, checkpoint_ns, prefix)).fetchone()
+    if not row or not row[0] or (prefix and not row[0].startswith(prefix)):
+        raise LookupError(f"会话 {thread_id} 中没有检查点{f' {prefix}' if prefix else ''}")
+    return row[0]
+
+
+def _snapshot_value(value):
+    """DeltaChannel 的快照（_DeltaSnapshot）取出其中的值，其他值原样返回"""
+    try:
+        from langgraph.checkpoint.serde.types import _DeltaSnapshot
+    except ImportError:  # 私有类型，langgraph 改名或移除后按普通值处理
+        return value
+    return value.value if isinstance(value, _DeltaSnapshot) else value
+
+
+def load_checkpoint(conn, thread_id, checkpoint_id, checkpoint_ns="", serde=None):
+    """
+    用 SqliteSaver 解码一个检查点，返回 (CheckpointTuple, 通道值)
+
+    增量通道（metadata 中有计数、channel_values 中没有值）按 get_delta_channel_history 取出快照和之后的 writes，
+    用 add_messages_batch 合并，与 DeltaMessagesState 读取的结果相同
+    """
+    from langgraph.checkpoint.sqlite import SqliteSaver
+    from compressed_serde import CompressedSerializer
+    from delta_state import add_messages_batch
+
+    saver = SqliteSaver(conn, serde=serde or CompressedSerializer())
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+    checkpoint = saver.get_tuple(config)
+    values = {channel: _snapshot_value(value)
+              for channel, value in (checkpoint.checkpoint.get("channel_values") or {}).items()}
+    delta = [ch for ch in (checkpoint.metadata.get(DELTA_COUNTERS_KEY) or {}) if ch not in values]
+    if delta:
+        for channel, history in saver.get_delta_channel_history(config=config, channels=delta).items():
+            seed = _snapshot_value(history.get("seed") or [])
+            values[channel] = add_messages_batch(list(seed), [value for _, _, value in history["writes"]])
+    return checkpoint, values
 
-    print("\n" + "="*70)
-    print(" 完成！")
-    print("="*70)
-    print("\n💡 提示：")
-    print("  - 如果显示'数据库文件不存在'，请先运行 main.py")
-    print("  - 可以使用在线工具查看完整内容：https://sqliteviewer.app/")
+
+# ----------------------------------------------------------------------
+# 输出
+# ----------------------------------------------------------------------
+def _time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S") if timestamp else "-"
+
+
+def _size(num, estimated=False):
+    prefix = "≈" if estimated else ""
+    for unit in ("B", "KB", "MB", "GB"):
+        if num < 1024 or unit == "GB":
+            return f"{prefix}{num:.0f}{unit}" if unit == "B" else f"{prefix}{num:.1f}{unit}"
+        num /= 1024
+
+
+def _short(text, width=80):
+    text = " ".join(str(text).split())
+    return text if len(text) <= width else text[:width - 3] + "..."
+
+
+def print_threads(path, conn, limit):
+    started = time.perf_counter()
+    stats = sorted(thread_stats(conn), key=lambda s: s.last or 0, reverse=True)
+    print(f"\n{path}：{len(stats)} 个会话，{sum(s.checkpoints for s in stats)} 个检查点"
+          f"（{time.perf_counter() - started:.2f}s）")
+    print(f"  {'会话':<28}{'检查点':>8}{'writes':>8}{'大小':>11}  最后活动")
+    for s in stats[:limit]:
+        print(f"  {_short(s.name, 27):<28}{s.checkpoints:>8}{s.writes:>8}{_size(s.bytes, s.estimated):>11}  {_time(s.last)}")
+    if len(stats) > limit:
+        print(f"  ... 还有 {len(stats) - limit} 个会话（--limit 显示更多）")
+
+
+def print_stats(path, conn, limit, window_seconds, exact):
+    started = time.perf_counter()
+    stats = sorted(thread_stats(conn, window_seconds=window_seconds, exact=exact), key=lambda s: s.bytes, reverse=True)
+    elapsed = time.perf_counter() - started
+    page_size, page_count, free_pages = (conn.execute(f"PRAGMA {p}").fetchone()[0]
+                                         for p in ("page_size", "page_count", "freelist_count"))
+    days = window_seconds / 86400
+    estimated = any(s.estimated for s in stats)
+    wal = f"{path}-wal"
+    print(f"\n{path}")
+    print(f"  文件 {_size(page_size * page_count)}（WAL {_size(os.path.getsize(wal) if os.path.exists(wal) else 0)}），"
+          f"空闲页 {_size(page_size * free_pages)}")
+    print(f"  {len(stats)} 个会话，{sum(s.checkpoints for s in stats)} 个检查点，{sum(s.writes for s in stats)} 条 writes，"
+          f"数据 {_size(sum(s.bytes for s in stats), estimated)}")
+    print(f"  最近 {days:g} 天新增 {sum(s.recent for s in stats)} 个检查点，"
+          f"约 {_size(sum(s.growth_per_day(days) for s in stats), estimated)}/天")
+    print(f"  统计耗时 {elapsed:.2f}s{'（字节数为抽样估算，--exact 精确统计）' if estimated else ''}\n")
+    print(f"  {'会话':<28}{'检查点':>8}{'writes':>8}{'大小':>11}{'平均':>10}{'增长/天':>11}  {'开始':<20}最后活动")
+    for s in stats[:limit]:
+        print(f"  {_short(s.name, 27):<28}{s.checkpoints:>8}{s.writes:>8}{_size(s.bytes, s.estimated):>11}"
+              f"{_size(s.bytes / s.checkpoints, s.estimated):>10}{_size(s.growth_per_day(days), s.estimated):>11}"
+              f"  {_time(s.first):<20}{_time(s.last)}")
+    if len(stats) > limit:
+        print(f"  ... 还有 {len(stats) - limit} 个会话（--limit 显示更多）")
+
+
+def print_history(path, conn, thread_id, checkpoint_ns, before, page_size):
+    interactive = sys.stdin.isatty()
+    print(f"\n{path} 会话 {thread_id} 的检查点（从新到旧）")
+    print(f"  {'检查点 id':<38}{'时间':<21}{'step':>5}  {'source':<8}{'大小':>10}{'writes':>8}  类型")
+    last = None
+    for page in iter_history(conn, thread_id, checkpoint_ns, before=before, page_size=page_size):
+        for checkpoint_id, created, step, source, size, writes, type_ in page:
+            print(f"  {checkpoint_id:<38}{_time(created):<21}{step if step is not None else '-':>5}  "
+                  f"{source or '-':<8}{_size(size):>10}{writes:>8}  {type_}")
+        last = page[-1][0]
+        if len(page) < page_size:
+            return
+        if not interactive or input("  Enter 下一页，q 退出: ").strip().lower() == "q":
+            break
+    if last:
+        print(f"  下一页: --before {last}")
+    else:
+        print("  （没有检查点）")
+
+
+def print_checkpoint(conn, thread_id, checkpoint_ns, prefix, serde):
+    checkpoint_id = find_checkpoint(conn, thread_id, checkpoint_ns, prefix)
+    checkpoint, values = load_checkpoint(conn, thread_id, checkpoint_id, checkpoint_ns, serde)
+    metadata = checkpoint.metadata
+    print(f"\n检查点 {checkpoint_id}（{_time(checkpoint_time(checkpoint_id))}）")
+    print(f"  step={metadata.get('step')} source={metadata.get('source')} "
+          f"parent={checkpoint.parent_config['configurable']['checkpoint_id'] if checkpoint.parent_config else '-'}")
+    messages = values.pop("messages", None)
+    for channel, value in values.items():
+        print(f"  {channel}: {_short(repr(value))}")
+    if messages is not None:
+        print(f"  messages（{len(messages)} 条）:")
+        for message in messages:
+            calls = ", ".join(f"{c['name']}({c['args']})" for c in getattr(message, "tool_calls", []) or [])
+            print(f"    [{message.type}] {_short(message.content)}{f'  -> {_short(calls, 60)}' if calls else ''}")
+    for task_id, channel, value in checkpoint.pending_writes or []:
+        print(f"  待写入 {channel}（task {task_id[:8]}）: {_short(repr(value))}")
+
+
+def inspect(path, args):
+    """按命令行参数查看一个数据库"""
+    with closing(connect(path)) as conn:
+        if not has_checkpoint_tables(conn):
+            print(f"\n{path}：没有 checkpoints / writes 表（不是检查点数据库）")
+        elif args.show is not None:
+            from compressed_serde import CompressedSerializer, load_dictionary
+            serde = CompressedSerializer(dictionaries=[load_dictionary(p) for p in args.dict])
+            print_checkpoint(conn, args.thread, args.ns, args.show or None, serde)
+        elif args.thread is not None:
+            print_history(path, conn, args.thread, args.ns, args.before, args.limit)
+        elif args.stats:
+            print_stats(path, conn, args.limit, args.window.total_seconds(), True if args.exact else None)
+        else:
+            print_threads(path, conn, args.limit)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="检查点数据库查看工具")
+    parser.add_argument("paths", nargs="*", help="数据库文件（默认当前目录和本目录下 main.py 生成的数据库）")
+    parser.add_argument("--stats", action="store_true", help="按字节数排序的会话和增长速度")
+    parser.add_argument("--thread", help="查看某个会话的检查点历史")
+    parser.add_argument("--ns", default="", help="checkpoint_ns（子图），默认空")
+    parser.add_argument("--before", help="从这个检查点 id 往前翻页")
+    parser.add_argument("--show", nargs="?", const="", metavar="ID", help="解码检查点（id 或前缀，省略时为最新）")
+    parser.add_argument("--dict", action="append", default=[], help="CompressedSerializer 的压缩字典文件，可重复")
+    parser.add_argument("--limit", type=int, default=20, help="每页 / 列表显示的行数")
+    parser.add_argument("--window", type=parse_duration, default="7d", help="--stats 统计增长的时间窗口，例如 1d、7d")
+    parser.add_argument("--exact", action="store_true", help="--stats 精确统计字节数（大数据库较慢）")
+    args = parser.parse_args(argv)
+
+    # main.py 把数据库写在运行时的当前目录
+    folders = dict.fromkeys([Path.cwd().resolve(), SCRIPT_DIR.resolve()])
+    paths = args.paths or [str(folder / name) for folder in folders for name in EXAMPLE_DBS if (folder / name).exists()]
+    if not paths:
+        print("当前目录和本目录下都还没有数据库，请先运行 main.py，或指定数据库路径")
+        return
+    if args.thread is None and (args.show is not None or args.before):
+        parser.error("--show / --before 需要同时指定 --thread")
+
+    for path in paths:
+        try:
+            inspect(path, args)
+        except (FileNotFoundError, LookupError) as e:
+            print(f"\n[错误] {e}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,125 @@
+"""
+基准测试：FaissVectorStore 的 flat / IVF / HNSW 索引
+===================================================
+
+用合成的聚类向量（与句向量一样成簇分布）对比三种索引的建库时间、
+查询吞吐（QPS）和 recall@k（以 flat 精确搜索的结果为准），
+并测量保存后以 mmap 方式加载的耗时。
+
+运行：
+    python bench_faiss.py                         # 默认 10 万向量，384 维
+    python bench_faiss.py --vectors 20000 --queries 200
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR / "rag_utils"))
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from faiss_store import FaissVectorStore
+
+# (名称, 构造参数, 查询参数)
+CONFIGS = [
+    ("flat", {"index_type": "flat"}, {}),
+    ("ivf nprobe=1", {"index_type": "ivf"}, {"nprobe": 1}),
+    ("ivf nprobe=8", {"index_type": "ivf"}, {"nprobe": 8}),
+    ("ivf nprobe=32", {"index_type": "ivf"}, {"nprobe": 32}),
+    ("hnsw ef=16", {"index_type": "hnsw"}, {"ef_search": 16}),
+    ("hnsw ef=64", {"index_type": "hnsw"}, {"ef_search": 64}),
+    ("hnsw ef=256", {"index_type": "hnsw"}, {"ef_search": 256}),
+]
+
+
+def make_vectors(num_vectors, num_queries, dimension, seed):
+    """生成成簇的向量和查询（查询是随机选取的向量加噪声）"""
+    rng = np.random.default_rng(seed)
+    num_clusters = max(1, num_vectors // 100)
+    centers = rng.normal(size=(num_clusters, dimension))
+    labels = rng.integers(0, num_clusters, num_vectors)
+    vectors = (centers[labels] + 0.5 * rng.normal(size=(num_vectors, dimension))).astype(np.float32)
+    picks = rng.choice(num_vectors, num_queries, replace=False)
+    queries = (vectors[picks] + 0.3 * rng.normal(size=(num_queries, dimension))).astype(np.float32)
+    return vectors, queries
+
+
+def recall_at_k(rows, truth):
+    k = truth.shape[1]
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(rows, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAISS 索引基准测试")
+    parser.add_argument("--vectors", type=int, default=100_000, help="向量数")
+    parser.add_argument("--dim", type=int, default=384, help="维度（all-MiniLM-L6-v2 为 384）")
+    parser.add_argument("--queries", type=int, default=1000, help="查询数")
+    parser.add_argument("--k", type=int, default=10, help="top-k")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF 聚类数（默认 4*sqrt(向量数)）")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    nlist = args.nlist or int(4 * np.sqrt(args.vectors))
+
+    print("=" * 70)
+    print(f"FAISS 基准测试：{args.vectors} 向量 x {args.dim} 维，{args.queries} 个查询，k={args.k}，nlist={nlist}")
+    print("=" * 70)
+
+    vectors, queries = make_vectors(args.vectors, args.queries, args.dim, args.seed)
+    pairs = [(str(i), v) for i, v in enumerate(vectors)]
+    ids = [str(i) for i in range(len(vectors))]
+    embedding = DeterministicFakeEmbedding(size=args.dim)
+
+    stores, build_times = {}, {}
+    truth = None
+    print(f"\n{'索引':<15}{'建库(s)':>9}{'批量 QPS':>11}{'单条 QPS':>11}{'recall@k':>10}")
+    for name, build_params, search_params in CONFIGS:
+        index_type = build_params["index_type"]
+        if index_type not in stores:
+            store = FaissVectorStore(embedding, nlist=nlist, **build_params)
+            start = time.perf_counter()
+            store.add_embeddings(pairs, ids=ids)
+            store.train()
+            build_times[index_type] = time.perf_counter() - start
+            stores[index_type] = store
+        store = stores[index_type]
+        for key, value in search_params.items():
+            setattr(store, key, value)
+
+        start = time.perf_counter()
+        _, rows = store.search_matrix(queries, args.k)
+        batch_qps = len(queries) / (time.perf_counter() - start)
+
+        single = queries[:min(len(queries), 200)]
+        start = time.perf_counter()
+        for query in single:
+            store.search_matrix(query, args.k)
+        single_qps = len(single) / (time.perf_counter() - start)
+
+        if truth is None:
+            truth = rows
+        print(f"{name:<15}{build_times[index_type]:>9.2f}{batch_qps:>11.0f}{single_qps:>11.0f}"
+              f"{recall_at_k(rows, truth):>10.3f}")
+
+    # 保存并以 mmap 加载：加载时间与向量数据量基本无关
+    print(f"\n保存 / 加载:")
+    with tempfile.TemporaryDirectory() as tmp:
+        for index_type, store in stores.items():
+            folder = Path(tmp) / index_type
+            store.save(folder)
+            size_mb = (folder / "index.faiss").stat().st_size / 1e6
+            for mmap in (False, True):
+                start = time.perf_counter()
+                loaded = FaissVectorStore.load(folder, embedding, mmap=mmap)
+                elapsed = time.perf_counter() - start
+                _, rows = loaded.search_matrix(queries[:10], args.k)
+                label = "mmap" if mmap else "读入内存"
+                print(f"  {index_type:<5} {size_mb:7.1f} MB  {label:<5} 加载 {elapsed:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
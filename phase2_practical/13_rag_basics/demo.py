@@ -6,20 +6,30 @@ LangChain 1.0 - RAG Basics 演示（非交互式）
 """
 
 import os
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 from langchain.chat_models import init_chat_model
 from langchain_community.document_loaders import TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_pinecone import PineconeVectorStore
 from langchain_core.tools import tool
 from pinecone import Pinecone, ServerlessSpec
-import time
 
 # 获取脚本所在目录
 SCRIPT_DIR = Path(__file__).parent
 DATA_DIR = SCRIPT_DIR / "data"
+EMBEDDING_CACHE_DIR = SCRIPT_DIR / "embedding_cache"
+
+# 添加 rag_utils 目录到路径
+sys.path.insert(0, str(SCRIPT_DIR / "rag_utils"))
+
+from embedding_cache import build_cached_embeddings
+from ingest_pipeline import IngestPipeline, vector_upserter
+from faiss_store import FaissVectorStore
+from index_lifecycle import IndexManager
+from query_cache import RetrievalCache
+from context_packer import pack_context
 
 # 确保 data 目录存在
 DATA_DIR.mkdir(exist_ok=True)
@@ -33,7 +43,7 @@ if not GROQ_API_KEY or GROQ_API_KEY == "your_groq_api_key_here_replace_this":
 
 if not PINECONE_API_KEY or PINECONE_API_KEY == "your_pinecone_api_key_here":
     print("\n[警告] 未设置 PINECONE_API_KEY")
-    print("Pinecone 相关示例将被跳过\n")
+    print("将使用本地 FAISS 索引代替 Pinecone\n")
     PINECONE_API_KEY = None
 
 model = init_chat_model("groq:llama-3.3-70b-versatile", api_key=GROQ_API_KEY)
@@ -69,20 +79,20 @@ RAG (Retrieval-Augmented Generation) 是 LangChain 的核心应用场景之一
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=200,
         chunk_overlap=50,
-        separators=["\n\n", "\n", "。", "！", "？", " ", ""]
+        separators=["\n\n", "\n", "。", "！", "？", " ", ""],
+        add_start_index=True,       # 记录块在原文中的位置，供 pack_context 去重
     )
     chunks = splitter.split_documents(documents)
     print(f"  [OK] 分割为 {len(chunks)} 个块")
 
     # 示例 3: 向量嵌入
     print("\n[3/6] 向量嵌入 (首次运行会下载模型)...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
+    embeddings = build_cached_embeddings(EMBEDDING_CACHE_DIR)
     vector = embeddings.embed_query("LangChain 是什么")
     print(f"  [OK] 向量维度: {len(vector)}")
 
-    # 示例 4-6: Pinecone 相关
+    # 示例 4-5: 向量存储（有 PINECONE_API_KEY 时用 Pinecone，否则用本地 FAISS）
+    vectorstore = None
     if PINECONE_API_KEY:
         print("\n[4/6] Pinecone 设置...")
         try:
@@ -90,58 +100,56 @@ RAG (Retrieval-Augmented Generation) 是 LangChain 的核心应用场景之一
             index_name = "langchain-rag-demo"
             dimension = 384
 
-            existing_indexes = [idx.name for idx in pc.list_indexes()]
-            if index_name in existing_indexes:
-                print(f"  [OK] 索引已存在")
-                index = pc.Index(index_name)
-            else:
-                print(f"  创建新索引...")
-                pc.create_index(
-                    name=index_name,
-                    dimension=dimension,
-                    metric="cosine",
-                    spec=ServerlessSpec(cloud="aws", region="us-east-1")
-                )
-                time.sleep(10)
-                index = pc.Index(index_name)
-                print(f"  [OK] 索引创建完成")
-
-            print("\n[5/6] 文档索引...")
-            vectorstore = PineconeVectorStore.from_documents(
-                documents=chunks,
-                embedding=embeddings,
-                index_name=index_name
+            readiness = IndexManager(pc).ensure_index(
+                index_name,
+                dimension=dimension,
+                metric="cosine",
+                spec=ServerlessSpec(cloud="aws", region="us-east-1")
             )
-            print(f"  [OK] {len(chunks)} 个文档块已索引")
-
-            print("\n[6/6] RAG 问答...")
-            @tool
-            def search_knowledge_base(query: str) -> str:
-                """在知识库中搜索相关信息"""
-                docs = vectorstore.similarity_search(query, k=2)
-                return "\n\n".join([doc.page_content for doc in docs])
-
-            from langchain.agents import create_agent
-            agent = create_agent(
-                model=model,
-                tools=[search_knowledge_base],
-                system_prompt="你是一个助手，可以访问知识库。使用 search_knowledge_base 工具搜索相关信息，然后回答问题。"
-            )
-
-            question = "LangChain 有哪些核心组件？"
-            print(f"\n  问题: {question}")
-            try:
-                response = agent.invoke({"messages": [{"role": "user", "content": question}]})
-                print(f"  回答: {response['messages'][-1].content}")
-                print(f"\n  [OK] RAG 问答完成")
-            except Exception as e:
-                print(f"  [错误] RAG 问答失败（Groq 工具调用问题）")
-                print(f"  提示: 这是 Groq 处理中文工具调用的偶发问题，不影响其他功能")
+            print(f"  [OK] {readiness}")
 
+            print("\n[5/6] 文档索引...")
+            vectorstore = PineconeVectorStore(index_name=index_name, embedding=embeddings)
+            report = IngestPipeline(embeddings, vector_upserter(vectorstore), embed_batch_size=32).run(chunks)
+            print(f"  [OK] {len(chunks)} 个文档块已索引（{report.chunks / max(report.wall_seconds, 1e-9):.1f} 块/秒）")
         except Exception as e:
             print(f"  [错误] Pinecone 操作失败: {e}")
+            vectorstore = None
     else:
-        print("\n[4-6] 跳过 Pinecone 相关示例（未设置 API key）")
+        print("\n[4/6] 未设置 PINECONE_API_KEY，使用本地 FAISS 索引")
+        print("\n[5/6] 文档索引...")
+        vectorstore = FaissVectorStore(embeddings, index_type="hnsw")
+        report = IngestPipeline(embeddings, vector_upserter(vectorstore), embed_batch_size=32).run(chunks)
+        print(f"  [OK] {len(chunks)} 个文档块已索引到 FAISS（{report.chunks / max(report.wall_seconds, 1e-9):.1f} 块/秒）")
+
+    # 示例 6: RAG 问答
+    if vectorstore is not None:
+        print("\n[6/6] RAG 问答...")
+        cache = RetrievalCache(embeddings)
+
+        @tool
+        def search_knowledge_base(query: str) -> str:
+            """在知识库中搜索相关信息"""
+            docs = cache.get_or_search(query, lambda q: vectorstore.similarity_search(q, k=4))
+            return pack_context(docs, token_budget=300).text
+
+        from langchain.agents import create_agent
+        agent = create_agent(
+            model=model,
+            tools=[search_knowledge_base],
+            system_prompt="你是一个助手，可以访问知识库。使用 search_knowledge_base 工具搜索相关信息，然后回答问题。"
+        )
+
+        question = "LangChain 有哪些核心组件？"
+        print(f"\n  问题: {question}")
+        try:
+            response = agent.invoke({"messages": [{"role": "user", "content": question}]})
+            print(f"  回答: {response['messages'][-1].content}")
+            print(f"\n  [OK] RAG 问答完成")
+        except Exception as e:
+            print(f"  [错误] RAG 问答失败（Groq 工具调用问题）")
+            print(f"  提示: 这是 Groq 处理中文工具调用的偶发问题，不影响其他功能")
+        print(f"  检索缓存: {cache.stats}")
 
     print("\n" + "=" * 70)
     print(" 演示完成！")
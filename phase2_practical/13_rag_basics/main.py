@@ -12,40 +12,55 @@ LangChain 1.0 - RAG Basics (RAG 基础)
 """
 
 import os
+import sys
 from pathlib import Path
-from dotenv import load_dotenv
-from langchain.chat_models import init_chat_model
-from langchain_community.document_loaders import TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_pinecone import PineconeVectorStore
 from langchain_core.tools import tool
-from pinecone import Pinecone, ServerlessSpec
-import time
 
 # 获取脚本所在目录
 SCRIPT_DIR = Path(__file__).parent
 DATA_DIR = SCRIPT_DIR / "data"
+EMBEDDING_CACHE_DIR = SCRIPT_DIR / "embedding_cache"
+INGEST_STATE_DIR = SCRIPT_DIR / "ingest_state"
+FAISS_INDEX_DIR = SCRIPT_DIR / "faiss_index"
+
+# 添加 rag_utils 目录到路径
+sys.path.insert(0, str(SCRIPT_DIR / "rag_utils"))
+# 仓库根目录的 shared/（共享组件）
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "shared"))
+
+# 重量级依赖和模型在第一次使用时才导入 / 创建；没有安装 Pinecone 时仍可使用本地 FAISS
+from startup import get_model, lazy_import, load_env
+
+TextLoader = lazy_import("langchain_community.document_loaders", "TextLoader")
+RecursiveCharacterTextSplitter = lazy_import("langchain_text_splitters", "RecursiveCharacterTextSplitter")
+PineconeVectorStore = lazy_import("langchain_pinecone", "PineconeVectorStore")
+Pinecone, ServerlessSpec = lazy_import("pinecone", "Pinecone", "ServerlessSpec")
+create_agent = lazy_import("langchain.agents", "create_agent")
+
+from embedding_cache import build_cached_embeddings
+from ingest_pipeline import IngestPipeline, vector_upserter
+from streaming_loader import stream_split_files
+from directory_ingest import DirectoryIngestor
+from faiss_store import FaissVectorStore
+from index_lifecycle import IndexManager
+from query_cache import RetrievalCache
+from context_packer import pack_context
+from similarity import SimilarityMatrix
+from near_dedup import NearDuplicateFilter
 
 # 确保 data 目录存在
 DATA_DIR.mkdir(exist_ok=True)
 
-load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+load_env()
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 
-if not GROQ_API_KEY or GROQ_API_KEY == "your_groq_api_key_here_replace_this":
-    raise ValueError("请先设置 GROQ_API_KEY")
-
 if not PINECONE_API_KEY or PINECONE_API_KEY == "your_pinecone_api_key_here":
     print("\n[警告] 未设置 PINECONE_API_KEY")
     print("如需运行 Pinecone 相关示例，请：")
     print("1. 访问 https://www.pinecone.io/ 注册免费账号")
     print("2. 获取 API Key")
     print("3. 在 .env 文件中设置 PINECONE_API_KEY=你的key")
-    print("\n当前将跳过需要 Pinecone 的示例\n")
-
-model = init_chat_model("groq:llama-3.3-70b-versatile", api_key=GROQ_API_KEY)
+    print("\n当前将使用本地 FAISS 索引代替 Pinecone\n")
 
 
 # ============================================================================
@@ -98,12 +113,23 @@ RAG (Retrieval-Augmented Generation) 是 LangChain 的核心应用场景之一
     print(f"    元数据: {documents[0].metadata}")
     print(f"    内容预览: {documents[0].page_content[:100]}...")
 
+    # 加载整个目录：按扩展名解析 txt/md/html/pdf/docx/xlsx，多进程并行
+    # （这里只列出文档、不写入向量库，所以不用清单；增量导入见 rag_utils/directory_ingest.py）
+    ingestor = DirectoryIngestor(DATA_DIR)
+    directory_docs = list(ingestor.iter_documents())
+    print(f"\n目录导入 ({DATA_DIR.name}/):")
+    print(f"  {ingestor.report}")
+    for doc in directory_docs:
+        print(f"    {Path(doc.metadata['source']).name}: {len(doc.page_content)} 字符")
+
     print("\n关键点:")
     print("  - TextLoader 加载文本文件")
     print("  - 返回 Document 对象列表")
     print("  - Document 包含 page_content 和 metadata")
+    print("  - 大文件用 lazy_load() 逐个生成，避免一次性读入内存")
+    print("  - DirectoryIngestor 多进程解析整个目录；配合清单和入库流水线，未变化的文件不重复解析")
     print("\n其他常用 Loaders:")
-    print("  - PyPDFLoader - 加载 PDF")
+    print("  - PyPDFLoader - 加载 PDF（目录导入已内置 PDF/Word/Excel 解析）")
     print("  - WebBaseLoader - 爬取网页")
     print("  - CSVLoader - 加载 CSV")
 
@@ -136,8 +162,10 @@ def example_2_text_splitters(documents):
     print(f"  chunk_overlap: 50 字符（防止信息被截断）")
     print(f"  分割优先级: 段落 -> 行 -> 句子 -> 空格 -> 字符")
 
-    # 分割文档
-    chunks = splitter.split_documents(documents)
+    # 分割文档：按窗口流式读取源文件，逐块生成
+    # （split_documents 需要整篇文档已在内存中，并一次性生成全部块）
+    sources = [doc.metadata["source"] for doc in documents]
+    chunks = list(stream_split_files(sources, splitter))
 
     print(f"\n分割结果:")
     print(f"  原文档数: {len(documents)}")
@@ -147,6 +175,7 @@ def example_2_text_splitters(documents):
     for i, chunk in enumerate(chunks[:3], 1):
         print(f"\n  块 {i}:")
         print(f"    长度: {len(chunk.page_content)} 字符")
+        print(f"    字节范围: {chunk.metadata['byte_start']}-{chunk.metadata['byte_end']}")
         print(f"    内容: {chunk.page_content[:80]}...")
 
     print("\n关键点:")
@@ -154,6 +183,7 @@ def example_2_text_splitters(documents):
     print("  - chunk_overlap 防止信息被截断")
     print("  - separators 定义分割优先级")
     print("  - RecursiveCharacterTextSplitter 智能分割")
+    print("  - stream_split_files 流式分割，结果与 split_documents 相同，内存占用与文件大小无关")
 
     return chunks
 
@@ -176,10 +206,8 @@ def example_3_embeddings():
     print("  维度: 384")
     print("  特点: 小巧、快速、免费")
 
-    # 创建嵌入模型（使用免费的 HuggingFace 模型）
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
+    # 创建嵌入模型（使用免费的 HuggingFace 模型，外加磁盘缓存）
+    embeddings = build_cached_embeddings(EMBEDDING_CACHE_DIR)
 
     # 嵌入单个文本
     text = "LangChain 是一个 LLM 应用框架"
@@ -203,25 +231,30 @@ def example_3_embeddings():
     print(f"  向量数: {len(vectors)}")
     print(f"  每个向量维度: {len(vectors[0])}")
 
-    # 计算相似度（简单示例）
-    import numpy as np
-
-    def cosine_similarity(v1, v2):
-        return np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2))
-
-    sim_01 = cosine_similarity(vectors[0], vectors[1])
-    sim_02 = cosine_similarity(vectors[0], vectors[2])
+    # 计算相似度：向量预先归一化成矩阵，两两之间的余弦相似度是一次矩阵乘法
+    similarity = SimilarityMatrix(vectors).all_pairs()
+    sim_01 = similarity[0, 1]
+    sim_02 = similarity[0, 2]
 
     print(f"\n相似度计算:")
     print(f"  '{texts[0]}' vs '{texts[1]}': {sim_01:.4f}")
     print(f"  '{texts[0]}' vs '{texts[2]}': {sim_02:.4f}")
     print(f"  -> 相同主题的文本相似度更高")
 
+    # 嵌入缓存：相同文本再次嵌入时直接读缓存
+    embeddings.embed_documents(texts)
+    stats = embeddings.stats()
+    print(f"\n嵌入缓存:")
+    print(f"  命中: {stats['hits']}  未命中: {stats['misses']}  命中率: {stats['hit_rate']:.0%}")
+    print(f"  缓存目录: {EMBEDDING_CACHE_DIR}")
+
     print("\n关键点:")
     print("  - embed_query() - 嵌入单个查询")
     print("  - embed_documents() - 批量嵌入文档")
     print("  - 使用免费的 HuggingFace 模型（无需 API key）")
     print("  - 向量可用于相似度搜索")
+    print("  - SimilarityMatrix 预归一化 + 矩阵乘法计算余弦相似度，支持 float16/int8 存储和分块 top-k")
+    print("  - CachedEmbeddings 按内容哈希缓存，重复运行不再调用模型")
 
     return embeddings
 
@@ -229,19 +262,19 @@ def example_3_embeddings():
 # ============================================================================
 # 示例 4：Pinecone 向量存储 - 创建索引
 # ============================================================================
-def example_4_pinecone_setup():
+def example_4_pinecone_setup(embeddings):
     """
     示例4：Pinecone 设置
 
-    创建 Pinecone serverless 索引（免费层级）
+    创建 Pinecone serverless 索引（免费层级），复用示例 3 的 embeddings
     """
     print("\n" + "="*70)
     print("示例 4：Pinecone 向量存储 - 创建索引")
     print("="*70)
 
     if not PINECONE_API_KEY or PINECONE_API_KEY == "your_pinecone_api_key_here":
-        print("\n[警告] 跳过：需要设置 PINECONE_API_KEY")
-        return None, None
+        print("\n[提示] 未设置 PINECONE_API_KEY，示例 5、6 使用本地 FAISS 索引（无需创建云端索引）")
+        return None, embeddings
 
     # 初始化 Pinecone
     pc = Pinecone(api_key=PINECONE_API_KEY)
@@ -256,29 +289,20 @@ def example_4_pinecone_setup():
     print(f"  类型: Serverless (免费层级)")
     print(f"  区域: us-east-1 (AWS)")
 
-    # 检查索引是否存在
-    existing_indexes = [idx.name for idx in pc.list_indexes()]
-
-    if index_name in existing_indexes:
-        print(f"\n[OK] 索引已存在，直接使用")
-        index = pc.Index(index_name)
-    else:
-        print(f"\n创建新索引...")
-        pc.create_index(
-            name=index_name,
-            dimension=dimension,
-            metric="cosine",  # 相似度度量
-            spec=ServerlessSpec(
-                cloud="aws",
-                region="us-east-1"  # 免费层级可用区域
-            )
+    # 不存在时创建，然后轮询直到就绪（间隔指数增长，最多等 120 秒）
+    manager = IndexManager(pc)
+    print(f"\n检查索引（不存在时创建并等待就绪）...")
+    readiness = manager.ensure_index(
+        index_name,
+        dimension=dimension,
+        metric="cosine",  # 相似度度量
+        spec=ServerlessSpec(
+            cloud="aws",
+            region="us-east-1"  # 免费层级可用区域
         )
-
-        # 等待索引就绪
-        print("等待索引初始化...")
-        time.sleep(10)
-        index = pc.Index(index_name)
-        print("[OK] 索引创建完成")
+    )
+    index = pc.Index(index_name, host=readiness.host)
+    print(f"[OK] {readiness}")
 
     # 获取索引统计
     stats = index.describe_index_stats()
@@ -291,11 +315,7 @@ def example_4_pinecone_setup():
     print("  - dimension 必须与 embedding 模型匹配")
     print("  - metric='cosine' 用于相似度计算")
     print("  - ServerlessSpec 配置云和区域")
-
-    # 创建 embeddings
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
+    print("  - IndexManager 轮询就绪状态，代替固定的 time.sleep()")
 
     return index_name, embeddings
 
@@ -307,27 +327,56 @@ def example_5_index_documents(index_name, embeddings, chunks):
     """
     示例5：文档索引
 
-    将分割后的文档存入 Pinecone
+    将分割后的文档存入 Pinecone（未配置时存入本地 FAISS 索引）
     """
     print("\n" + "="*70)
     print("示例 5：文档索引 - 存入向量数据库")
     print("="*70)
 
-    if not index_name or not embeddings:
-        print("\n[警告] 跳过：需要 Pinecone 配置")
+    if not embeddings:
+        print("\n[警告] 跳过：需要 embeddings")
         return None
 
+    if not index_name and (FAISS_INDEX_DIR / "index.faiss").exists():
+        # 之前运行时已保存：以 mmap 只读方式加载，不再重新嵌入（文档变化后删除该目录重建）
+        vectorstore = FaissVectorStore.load(FAISS_INDEX_DIR, embeddings)
+        print(f"\n[OK] 加载已有的本地 FAISS 索引（{FAISS_INDEX_DIR.name}/），跳过嵌入")
+        return _search_example(vectorstore)
+
     print(f"\n准备索引 {len(chunks)} 个文档块...")
 
-    # 使用 PineconeVectorStore.from_documents()
-    vectorstore = PineconeVectorStore.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        index_name=index_name
+    # 近似重复块不入库（MinHash + LSH，估计 Jaccard 相似度 >= 0.8）
+    dedup = NearDuplicateFilter(threshold=0.8)
+    chunks = list(dedup.filter(chunks))
+    print(dedup.report)
+
+    # 入库流水线：显式的嵌入批次大小，嵌入和上传通过有界队列重叠执行
+    # （PineconeVectorStore.from_documents 需要一次拿到全部文档块）
+    if index_name:
+        vectorstore = PineconeVectorStore(index_name=index_name, embedding=embeddings)
+    else:
+        vectorstore = FaissVectorStore(embeddings, index_type="hnsw")
+    pipeline = IngestPipeline(
+        embeddings,
+        vector_upserter(vectorstore),
+        embed_batch_size=32,
+        embed_workers=2,
     )
+    report = pipeline.run(chunks)
+
+    if index_name:
+        print(f"[OK] 文档已索引到 Pinecone")
+    else:
+        # 保存到磁盘，再以 mmap 只读方式加载（下次运行本示例时直接加载，无需重新嵌入）
+        vectorstore.save(FAISS_INDEX_DIR)
+        vectorstore = FaissVectorStore.load(FAISS_INDEX_DIR, embeddings)
+        print(f"[OK] 文档已索引到本地 FAISS（{FAISS_INDEX_DIR.name}/，HNSW 索引）")
+    print(report)
+    return _search_example(vectorstore)
 
-    print(f"[OK] 文档已索引到 Pinecone")
 
+def _search_example(vectorstore):
+    """示例 5 的检索演示"""
     # 测试检索
     query = "LangChain 的核心组件是什么？"
     print(f"\n测试检索:")
@@ -342,7 +391,9 @@ def example_5_index_documents(index_name, embeddings, chunks):
         print()
 
     print("关键点:")
-    print("  - from_documents() 自动嵌入并存储")
+    print("  - IngestPipeline 分批嵌入并写入（也可用 from_documents() 一步完成）")
+    print("  - NearDuplicateFilter 入库前去掉近似重复的块")
+    print("  - FaissVectorStore 与 PineconeVectorStore 接口相同，可在本地替代")
     print("  - similarity_search() 检索相似文档")
     print("  - k=2 返回最相关的 2 个结果")
 
@@ -362,22 +413,26 @@ def example_6_rag_qa(vectorstore):
     print("示例 6：RAG 问答 - 使用检索工具")
     print("="*70)
 
-    if not vectorstore:
-        print("\n[警告] 跳过：需要 Pinecone vectorstore")
+    if vectorstore is None:
+        print("\n[警告] 跳过：需要 vectorstore")
         return
 
-    # 创建检索工具
+    # 检索结果缓存：重复或换个说法的查询直接复用结果
+    cache = RetrievalCache(vectorstore.embeddings, ttl_seconds=600)
+    packed_runs = []
+
+    # 创建检索工具：多取几个候选，去掉重叠后按 token 预算组装
     @tool
     def search_knowledge_base(query: str) -> str:
         """在知识库中搜索相关信息"""
-        docs = vectorstore.similarity_search(query, k=3)
-        return "\n\n".join([doc.page_content for doc in docs])
+        docs = cache.get_or_search(query, lambda q: vectorstore.similarity_search(q, k=6))
+        packed = pack_context(docs, token_budget=400)
+        packed_runs.append(packed)
+        return packed.text
 
     # 创建 Agent
-    from langchain.agents import create_agent
-
     agent = create_agent(
-        model=model,
+        model=get_model(),
         tools=[search_knowledge_base],
         system_prompt="""你是一个助手，可以访问知识库。
 当用户提问时：
@@ -404,11 +459,19 @@ def example_6_rag_qa(vectorstore):
             print("解决方案: 1) 重试 2) 使用英文提问 3) 换用其他模型")
         print("-" * 70)
 
+    print(f"\n检索缓存: {cache.stats}")
+    if packed_runs:
+        sent = sum(p.tokens for p in packed_runs)
+        naive = sum(p.naive_tokens for p in packed_runs)
+        print(f"上下文打包: {len(packed_runs)} 次工具调用共 {sent} tokens（直接拼接 {naive} tokens）")
+
     print("\n关键点:")
     print("  - 将 vectorstore 封装为工具")
     print("  - Agent 自动调用工具检索")
     print("  - 基于检索结果生成答案")
     print("  - 这就是 RAG (检索增强生成)")
+    print("  - RetrievalCache 缓存检索结果（精确匹配 + 语义相似），重新索引后 invalidate()")
+    print("  - pack_context 去掉块之间的重叠、合并相邻块，按 token 预算组装工具输出")
 
 
 # ============================================================================
@@ -432,8 +495,8 @@ def main():
         embeddings = example_3_embeddings()
         input("\n按 Enter 继续...")
 
-        # 4. Pinecone 设置
-        index_name, embeddings = example_4_pinecone_setup()
+        # 4. Pinecone 设置（未配置时使用本地 FAISS）
+        index_name, embeddings = example_4_pinecone_setup(embeddings)
         input("\n按 Enter 继续...")
 
         # 5. 文档索引
@@ -450,7 +513,7 @@ def main():
         print("  1. Document Loaders - 加载文档")
         print("  2. Text Splitters - 分割文本")
         print("  3. Embeddings - 向量嵌入")
-        print("  4. Vector Stores - 向量存储（Pinecone）")
+        print("  4. Vector Stores - 向量存储（Pinecone / FAISS）")
         print("  5. Similarity Search - 相似度检索")
         print("  6. RAG - 检索增强生成")
         print("\nRAG 工作流:")
@@ -0,0 +1,192 @@
+"""
+上下文打包：按 token 预算组装检索结果
+====================================
+
+检索工具原来直接把前 k 个文档块的 page_content 拼在一起：
+- 相邻块有 chunk_overlap 个字符重叠，重叠部分发送了两遍
+- 块的长短不一，k 个长块可能撑爆提示词
+
+pack_context 按 token 预算组装工具输出：
+- 利用 metadata 中的 source + start_index（splitter 的 add_start_index=True）
+  计算每个块在原文中的区间，重叠部分只保留一份
+- 同一来源中重叠或首尾相接的块合并成一段连续原文
+- 按分数从高到低贪心加入：加入后总 token 数不超过预算才保留，否则跳过该块继续尝试后面的块
+- 预算连一个块都放不下时，截取分数最高的块
+- 没有偏移信息的块按完整文本去重
+
+分数默认取 metadata["rerank_score"]（经过重排序时），否则按检索排名。
+
+用法：
+    docs = vectorstore.similarity_search(query, k=6)
+    packed = pack_context(docs, token_budget=400)
+    return packed.text
+    print(packed)     # 使用的块数、token 数、相比直接拼接节省的 token
+"""
+
+import re
+from dataclasses import dataclass
+
+_CJK = r"぀-ヿ㐀-䶿一-鿿가-힯"
+_TOKEN_PATTERN = re.compile(rf"[{_CJK}]|[^\s{_CJK}]+")
+
+
+def estimate_tokens(text):
+    """
+    粗略估计 token 数：中日韩字符每个算 1 个，其余按空白和 CJK 分成片段，每 4 个字符算 1 个
+
+    需要精确计数时，把模型的计数函数（如 model.get_num_tokens）传给 pack_context
+    """
+    count = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        count += 1 if len(piece) == 1 else (len(piece) + 3) // 4
+    return count
+
+
+@dataclass
+class PackedContext:
+    """打包结果"""
+    text: str
+    tokens: int
+    chunks_used: int
+    chunks_dropped: int
+    naive_tokens: int       # 直接拼接全部块的 token 数
+
+    @property
+    def saved_tokens(self):
+        return self.naive_tokens - self.tokens
+
+    def __str__(self):
+        return (f"使用 {self.chunks_used} 块（丢弃 {self.chunks_dropped}），{self.tokens} tokens；"
+                f"直接拼接 {self.naive_tokens} tokens，节省 {self.saved_tokens}")
+
+
+class _Block:
+    """一段连续原文：来自同一来源的一个或多个块"""
+
+    def __init__(self, source, start, text, score):
+        self.source = source
+        self.start = start
+        self.text = text
+        self.score = score
+
+    @property
+    def end(self):
+        return self.start + len(self.text)
+
+    def absorb(self, other):
+        """合并与自己重叠或首尾相接的 other"""
+        first, second = (self, other) if self.start <= other.start else (other, self)
+        text = first.text
+        if second.end > first.end:
+            text += second.text[first.end - second.start:]
+        self.start, self.text = first.start, text
+        self.score = max(self.score, other.score)
+
+
+def _insert(blocks, block):
+    """把 block 加入同一来源的区间列表，合并重叠/相接的区间；返回新列表"""
+    if block.start is None:
+        return blocks + [block]
+    merged = []
+    current = _Block(block.source, block.start, block.text, block.score)
+    for existing in blocks:
+        same = existing.source == current.source and existing.start is not None
+        if same and existing.start <= current.end and current.start <= existing.end:
+            copy = _Block(existing.source, existing.start, existing.text, existing.score)
+            copy.absorb(current)
+            current = copy
+        else:
+            merged.append(existing)
+    return merged + [current]
+
+
+def _truncate(text, token_budget, count_tokens):
+    """截取 text 的最长前缀，使其不超过 token_budget（二分查找）"""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= token_budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def _doc_score(doc, rank):
+    score = doc.metadata.get("rerank_score")
+    return float(score) if score is not None else 1.0 / (rank + 1)
+
+
+def pack_context(docs, token_budget, count_tokens=estimate_tokens, separator="\n\n"):
+    """
+    把检索结果组装成不超过 token_budget 的上下文
+
+    参数:
+        docs: 检索结果（按相关性排序）
+        token_budget: 最多使用的 token 数
+        count_tokens: token 计数函数，默认 estimate_tokens
+        separator: 段落之间的分隔符
+    """
+    docs = list(docs)
+    ranked = sorted(enumerate(docs), key=lambda item: -_doc_score(item[1], item[0]))
+    separator_tokens = count_tokens(separator)
+
+    def total(blocks):
+        return sum(count_tokens(b.text) for b in blocks) + separator_tokens * max(len(blocks) - 1, 0)
+
+    blocks, used, seen_texts = [], 0, set()
+    for rank, doc in ranked:
+        text = doc.page_content
+        start = doc.metadata.get("start_index")
+        source = doc.metadata.get("source")
+        if start is None or source is None:
+            if text in seen_texts:
+                used += 1
+                continue
+            candidate = _insert(blocks, _Block(source, None, text, _doc_score(doc, rank)))
+        else:
+            candidate = _insert(blocks, _Block(source, int(start), text, _doc_score(doc, rank)))
+        if total(candidate) <= token_budget:
+            blocks = candidate
+            seen_texts.add(text)
+            used += 1
+
+    # 一个块都放不下时，截取分数最高的块，保证工具不会返回空结果
+    if not blocks and ranked:
+        rank, doc = ranked[0]
+        truncated = _truncate(doc.page_content, token_budget, count_tokens)
+        if truncated:
+            blocks = [_Block(None, None, truncated, _doc_score(doc, rank))]
+            used = 1
+
+    # 分数最高的段落放在最前面，同一来源内按原文顺序
+    blocks.sort(key=lambda b: (-b.score, str(b.source), b.start or 0))
+    text = separator.join(b.text for b in blocks)
+    naive = separator.join(doc.page_content for doc in docs)
+    return PackedContext(
+        text=text,
+        tokens=count_tokens(text) if text else 0,
+        chunks_used=used,
+        chunks_dropped=len(docs) - used,
+        naive_tokens=count_tokens(naive) if naive else 0,
+    )
+
+
+# 测试：重叠的块只保留一份，预算不足时按分数取舍
+if __name__ == "__main__":
+    from langchain_core.documents import Document
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    text = "".join(f"第{i}句：检索增强生成把外部知识提供给大模型。" for i in range(40))
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=100, chunk_overlap=30, separators=["。", ""], keep_separator="end", add_start_index=True
+    )
+    chunks = splitter.split_documents([Document(page_content=text, metadata={"source": "rag.txt"})])
+    retrieved = [chunks[3], chunks[4], chunks[5], chunks[12], chunks[0]]
+
+    for budget in (1000, 150, 60):
+        packed = pack_context(retrieved, token_budget=budget)
+        print(f"预算 {budget:>4}: {packed}")
+    packed = pack_context(retrieved, token_budget=1000)
+    merged = packed.text.split("\n\n")[0]
+    print(f"块 3-5 合并为一段连续原文: {merged in text}（{len(merged)} 字）")
@@ -0,0 +1,465 @@
+"""
+目录导入：多进程解析 PDF / Word / Excel / Markdown / HTML / 文本
+============================================================
+
+TextLoader 一次只能加载一个 .txt 文件。DirectoryIngestor 扫描整个目录：
+- 按扩展名选择解析器（pypdf / python-docx / openpyxl / markdown / beautifulsoup4）
+- PDF、DOCX 解析是 CPU 密集型，用 ProcessPoolExecutor 多进程并行
+- 解析结果按文件完成顺序流式产出 Document，可直接交给 splitter / IngestPipeline
+- 清单（manifest.sqlite）记录每个文件的 mtime、大小和内容哈希，
+  下次运行时未变化的文件直接跳过；mtime/大小变了但内容没变，只更新清单
+- 解析过的文件要等下游确认写入后（commit）才记入清单，写入失败的文件下次会重新解析
+
+用法：
+    ingestor = DirectoryIngestor("docs/", manifest_dir="ingest_state")
+    pipeline = IngestPipeline(embeddings, upsert, splitter=splitter, on_committed=ingestor.commit)
+    pipeline.run(ingestor.iter_documents())    # 每个文件的块全部写入后记入清单
+    print(ingestor.report)
+
+    for doc in ingestor.iter_documents():      # 自行处理文档时，处理完再调用 commit()
+        ...
+    ingestor.commit()
+
+命令行：
+    python rag_utils/directory_ingest.py docs/ --workers 4
+    python rag_utils/directory_ingest.py docs/ --chroma chroma_db   # 同时写入 Chroma
+"""
+
+import concurrent.futures
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from langchain_core.documents import Document
+
+# 计算哈希时每次读取的字节数
+_HASH_BLOCK = 1 << 20
+# HTML 转文本时在这些元素后换行
+_BLOCK_TAGS = ["p", "div", "li", "tr", "br", "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "section", "article"]
+
+
+# ============================================================================
+# 解析器：每个函数接收路径，返回 Document 列表（在子进程中执行，必须是模块级函数）
+# ============================================================================
+def parse_text(path):
+    text = Path(path).read_text(encoding="utf-8", errors="replace")
+    return [Document(page_content=text, metadata={"source": str(path)})]
+
+
+def parse_pdf(path):
+    from pypdf import PdfReader
+
+    docs = []
+    for page_number, page in enumerate(PdfReader(path).pages, 1):
+        text = page.extract_text() or ""
+        if text.strip():
+            docs.append(Document(page_content=text, metadata={"source": str(path), "page": page_number}))
+    return docs
+
+
+def parse_docx(path):
+    import docx
+
+    document = docx.Document(path)
+    blocks = [p.text for p in document.paragraphs if p.text.strip()]
+    for table in document.tables:
+        for row in table.rows:
+            blocks.append(" | ".join(cell.text.strip() for cell in row.cells))
+    return [Document(page_content="\n\n".join(blocks), metadata={"source": str(path)})]
+
+
+def parse_xlsx(path):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    docs = []
+    try:
+        for sheet in workbook.worksheets:
+            rows = [
+                "\t".join("" if value is None else str(value) for value in row)
+                for row in sheet.iter_rows(values_only=True)
+                if any(value is not None for value in row)
+            ]
+            if rows:
+                docs.append(Document(
+                    page_content="\n".join(rows),
+                    metadata={"source": str(path), "sheet": sheet.title},
+                ))
+    finally:
+        workbook.close()
+    return docs
+
+
+def _html_to_text(html):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(["script", "style"]):
+        tag.decompose()
+    # 只在块级元素后换行，<strong> 等行内元素保持在同一行
+    for tag in soup.find_all(_BLOCK_TAGS):
+        tag.append("\n")
+    lines = (line.strip() for line in soup.get_text().splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def parse_html(path):
+    html = Path(path).read_text(encoding="utf-8", errors="replace")
+    return [Document(page_content=_html_to_text(html), metadata={"source": str(path)})]
+
+
+def parse_markdown(path):
+    import markdown
+
+    html = markdown.markdown(Path(path).read_text(encoding="utf-8", errors="replace"))
+    return [Document(page_content=_html_to_text(html), metadata={"source": str(path)})]
+
+
+PARSERS = {
+    ".txt": parse_text,
+    ".pdf": parse_pdf,
+    ".docx": parse_docx,
+    ".xlsx": parse_xlsx,
+    ".md": parse_markdown,
+    ".markdown": parse_markdown,
+    ".html": parse_html,
+    ".htm": parse_html,
+}
+
+
+def _parse_file(path):
+    """子进程入口：按扩展名解析"""
+    return PARSERS[Path(path).suffix.lower()](path)
+
+
+class _InlineExecutor(concurrent.futures.Executor):
+    """在当前进程中同步执行的 Executor（max_workers=0）"""
+
+    def submit(self, fn, *args, **kwargs):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def file_hash(path):
+    """文件内容的 sha256（分块读取）"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# ============================================================================
+# 清单：记录上次导入时的文件状态
+# ============================================================================
+class FileManifest:
+    """SQLite 清单：path -> (mtime_ns, size, sha256)"""
+
+    def __init__(self, manifest_dir):
+        Path(manifest_dir).mkdir(parents=True, exist_ok=True)
+        # commit 可能在 IngestPipeline 的工作线程中调用（由 DirectoryIngestor 加锁）
+        self._conn = sqlite3.connect(Path(manifest_dir) / "manifest.sqlite", check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, sha256 TEXT)"
+        )
+        self._conn.commit()
+
+    def get(self, path):
+        return self._conn.execute(
+            "SELECT mtime_ns, size, sha256 FROM files WHERE path = ?", (path,)
+        ).fetchone()
+
+    def paths(self):
+        return {row[0] for row in self._conn.execute("SELECT path FROM files")}
+
+    def update(self, path, mtime_ns, size, sha256):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO files (path, mtime_ns, size, sha256) VALUES (?, ?, ?, ?)",
+            (path, mtime_ns, size, sha256),
+        )
+        self._conn.commit()
+
+    def remove(self, paths):
+        self._conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in paths])
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+@dataclass
+class DirectoryReport:
+    """一次目录导入的统计"""
+    discovered: int = 0
+    unchanged: int = 0
+    parsed: int = 0
+    failed: dict = field(default_factory=dict)
+    removed: list = field(default_factory=list)
+    documents: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        return (f"发现 {self.discovered} 个文件：解析 {self.parsed}，未变跳过 {self.unchanged}，"
+                f"失败 {len(self.failed)}，已删除 {len(self.removed)}；"
+                f"产出 {self.documents} 个文档，耗时 {self.seconds:.2f}s")
+
+
+class DirectoryIngestor:
+    """
+    多进程目录导入器
+
+    参数:
+        root: 要扫描的目录
+        manifest_dir: 清单所在目录；为 None 时不做增量（每次全部解析）
+        extensions: 要导入的扩展名，默认 PARSERS 中的全部
+        max_workers: 进程数，默认 CPU 核数；为 0 时在当前进程中逐个解析
+                     （Windows/macOS 用 spawn 启动子进程，调用方脚本需要有 __main__ 保护）
+    """
+
+    def __init__(self, root, manifest_dir=None, extensions=None, max_workers=None):
+        self.root = Path(root)
+        self.manifest = FileManifest(manifest_dir) if manifest_dir else None
+        self.extensions = {e.lower() for e in (extensions or PARSERS)}
+        self.max_workers = (os.cpu_count() or 1) if max_workers is None else max_workers
+        self.report = DirectoryReport()
+        # 已解析、等待下游确认的文件：路径 -> 清单记录
+        self._parsed = {}
+        self._lock = threading.Lock()
+
+    def discover(self):
+        """按扩展名找出目录下的所有文件（排序，结果稳定）"""
+        return sorted(
+            p for p in self.root.rglob("*")
+            if p.is_file() and p.suffix.lower() in self.extensions
+        )
+
+    def _changed(self, path):
+        """
+        判断文件是否需要重新解析，返回 (是否变化, 清单记录)
+
+        mtime 和大小都没变时不读文件；有变化时再比较内容哈希
+        """
+        stat = path.stat()
+        if self.manifest is None:
+            return True, None
+        previous = self.manifest.get(str(path))
+        if previous and previous[0] == stat.st_mtime_ns and previous[1] == stat.st_size:
+            return False, None
+        digest = file_hash(path)
+        record = (stat.st_mtime_ns, stat.st_size, digest)
+        if previous and previous[2] == digest:
+            self.manifest.update(str(path), *record)   # 只是被 touch 过
+            return False, None
+        return True, record
+
+    def scan(self):
+        """
+        扫描目录，返回需要重新解析的 [(路径, 清单记录)]
+
+        同时统计未变化的文件，并找出清单中已不存在的文件（report.removed），
+        调用方可以据此先删除向量库中这些来源的旧块
+        """
+        report = self.report = DirectoryReport()
+        self._parsed = {}
+        self._started = time.perf_counter()
+        files = self.discover()
+        report.discovered = len(files)
+
+        if self.manifest is not None:
+            present = {str(p) for p in files}
+            report.removed = sorted(self.manifest.paths() - present)
+            self.manifest.remove(report.removed)
+
+        todo = []
+        for path in files:
+            changed, record = self._changed(path)
+            if changed:
+                todo.append((path, record))
+            else:
+                report.unchanged += 1
+        return todo
+
+    def iter_documents(self, todo=None):
+        """并行解析变化的文件（默认先调用 scan），按完成顺序产出 Document"""
+        if todo is None:
+            todo = self.scan()
+        report = self.report
+
+        # 同时在途的任务数有上限，解析结果不会全部堆在内存里
+        in_flight_limit = max(self.max_workers, 1) * 2
+        executor = (
+            concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers)
+            if self.max_workers > 0 else _InlineExecutor()
+        )
+        with executor:
+            pending = {}
+            queue = iter(todo)
+            while True:
+                while len(pending) < in_flight_limit:
+                    item = next(queue, None)
+                    if item is None:
+                        break
+                    pending[executor.submit(_parse_file, str(item[0]))] = item
+                if not pending:
+                    break
+
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    path, record = pending.pop(future)
+                    try:
+                        docs = future.result()
+                    except Exception as e:
+                        report.failed[str(path)] = f"{type(e).__name__}: {e}"
+                        continue
+                    report.parsed += 1
+                    # 产出文档前登记：下游可能在本生成器继续运行时就确认写入
+                    self._parsed[str(path)] = record
+                    if not docs:
+                        self.commit(str(path))   # 没有内容（如空白 PDF），没有需要等待的写入
+                    for doc in docs:
+                        report.documents += 1
+                        yield doc
+
+        report.seconds = time.perf_counter() - self._started
+
+    def commit(self, *sources):
+        """
+        把已解析的文件记入清单，在下游确认这些文件的块已写入后调用
+
+        不带参数时记入全部已解析的文件；可直接作为 IngestPipeline 的 on_committed 回调
+        """
+        with self._lock:
+            for source in [str(s) for s in sources] or list(self._parsed):
+                record = self._parsed.pop(source, None)
+                if self.manifest is not None and record is not None:
+                    self.manifest.update(source, *record)
+
+
+def iter_chunks(documents, splitter):
+    """把文档流逐个分割成块（仍是生成器）"""
+    for doc in documents:
+        yield from splitter.split_documents([doc])
+
+
+def main(argv=None):
+    """命令行入口：解析目录并分割；指定 --chroma 时经 IngestPipeline 写入 Chroma"""
+    import argparse
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    parser = argparse.ArgumentParser(description="多进程导入目录中的文档")
+    parser.add_argument("root", help="要导入的目录")
+    parser.add_argument("--manifest", default=None, help="清单目录（默认 <root>/.ingest_state）")
+    parser.add_argument("--workers", type=int, default=None, help="解析进程数")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--chroma", default=None, help="写入该目录下的 Chroma 集合")
+    args = parser.parse_args(argv)
+
+    ingestor = DirectoryIngestor(
+        args.root,
+        manifest_dir=args.manifest or Path(args.root) / ".ingest_state",
+        max_workers=args.workers,
+    )
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap, add_start_index=True
+    )
+    todo = ingestor.scan()
+
+    if args.chroma:
+        from langchain_community.vectorstores import Chroma
+        from embedding_cache import build_cached_embeddings
+        from ingest_pipeline import IngestPipeline, vector_upserter
+
+        embeddings = build_cached_embeddings(Path(args.chroma).parent / "embedding_cache")
+        vectorstore = Chroma(persist_directory=args.chroma, embedding_function=embeddings)
+        # 变化和删除的文件：先清掉它们的旧块，再写入新块
+        for source in [str(path) for path, _ in todo] + ingestor.report.removed:
+            vectorstore._collection.delete(where={"source": source})
+        pipeline = IngestPipeline(
+            embeddings, vector_upserter(vectorstore), splitter=splitter, on_committed=ingestor.commit
+        )
+        print(pipeline.run(ingestor.iter_documents(todo)))
+    else:
+        count = sum(1 for _ in iter_chunks(ingestor.iter_documents(todo), splitter))
+        ingestor.commit()
+        print(f"分割得到 {count} 个块")
+
+    print(ingestor.report)
+    for path, error in ingestor.report.failed.items():
+        print(f"  [失败] {path}: {error}")
+    return 1 if ingestor.report.failed else 0
+
+
+def _write_samples(folder):
+    """生成每种格式的示例文件"""
+    import docx
+    from openpyxl import Workbook
+    from pypdf import PdfWriter
+
+    folder = Path(folder)
+    (folder / "guide.txt").write_text("LangChain 是构建 LLM 应用的框架。\n\n它提供检索、代理等组件。", encoding="utf-8")
+    (folder / "notes.md").write_text("# RAG\n\n- **检索**：BM25 + 向量\n- **生成**：LLM", encoding="utf-8")
+    (folder / "page.html").write_text(
+        "<html><head><style>p{}</style></head><body><h1>Chroma</h1><p>本地向量数据库</p></body></html>",
+        encoding="utf-8",
+    )
+    document = docx.Document()
+    document.add_paragraph("Pinecone 是托管的向量数据库。")
+    document.add_paragraph("适合生产环境的大规模检索。")
+    document.save(folder / "vector_db.docx")
+    workbook = Workbook()
+    workbook.active.append(["模型", "维度"])
+    workbook.active.append(["all-MiniLM-L6-v2", 384])
+    workbook.save(folder / "models.xlsx")
+    writer = PdfWriter()
+    writer.add_blank_page(width=200, height=200)
+    with open(folder / "blank.pdf", "wb") as f:
+        writer.write(f)
+    (folder / "broken.pdf").write_bytes(b"not a pdf")
+
+
+# 带参数时作为命令行工具；不带参数时在临时目录演示增量导入
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        sys.exit(main())
+
+    import tempfile
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=10, add_start_index=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        docs_dir, state_dir = Path(tmp) / "docs", Path(tmp) / "state"
+        docs_dir.mkdir()
+        _write_samples(docs_dir)
+
+        ingestor = DirectoryIngestor(docs_dir, manifest_dir=state_dir, max_workers=2)
+        chunks = list(iter_chunks(ingestor.iter_documents(), splitter))
+        ingestor.commit()
+        print(f"首次导入: {ingestor.report}")
+        for chunk in chunks:
+            print(f"  {Path(chunk.metadata['source']).name:<16} {chunk.page_content[:40]!r}")
+        for path, error in ingestor.report.failed.items():
+            print(f"  [失败] {Path(path).name}: {error}")
+
+        list(ingestor.iter_documents())
+        print(f"再次导入: {ingestor.report}")
+
+        (docs_dir / "guide.txt").touch()
+        (docs_dir / "notes.md").write_text("# RAG\n\n检索增强生成", encoding="utf-8")
+        (docs_dir / "page.html").unlink()
+        list(ingestor.iter_documents())
+        ingestor.commit()
+        print(f"touch/修改/删除后: {ingestor.report}")
+        ingestor.manifest.close()
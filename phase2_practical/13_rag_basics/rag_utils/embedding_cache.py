@@ -0,0 +1,268 @@
+"""
+嵌入缓存：持久化的 Embeddings 包装器
+====================================
+
+按文本内容哈希缓存向量，重复索引未变化的语料时不再调用模型。
+
+存储结构（cache_dir 下）：
+- vectors.f32    - 内存映射的 float32 矩阵，形状 (max_entries, dim)
+- index.sqlite   - key -> 槽位 的索引，以及 LRU 访问序号
+
+用法：
+    embeddings = CachedEmbeddings(HuggingFaceEmbeddings(...), cache_dir="embedding_cache")
+    embeddings.embed_documents(texts)   # 第一次：调用模型
+    embeddings.embed_documents(texts)   # 第二次：全部命中缓存
+    print(embeddings.stats())
+"""
+
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# SQLite 单条语句的参数个数上限较低，批量查询时分段
+_SQL_BATCH = 500
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    带磁盘缓存的 Embeddings
+
+    参数:
+        embeddings: 被包装的 Embeddings（例如 HuggingFaceEmbeddings）
+        cache_dir: 缓存目录
+        max_entries: 最多缓存的向量条数，超出后按 LRU 淘汰
+        namespace: 缓存键前缀，默认取模型名，避免不同模型的向量混用
+    """
+
+    def __init__(self, embeddings, cache_dir, max_entries=100_000, namespace=None):
+        self.embeddings = embeddings
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.namespace = namespace or getattr(embeddings, "model_name", type(embeddings).__name__)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.cache_dir / "index.sqlite", check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                slot INTEGER NOT NULL,
+                last_used INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used);
+        """)
+
+        self._dim = None
+        self._vectors = None
+        meta = dict(self._conn.execute("SELECT name, value FROM meta"))
+        if "dim" in meta:
+            if int(meta["capacity"]) != max_entries:
+                raise ValueError(
+                    f"缓存容量不一致：已有 {meta['capacity']}，传入 {max_entries}；"
+                    f"请更换 cache_dir 或清空缓存"
+                )
+            self._open_vectors(int(meta["dim"]), mode="r+")
+
+        used = {slot for (slot,) in self._conn.execute("SELECT slot FROM entries")}
+        self._free_slots = [s for s in range(max_entries - 1, -1, -1) if s not in used]
+        row = self._conn.execute("SELECT MAX(last_used) FROM entries").fetchone()
+        self._tick = row[0] or 0
+
+    # ------------------------------------------------------------------
+    # Embeddings 接口
+    # ------------------------------------------------------------------
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """批量嵌入文档，只对未命中的文本调用模型"""
+        return self._embed(texts, "doc", self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> list[float]:
+        """嵌入查询（查询向量与文档向量分开缓存）"""
+        return self._embed([text], "query", lambda ts: [self.embeddings.embed_query(ts[0])])[0]
+
+    # ------------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------------
+    def stats(self) -> dict:
+        """返回命中/未命中计数和缓存占用"""
+        total = self.hits + self.misses
+        entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "capacity": self.max_entries,
+        }
+
+    def close(self):
+        """刷新向量文件并关闭索引连接"""
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._conn.close()
+
+    # ------------------------------------------------------------------
+    # 内部实现
+    # ------------------------------------------------------------------
+    def _key(self, kind, text):
+        raw = f"{self.namespace}\x00{kind}\x00{text}".encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    def _open_vectors(self, dim, mode):
+        self._dim = dim
+        self._vectors = np.memmap(
+            self.cache_dir / "vectors.f32",
+            dtype=np.float32,
+            mode=mode,
+            shape=(self.max_entries, dim),
+        )
+
+    def _lookup(self, keys):
+        found = {}
+        for start in range(0, len(keys), _SQL_BATCH):
+            batch = keys[start:start + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            found.update(self._conn.execute(
+                f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", batch
+            ))
+        return found
+
+    def _next_tick(self):
+        self._tick += 1
+        return self._tick
+
+    def _allocate(self, count, keep=()):
+        """分配 count 个槽位，不够时淘汰最久未使用的条目（keep 中的键不淘汰）"""
+        slots = []
+        while self._free_slots and len(slots) < count:
+            slots.append(self._free_slots.pop())
+
+        need = count - len(slots)
+        if need > 0:
+            rows = self._conn.execute(
+                "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (need + len(keep),)
+            ).fetchall()
+            victims = [(key, slot) for key, slot in rows if key not in keep][:need]
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in victims])
+            slots.extend(slot for _, slot in victims)
+            self.evictions += len(victims)
+        return slots
+
+    def _store(self, new_vectors, keys):
+        """写入新算出的向量；keys（本次调用用到的键）对应的条目不会被淘汰"""
+        dim = len(next(iter(new_vectors.values())))
+        if self._vectors is None:
+            self._open_vectors(dim, mode="w+")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                [("dim", str(self._dim)), ("capacity", str(self.max_entries))],
+            )
+        elif dim != self._dim:
+            raise ValueError(f"向量维度不一致：缓存为 {self._dim}，模型输出 {dim}")
+
+        # 模型调用期间其他线程可能已经写入了相同的文本，这些键不再重复分配槽位
+        keep = self._lookup(list(keys))
+        pending = [key for key in new_vectors if key not in keep]
+        # 容量扣除受保护的条目；单批未命中超过剩余容量时，只保留最后几条
+        room = self.max_entries - len(keep)
+        to_store = pending[-room:] if room > 0 else []
+        if not to_store:
+            return
+
+        slots = self._allocate(len(to_store), keep)
+        for key, slot in zip(to_store, slots):
+            self._vectors[slot] = new_vectors[key]
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+            [(key, slot, self._next_tick()) for key, slot in zip(to_store, slots)],
+        )
+        self._vectors.flush()
+
+    def _embed(self, texts, kind, compute):
+        if not texts:
+            return []
+
+        keys = [self._key(kind, t) for t in texts]
+        with self._lock:
+            found = self._lookup(list(set(keys)))
+
+            # 未命中的文本去重后一次性交给模型
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in found and key not in missing:
+                    missing[key] = text
+
+            self.hits += len(texts) - sum(1 for k in keys if k in missing)
+            self.misses += sum(1 for k in keys if k in missing)
+
+            # 更新命中条目的访问序号，并把向量复制出来：
+            # 之后为未命中文本分配槽位时即使淘汰并覆盖了这些槽位，本次结果也不受影响
+            vectors = {}
+            if found:
+                self._conn.executemany(
+                    "UPDATE entries SET last_used = ? WHERE key = ?",
+                    [(self._next_tick(), k) for k in found],
+                )
+                self._conn.commit()
+                vectors = {key: self._vectors[slot].copy() for key, slot in found.items()}
+
+        if missing:
+            # 调用模型时不持有锁，多个线程（例如 IngestPipeline 的 embed_workers）可以并行计算
+            computed = np.asarray(compute(list(missing.values())), dtype=np.float32)
+            new_vectors = dict(zip(missing, computed))
+            vectors.update(new_vectors)
+            with self._lock:
+                self._store(new_vectors, set(keys))
+                self._conn.commit()
+
+        return [vectors[key].tolist() for key in keys]
+
+
+def build_cached_embeddings(cache_dir, model_name=DEFAULT_MODEL_NAME, max_entries=100_000):
+    """创建带缓存的 HuggingFaceEmbeddings（13/14 模块共用同一个实例即可）"""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return CachedEmbeddings(
+        HuggingFaceEmbeddings(model_name=model_name),
+        cache_dir=cache_dir,
+        max_entries=max_entries,
+        namespace=model_name,
+    )
+
+
+# 测试缓存
+if __name__ == "__main__":
+    import tempfile
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    class CountingEmbedding(DeterministicFakeEmbedding):
+        calls: int = 0
+
+        def embed_documents(self, texts):
+            self.calls += len(texts)
+            return super().embed_documents(texts)
+
+    base = CountingEmbedding(size=8)
+    with tempfile.TemporaryDirectory() as tmp:
+        cached = CachedEmbeddings(base, cache_dir=tmp, max_entries=3)
+        texts = ["LangChain", "RAG", "BM25"]
+        first = cached.embed_documents(texts)
+        second = cached.embed_documents(texts)
+        print(f"模型调用次数: {base.calls}（第二次全部命中）")
+        print(f"向量一致: {np.allclose(first, second)}")
+
+        cached.embed_documents(["Chroma"])   # 容量 3，淘汰最久未使用的 LangChain
+        print(f"统计: {cached.stats()}")
+        cached.close()
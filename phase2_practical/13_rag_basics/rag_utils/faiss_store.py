@@ -0,0 +1,377 @@
+"""
+本地向量库：基于 faiss-cpu，可替代 Pinecone
+===========================================
+
+Pinecone serverless 需要 API key、创建索引并等待就绪。FaissVectorStore
+在本地完成同样的工作，接口与 PineconeVectorStore 相同：
+similarity_search(query, k) / similarity_search_with_score / as_retriever()，
+也可以交给 IngestPipeline 写入（实现了 add_embeddings）。
+
+三种索引：
+- flat: 精确搜索（暴力计算全部向量），召回率 100%，数据量大时最慢
+- ivf:  先聚类成 nlist 个桶，查询只搜 nprobe 个桶；需要训练，
+        向量数不足 nlist * 39 时先精确搜索，攒够后自动训练（也可手动 train()）
+- hnsw: 图索引，无需训练，ef_search 越大召回越高、越慢
+
+metric="cosine" 时向量先归一化再用内积，分数是余弦相似度（越大越相关）；
+metric="l2" 时分数是欧氏距离（越小越相关）。
+
+持久化：save(folder) 写入 index.faiss + docstore.json；
+load(folder, embeddings) 默认以 mmap 只读方式加载，向量不全部读入内存。
+
+用法：
+    store = FaissVectorStore(embeddings, index_type="hnsw")
+    store.add_documents(chunks)
+    store.save("faiss_index")
+
+    store = FaissVectorStore.load("faiss_index", embeddings)
+    docs = store.similarity_search("LangChain 是什么？", k=3)
+"""
+
+import json
+import uuid
+from pathlib import Path
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+METRICS = ("cosine", "l2")
+# faiss 建议每个聚类中心至少 39 个训练样本
+_MIN_POINTS_PER_CENTROID = 39
+
+
+class FaissVectorStore(VectorStore):
+    """
+    基于 faiss 的本地向量库
+
+    参数:
+        embedding: 嵌入模型
+        index_type: "flat" / "ivf" / "hnsw"
+        metric: "cosine"（归一化 + 内积）或 "l2"
+        nlist: IVF 聚类数（训练样本不足时自动减小）
+        nprobe: IVF 查询时搜索的聚类数
+        hnsw_m: HNSW 每个节点的邻居数
+        ef_construction: HNSW 建图时的候选数
+        ef_search: HNSW 查询时的候选数
+    """
+
+    def __init__(
+        self,
+        embedding,
+        index_type="flat",
+        metric="cosine",
+        nlist=100,
+        nprobe=8,
+        hnsw_m=32,
+        ef_construction=80,
+        ef_search=64,
+    ):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"index_type 必须是 {INDEX_TYPES} 之一，收到 {index_type!r}")
+        if metric not in METRICS:
+            raise ValueError(f"metric 必须是 {METRICS} 之一，收到 {metric!r}")
+        self._embedding = embedding
+        self.index_type = index_type
+        self.metric = metric
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+
+        self.index = None           # 第一次写入时按向量维度创建
+        self.read_only = False      # mmap 加载的索引不能修改
+        self._pending = []          # IVF 训练前暂存的向量
+        # 文档存储：faiss 行号 -> ID / 文本 / metadata；删除的行 ID 置为 None
+        self._ids = []
+        self._texts = []
+        self._metadatas = []
+        self._row_of = {}
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def __len__(self):
+        return len(self._row_of)
+
+    # ------------------------------------------------------------------
+    # 建索引
+    # ------------------------------------------------------------------
+    def _faiss_metric(self):
+        return faiss.METRIC_INNER_PRODUCT if self.metric == "cosine" else faiss.METRIC_L2
+
+    def _prepare(self, vectors):
+        vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+        if self.metric == "cosine":
+            faiss.normalize_L2(vectors)
+        return vectors
+
+    def _create_index(self, dimension, train_vectors=None):
+        if self.index_type == "flat":
+            if self.metric == "cosine":
+                return faiss.IndexFlatIP(dimension)
+            return faiss.IndexFlatL2(dimension)
+        if self.index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(dimension, self.hnsw_m, self._faiss_metric())
+            index.hnsw.efConstruction = self.ef_construction
+            return index
+        nlist = max(1, min(self.nlist, len(train_vectors) // _MIN_POINTS_PER_CENTROID))
+        quantizer = faiss.IndexFlat(dimension, self._faiss_metric())
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist, self._faiss_metric())
+        # nlist 已按样本数缩小；样本少于 39 个时只有一个聚类，不需要 faiss 再警告
+        index.cp.min_points_per_centroid = 1
+        index.train(train_vectors)
+        return index
+
+    def train(self):
+        """IVF：用暂存的向量训练并写入索引（flat / hnsw 无需训练）"""
+        if not self._pending:
+            return
+        vectors = np.vstack(self._pending)
+        self._pending = []
+        self.index = self._create_index(vectors.shape[1], vectors)
+        self.index.add(vectors)
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError("索引以 mmap 只读方式加载，修改前请用 load(..., mmap=False) 重新加载")
+
+    def add_embeddings(self, text_embeddings, metadatas=None, ids=None, **kwargs):
+        """写入已算好的向量；ID 已存在时覆盖（旧行标记为删除）"""
+        self._check_writable()
+        text_embeddings = list(text_embeddings)
+        if not text_embeddings:
+            return []
+        texts = [t for t, _ in text_embeddings]
+        vectors = self._prepare([v for _, v in text_embeddings])
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [uuid.uuid4().hex for _ in texts]
+
+        self._tombstone([i for i in ids if i in self._row_of])
+        for doc_id, text, metadata in zip(ids, texts, metadatas):
+            self._row_of[doc_id] = len(self._ids)
+            self._ids.append(doc_id)
+            self._texts.append(text)
+            self._metadatas.append(dict(metadata or {}))
+
+        if self.index_type == "ivf" and (self.index is None or not self.index.is_trained):
+            self._pending.append(vectors)
+            if sum(len(v) for v in self._pending) >= self.nlist * _MIN_POINTS_PER_CENTROID:
+                self.train()
+        else:
+            if self.index is None:
+                self.index = self._create_index(vectors.shape[1])
+            self.index.add(vectors)
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        vectors = self._embedding.embed_documents(texts)
+        return self.add_embeddings(zip(texts, vectors), metadatas=metadatas, ids=ids)
+
+    def _tombstone(self, ids):
+        for doc_id in ids:
+            row = self._row_of.pop(doc_id, None)
+            if row is not None:
+                self._ids[row] = None
+
+    def delete(self, ids=None, **kwargs):
+        """按 ID 删除（只在文档存储中标记，faiss 中的向量在查询时被过滤）"""
+        self._check_writable()
+        self._tombstone(ids or [])
+        return True
+
+    def get_by_ids(self, ids):
+        return [self._document(self._row_of[i]) for i in ids if i in self._row_of]
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+    def _document(self, row):
+        return Document(id=self._ids[row], page_content=self._texts[row], metadata=dict(self._metadatas[row]))
+
+    def search_matrix(self, vectors, k):
+        """
+        批量查询，返回 (scores, rows) 两个 (查询数, k) 数组；不足 k 个时 rows 为 -1
+
+        返回的是 faiss 行号，不过滤已删除的行，也不构造 Document（基准测试用）
+        """
+        queries = self._prepare(vectors)
+        if self.index is None and not self._pending:
+            return (np.full((len(queries), k), np.nan, dtype=np.float32),
+                    np.full((len(queries), k), -1, dtype=np.int64))
+        if self._pending:
+            # IVF 还没训练：对暂存的向量精确搜索
+            return self._exact_search(np.vstack(self._pending), queries, k)
+        if self.index_type == "ivf":
+            self.index.nprobe = self.nprobe
+        elif self.index_type == "hnsw":
+            self.index.hnsw.efSearch = max(self.ef_search, k)
+        scores, rows = self.index.search(queries, k)
+        if self.metric == "l2":
+            scores = np.sqrt(np.maximum(scores, 0))
+        return scores, rows
+
+    def _exact_search(self, matrix, queries, k):
+        if self.metric == "cosine":
+            scores = queries @ matrix.T
+        else:
+            scores = -(
+                (queries ** 2).sum(1, keepdims=True) - 2 * queries @ matrix.T + (matrix ** 2).sum(1)
+            )
+        top = min(k, matrix.shape[0])
+        rows = np.argsort(-scores, axis=1, kind="stable")[:, :top]
+        best = np.take_along_axis(scores, rows, axis=1)
+        if self.metric == "l2":
+            best = np.sqrt(np.maximum(-best, 0))
+        pad = k - top
+        if pad:
+            best = np.pad(best, ((0, 0), (0, pad)), constant_values=np.nan)
+            rows = np.pad(rows, ((0, 0), (0, pad)), constant_values=-1)
+        return best.astype(np.float32), rows.astype(np.int64)
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        """
+        按向量检索，返回 [(Document, 分数)]
+
+        filter: metadata 等值过滤，如 {"source": "a.txt"}；
+        已删除的行和不满足过滤条件的结果会被跳过，不够 k 个时扩大候选数重新查询
+        """
+        total = len(self._ids)
+        fetch = min(total, k + (total - len(self._row_of)))
+        while True:
+            scores, rows = self.search_matrix([embedding], max(fetch, 1))
+            results = []
+            for score, row in zip(scores[0], rows[0]):
+                if row < 0 or self._ids[row] is None:
+                    continue
+                metadata = self._metadatas[row]
+                if filter and any(metadata.get(key) != value for key, value in filter.items()):
+                    continue
+                results.append((self._document(row), float(score)))
+                if len(results) == k:
+                    return results
+            if fetch >= total:
+                return results
+            fetch = min(total, fetch * 2)
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        embedding = self._embedding.embed_query(query)
+        return self.similarity_search_with_score_by_vector(embedding, k, filter=filter)
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter=filter)]
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter=filter)]
+
+    def _select_relevance_score_fn(self):
+        if self.metric == "cosine":
+            return lambda score: (score + 1) / 2
+        return self._euclidean_relevance_score
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, **kwargs):
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    # ------------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------------
+    def _config(self):
+        return {
+            "index_type": self.index_type,
+            "metric": self.metric,
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "hnsw_m": self.hnsw_m,
+            "ef_construction": self.ef_construction,
+            "ef_search": self.ef_search,
+        }
+
+    def save(self, folder):
+        """保存到目录：index.faiss（faiss 索引）+ docstore.json（文本、metadata 和参数）"""
+        self.train()
+        if self.index is None:
+            raise ValueError("索引为空，没有可保存的内容")
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        faiss.write_index(self.index, str(folder / "index.faiss"))
+        with open(folder / "docstore.json", "w", encoding="utf-8") as f:
+            json.dump(
+                {"config": self._config(), "ids": self._ids, "texts": self._texts, "metadatas": self._metadatas},
+                f,
+                ensure_ascii=False,
+            )
+
+    @classmethod
+    def load(cls, folder, embedding, mmap=True):
+        """
+        从目录加载
+
+        mmap=True 时 faiss 索引以内存映射方式只读加载（向量按需从磁盘读取），
+        需要继续写入时传 mmap=False
+        """
+        folder = Path(folder)
+        with open(folder / "docstore.json", encoding="utf-8") as f:
+            data = json.load(f)
+        store = cls(embedding, **data["config"])
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+        store.index = faiss.read_index(str(folder / "index.faiss"), flags)
+        store.read_only = mmap
+        store._ids = data["ids"]
+        store._texts = data["texts"]
+        store._metadatas = data["metadatas"]
+        store._row_of = {doc_id: row for row, doc_id in enumerate(store._ids) if doc_id is not None}
+        return store
+
+
+# 测试：三种索引的召回率，以及保存 / mmap 加载后的检索结果
+if __name__ == "__main__":
+    import tempfile
+    import time
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    rng = np.random.default_rng(0)
+    dimension, size = 64, 20_000
+    centers = rng.normal(size=(200, dimension))
+    vectors = (centers[rng.integers(0, 200, size)] + 0.3 * rng.normal(size=(size, dimension))).astype(np.float32)
+    queries = vectors[rng.choice(size, 200, replace=False)] + 0.05 * rng.normal(size=(200, dimension))
+    pairs = [(f"doc {i}", v) for i, v in enumerate(vectors)]
+
+    embedding = DeterministicFakeEmbedding(size=dimension)
+    exact = None
+    for index_type in INDEX_TYPES:
+        store = FaissVectorStore(embedding, index_type=index_type)
+        start = time.perf_counter()
+        store.add_embeddings(pairs)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        _, rows = store.search_matrix(queries, 10)
+        qps = len(queries) / (time.perf_counter() - start)
+        if exact is None:
+            exact = rows
+        recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(rows, exact)])
+        print(f"{index_type:<5} 建库 {build:.2f}s  QPS {qps:9.0f}  recall@10 {recall:.3f}")
+
+    store = FaissVectorStore.from_texts(
+        ["LangChain 是 LLM 应用框架", "Pinecone 是托管向量数据库", "FAISS 是本地向量索引库"],
+        embedding,
+        metadatas=[{"source": "a.txt"}, {"source": "b.txt"}, {"source": "b.txt"}],
+        ids=["a", "b", "c"],
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        store.save(tmp)
+        loaded = FaissVectorStore.load(tmp, embedding)
+        print(f"mmap 加载: {len(loaded)} 条，只读 {loaded.read_only}")
+        print(f"  精确查询: {[d.id for d in loaded.similarity_search('FAISS 是本地向量索引库', k=2)]}")
+        print(f"  过滤 source=b.txt: {[d.id for d in loaded.similarity_search('LangChain', k=3, filter={'source': 'b.txt'})]}")
+        try:
+            loaded.add_texts(["新文档"])
+        except RuntimeError as e:
+            print(f"  写入只读索引: {e}")
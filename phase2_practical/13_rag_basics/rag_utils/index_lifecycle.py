@@ -0,0 +1,203 @@
+"""
+向量索引生命周期：创建后轮询就绪状态，代替固定的 time.sleep(10)
+=============================================================
+
+pc.create_index(...) 之后固定等待 10 秒：索引早就绪也要等满 10 秒，
+晚于 10 秒就绪时又会在未就绪的索引上写入。
+
+IndexManager：
+- 创建索引时不让 SDK 阻塞等待（timeout=-1），自己轮询 describe_index
+- 轮询间隔指数退避（0.5s, 1s, 2s ... 最多 max_interval），超过 deadline 抛出 TimeoutError
+- list_indexes() 的结果在进程内缓存（同一个 API key 只请求一次），本进程创建的索引会补进缓存
+- 返回 IndexReadiness：是否新建、就绪耗时、轮询次数、索引 host
+- clock / sleep 可以替换，配合 FakeIndexService 离线测试
+
+用法：
+    manager = IndexManager(pc)
+    readiness = manager.ensure_index("my-index", dimension=384, metric="cosine",
+                                     spec=ServerlessSpec(cloud="aws", region="us-east-1"))
+    print(readiness)
+    index = pc.Index(readiness.name, host=readiness.host)
+"""
+
+import time
+from dataclasses import dataclass
+
+# 进程内的 list_indexes 缓存：cache_key -> 索引名集合
+_INDEX_NAMES_CACHE = {}
+
+
+@dataclass
+class IndexReadiness:
+    """一次 ensure_index / wait_until_ready 的结果"""
+    name: str
+    created: bool = False
+    seconds_to_ready: float = 0.0
+    polls: int = 0
+    host: str = None
+
+    def __str__(self):
+        action = "新建" if self.created else "已存在"
+        return f"索引 {self.name}（{action}）就绪耗时 {self.seconds_to_ready:.2f}s，轮询 {self.polls} 次"
+
+
+def _field(obj, key):
+    """同时兼容 dict 和 Pinecone 的模型对象"""
+    if isinstance(obj, dict):
+        return obj.get(key)
+    return getattr(obj, key, None)
+
+
+def _is_ready(description):
+    status = _field(description, "status")
+    return bool(status and _field(status, "ready"))
+
+
+def _default_cache_key(client):
+    config = getattr(client, "config", None)
+    return getattr(config, "api_key", None) or id(client)
+
+
+class IndexManager:
+    """
+    Pinecone 风格客户端（list_indexes / create_index / describe_index）的索引管理器
+
+    参数:
+        client: Pinecone 实例（或 FakeIndexService）
+        initial_interval: 第一次轮询前等待的秒数
+        max_interval: 轮询间隔上限
+        backoff: 每次轮询后间隔乘以的倍数
+        deadline: 等待就绪的最长秒数，超过抛出 TimeoutError
+        clock / sleep: 计时和等待函数（测试时替换为假时钟）
+        cache_key: list_indexes 缓存的键，默认取客户端的 API key
+    """
+
+    def __init__(
+        self,
+        client,
+        initial_interval=0.5,
+        max_interval=8.0,
+        backoff=2.0,
+        deadline=120.0,
+        clock=time.monotonic,
+        sleep=time.sleep,
+        cache_key=None,
+    ):
+        if initial_interval <= 0 or backoff < 1 or deadline <= 0:
+            raise ValueError("initial_interval / deadline 必须大于 0，backoff 不能小于 1")
+        self.client = client
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.deadline = deadline
+        self.clock = clock
+        self.sleep = sleep
+        self.cache_key = cache_key if cache_key is not None else _default_cache_key(client)
+
+    def index_names(self, refresh=False):
+        """已有索引的名称（进程内缓存，refresh=True 时重新请求）"""
+        if refresh or self.cache_key not in _INDEX_NAMES_CACHE:
+            _INDEX_NAMES_CACHE[self.cache_key] = {_field(idx, "name") for idx in self.client.list_indexes()}
+        return _INDEX_NAMES_CACHE[self.cache_key]
+
+    def wait_until_ready(self, name):
+        """轮询 describe_index 直到索引就绪，间隔指数增长；超过 deadline 抛出 TimeoutError"""
+        started = self.clock()
+        interval = self.initial_interval
+        polls = 0
+        while True:
+            description = self.client.describe_index(name)
+            polls += 1
+            elapsed = self.clock() - started
+            if _is_ready(description):
+                return IndexReadiness(name, seconds_to_ready=elapsed, polls=polls, host=_field(description, "host"))
+            remaining = self.deadline - elapsed
+            if remaining <= 0:
+                raise TimeoutError(f"索引 {name} 在 {self.deadline:.0f}s 内未就绪（轮询 {polls} 次）")
+            self.sleep(min(interval, remaining))
+            interval = min(interval * self.backoff, self.max_interval)
+
+    def ensure_index(self, name, dimension, metric="cosine", spec=None, **create_kwargs):
+        """索引不存在时创建，然后等待就绪"""
+        started = self.clock()
+        created = name not in self.index_names()
+        if created:
+            # timeout=-1：SDK 不阻塞等待（默认每 5 秒轮询一次），由 wait_until_ready 退避轮询
+            self.client.create_index(
+                name=name, dimension=dimension, metric=metric, spec=spec, timeout=-1, **create_kwargs
+            )
+            self.index_names().add(name)
+        readiness = self.wait_until_ready(name)
+        readiness.created = created
+        readiness.seconds_to_ready = self.clock() - started
+        return readiness
+
+
+class FakeClock:
+    """假时钟：sleep 只推进时间，不真正等待"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeIndexService:
+    """
+    本地假索引服务：接口与 Pinecone 客户端的索引管理部分相同
+
+    参数:
+        clock: 时间函数（通常是 FakeClock）
+        ready_after: 新建索引经过多少秒后就绪
+        existing: 一开始就存在（且已就绪）的索引名
+    """
+
+    def __init__(self, clock, ready_after=3.0, existing=()):
+        self.clock = clock
+        self.ready_after = ready_after
+        self.created_at = {name: float("-inf") for name in existing}
+        self.calls = {"list_indexes": 0, "create_index": 0, "describe_index": 0}
+
+    def list_indexes(self):
+        self.calls["list_indexes"] += 1
+        return [{"name": name} for name in self.created_at]
+
+    def create_index(self, name, dimension, metric="cosine", spec=None, timeout=None, **kwargs):
+        self.calls["create_index"] += 1
+        if name in self.created_at:
+            raise ValueError(f"索引 {name} 已存在")
+        self.created_at[name] = self.clock()
+
+    def describe_index(self, name):
+        self.calls["describe_index"] += 1
+        if name not in self.created_at:
+            raise KeyError(name)
+        ready = self.clock() - self.created_at[name] >= self.ready_after
+        return {"name": name, "status": {"ready": ready}, "host": f"{name}.local"}
+
+
+# 测试：假服务上的就绪时间、退避间隔和超时
+if __name__ == "__main__":
+    clock = FakeClock()
+    service = FakeIndexService(clock, ready_after=3.0, existing=["old-index"])
+    manager = IndexManager(service, clock=clock, sleep=clock.sleep, cache_key="demo")
+
+    print(manager.ensure_index("old-index", dimension=384))
+    readiness = manager.ensure_index("new-index", dimension=384)
+    print(readiness)
+    print(f"  轮询间隔: {clock.sleeps}（固定 sleep(10) 需要 10s）")
+    print(f"  API 调用: {service.calls}")
+
+    slow = FakeIndexService(clock, ready_after=30.0)
+    try:
+        IndexManager(slow, deadline=10, clock=clock, sleep=clock.sleep, cache_key="slow").ensure_index(
+            "slow-index", dimension=384
+        )
+    except TimeoutError as e:
+        print(f"超时: {e}")
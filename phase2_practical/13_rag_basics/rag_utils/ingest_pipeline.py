@@ -0,0 +1,415 @@
+"""
+批量入库流水线：加载 -> 分割 -> 嵌入 -> 写入
+==========================================
+
+PineconeVectorStore.from_documents / Chroma.from_documents 一次性接收全部文档块，
+嵌入和上传的批次大小由库决定，而且必须先把所有块都放进内存。
+
+IngestPipeline 把入库拆成四个阶段，每个阶段一个（或多个）线程，
+阶段之间用有界队列连接：
+- load:   遍历文档（可以是生成器，按需读取）
+- split:  分割成块，攒够 embed_batch_size 个块交给嵌入阶段
+- embed:  embed_workers 个线程并行调用 embed_documents
+- upsert: 把 (ID, 文本, 向量, metadata) 直接写入向量库，不再重复嵌入
+
+队列有上限，慢的阶段会让上游阻塞等待：内存中最多只有几批数据，
+嵌入下一批和上传上一批同时进行。
+
+用法：
+    pipeline = IngestPipeline(
+        embeddings,
+        vector_upserter(vectorstore),   # Chroma / Pinecone / FAISS
+        splitter=splitter,              # 传入已分割的块时可省略
+        embed_batch_size=64,
+    )
+    report = pipeline.run(load_text_files(paths))
+    print(report)
+"""
+
+import hashlib
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from langchain_core.documents import Document
+
+# 队列中的结束标记
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    """单个阶段的统计：处理的块数和实际工作时间（不含等待队列的时间）"""
+    name: str
+    chunks: int = 0
+    seconds: float = 0.0
+    unit: str = "块"
+
+    @property
+    def chunks_per_sec(self):
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class IngestReport:
+    """一次入库的结果"""
+    documents: int = 0
+    chunks: int = 0
+    batches: int = 0
+    wall_seconds: float = 0.0
+    stages: dict = field(default_factory=dict)
+
+    def __str__(self):
+        lines = [
+            f"文档 {self.documents}，块 {self.chunks}，批次 {self.batches}，"
+            f"总耗时 {self.wall_seconds:.2f}s（{self.chunks / max(self.wall_seconds, 1e-9):.1f} 块/秒）"
+        ]
+        for stage in self.stages.values():
+            lines.append(f"  {stage.name:<7} {stage.seconds:7.2f}s  {stage.chunks_per_sec:10.1f} {stage.unit}/秒")
+        return "\n".join(lines)
+
+
+def content_hash(text: str) -> str:
+    """文档块内容的哈希"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(source: str, offset, digest: str) -> str:
+    """由来源、偏移和内容哈希组成的稳定 ID（14 模块的 ChromaIndexer 也使用这个函数）"""
+    raw = f"{source}\x00{offset}\x00{digest}".encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()
+
+
+def default_chunk_id(doc):
+    """文档块 ID：优先使用 doc.id，否则由来源、start_index 和内容哈希计算"""
+    if doc.id:
+        return doc.id
+    return chunk_id(
+        str(doc.metadata.get("source", "")),
+        doc.metadata.get("start_index", ""),
+        content_hash(doc.page_content),
+    )
+
+
+def load_text_files(paths, encoding="utf-8"):
+    """按需逐个读取文本文件，生成 Document（不会一次加载所有文件）"""
+    for path in paths:
+        text = Path(path).read_text(encoding=encoding)
+        yield Document(page_content=text, metadata={"source": str(path)})
+
+
+def vector_upserter(vectorstore):
+    """
+    返回一个 upsert(ids, texts, vectors, metadatas) 函数，直接写入已算好的向量
+
+    支持 Chroma（collection.upsert）、PineconeVectorStore（index.upsert）
+    和实现了 add_embeddings 的向量库（如 FAISS）
+    """
+    collection = getattr(vectorstore, "_collection", None)
+    if collection is not None:
+        def upsert_chroma(ids, texts, vectors, metadatas):
+            collection.upsert(
+                ids=ids,
+                embeddings=vectors,
+                documents=texts,
+                metadatas=[m or None for m in metadatas],
+            )
+        return upsert_chroma
+
+    index = getattr(vectorstore, "_index", None)
+    text_key = getattr(vectorstore, "_text_key", None)
+    if index is not None and text_key is not None:
+        namespace = getattr(vectorstore, "_namespace", None)
+
+        def upsert_pinecone(ids, texts, vectors, metadatas):
+            index.upsert(
+                vectors=[
+                    {"id": i, "values": v, "metadata": {**m, text_key: t}}
+                    for i, t, v, m in zip(ids, texts, vectors, metadatas)
+                ],
+                namespace=namespace,
+            )
+        return upsert_pinecone
+
+    if hasattr(vectorstore, "add_embeddings"):
+        def upsert_embeddings(ids, texts, vectors, metadatas):
+            vectorstore.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+        return upsert_embeddings
+
+    raise TypeError(f"不支持直接写入向量的向量库: {type(vectorstore).__name__}")
+
+
+class IngestPipeline:
+    """
+    分阶段并发的入库流水线
+
+    参数:
+        embeddings: 嵌入模型（embed_documents 需线程安全；CachedEmbeddings 只在读写缓存时加锁，
+                    未命中文本的模型调用不持锁，多个 embed_workers 可以同时计算）
+        upsert: upsert(ids, texts, vectors, metadatas)，见 vector_upserter
+        splitter: 文本分割器；为 None 时输入视为已分割好的块
+        embed_batch_size: 每次 embed_documents 的块数
+        embed_workers: 并行嵌入的线程数
+        queue_size: 阶段之间队列的最大批次数（限制内存）
+        id_func: 由文档块计算 ID，默认 default_chunk_id
+        on_progress: 每写入一批后回调 on_progress(report)
+        on_committed: 某个来源（metadata["source"]）的块全部写入后回调 on_committed(source)，
+                      在流水线的工作线程中调用；同一来源的文档需要相邻输入
+                      （load_text_files、DirectoryIngestor 都满足）
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        upsert,
+        splitter=None,
+        embed_batch_size=64,
+        embed_workers=2,
+        queue_size=4,
+        id_func=default_chunk_id,
+        on_progress=None,
+        on_committed=None,
+    ):
+        if embed_batch_size < 1 or embed_workers < 1 or queue_size < 1:
+            raise ValueError("embed_batch_size / embed_workers / queue_size 必须大于 0")
+        self.embeddings = embeddings
+        self.upsert = upsert
+        self.splitter = splitter
+        self.embed_batch_size = embed_batch_size
+        self.embed_workers = embed_workers
+        self.queue_size = queue_size
+        self.id_func = id_func
+        self.on_progress = on_progress
+        self.on_committed = on_committed
+        self.last_report = None
+
+    def run(self, documents) -> IngestReport:
+        """执行入库；documents 可以是任意可迭代对象（包括生成器）"""
+        report = IngestReport(stages={
+            "load": StageStats("load", unit="文档"),
+            "split": StageStats("split"),
+            "embed": StageStats("embed"),
+            "upsert": StageStats("upsert"),
+        })
+        self.last_report = report
+        lock = threading.Lock()
+        stop = threading.Event()
+        errors = []
+        # 来源 -> 尚未写入的块数（来源的文档还在输入时额外加 1）
+        open_sources = {}
+
+        def settle(source, count):
+            # 调用方持有 lock；返回该来源是否已全部写入
+            remaining = open_sources[source] = open_sources[source] - count
+            if remaining == 0:
+                del open_sources[source]
+                return True
+            return False
+
+        def committed(sources):
+            for source in sources:
+                self.on_committed(source)
+
+        doc_queue = queue.Queue(maxsize=self.queue_size * self.embed_batch_size)
+        batch_queue = queue.Queue(maxsize=self.queue_size)
+        vector_queue = queue.Queue(maxsize=self.queue_size)
+
+        def put(q, item):
+            # 下游出错时不再阻塞在满的队列上
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def get(q):
+            # 上游出错退出时不再无限等待
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _DONE
+
+        def record(stage, chunks, started):
+            with lock:
+                stats = report.stages[stage]
+                stats.chunks += chunks
+                stats.seconds += time.perf_counter() - started
+
+        def guarded(func):
+            def wrapper(*args):
+                try:
+                    func(*args)
+                except Exception as e:
+                    errors.append(e)
+                    stop.set()
+            return wrapper
+
+        @guarded
+        def load_stage():
+            iterator = iter(documents)
+            try:
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    try:
+                        doc = next(iterator)
+                    except StopIteration:
+                        break
+                    record("load", 1, started)
+                    report.documents += 1
+                    put(doc_queue, doc)
+            finally:
+                put(doc_queue, _DONE)
+
+        @guarded
+        def split_stage():
+            batch = []
+            current = None
+            try:
+                while not stop.is_set():
+                    doc = get(doc_queue)
+                    if doc is _DONE:
+                        if current is not None:
+                            with lock:
+                                done = settle(current, 1)
+                            committed([current] if done else [])
+                        break
+                    started = time.perf_counter()
+                    chunks = self.splitter.split_documents([doc]) if self.splitter else [doc]
+                    record("split", len(chunks), started)
+                    source = doc.metadata.get("source") if self.on_committed else None
+                    if source is not None:
+                        # 块数在交给下游之前登记；换到下一个来源时，上一个来源不再有新块
+                        done = []
+                        with lock:
+                            if source != current:
+                                if current is not None and settle(current, 1):
+                                    done.append(current)
+                                open_sources[source] = open_sources.get(source, 0) + 1
+                                current = source
+                            open_sources[source] += len(chunks)
+                        committed(done)
+                    for chunk in chunks:
+                        batch.append(chunk)
+                        if len(batch) == self.embed_batch_size:
+                            put(batch_queue, batch)
+                            batch = []
+                if batch:
+                    put(batch_queue, batch)
+            finally:
+                for _ in range(self.embed_workers):
+                    put(batch_queue, _DONE)
+
+        @guarded
+        def embed_stage():
+            try:
+                while not stop.is_set():
+                    batch = get(batch_queue)
+                    if batch is _DONE:
+                        break
+                    started = time.perf_counter()
+                    vectors = self.embeddings.embed_documents([c.page_content for c in batch])
+                    record("embed", len(batch), started)
+                    put(vector_queue, (batch, vectors))
+            finally:
+                put(vector_queue, _DONE)
+
+        @guarded
+        def upsert_stage():
+            remaining = self.embed_workers
+            while remaining and not stop.is_set():
+                item = get(vector_queue)
+                if item is _DONE:
+                    remaining -= 1
+                    continue
+                batch, vectors = item
+                started = time.perf_counter()
+                self.upsert(
+                    [self.id_func(c) for c in batch],
+                    [c.page_content for c in batch],
+                    vectors,
+                    [dict(c.metadata) for c in batch],
+                )
+                record("upsert", len(batch), started)
+                done = []
+                with lock:
+                    report.chunks += len(batch)
+                    report.batches += 1
+                    if self.on_committed:
+                        for chunk in batch:
+                            source = chunk.metadata.get("source")
+                            if source in open_sources and settle(source, 1):
+                                done.append(source)
+                if self.on_progress:
+                    self.on_progress(report)
+                committed(done)
+
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(target=load_stage, name="ingest-load"),
+            threading.Thread(target=split_stage, name="ingest-split"),
+            threading.Thread(target=upsert_stage, name="ingest-upsert"),
+        ] + [
+            threading.Thread(target=embed_stage, name=f"ingest-embed-{i}")
+            for i in range(self.embed_workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        report.wall_seconds = time.perf_counter() - started
+
+        if errors:
+            raise errors[0]
+        return report
+
+
+# 测试：模拟较慢的嵌入模型，写入内存向量库
+if __name__ == "__main__":
+    import tempfile
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_core.vectorstores import InMemoryVectorStore
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    class SlowEmbedding(DeterministicFakeEmbedding):
+        def embed_documents(self, texts):
+            time.sleep(0.002 * len(texts))
+            return super().embed_documents(texts)
+
+    class MemoryStore(InMemoryVectorStore):
+        def add_embeddings(self, text_embeddings, metadatas, ids):
+            for (text, vector), metadata, doc_id in zip(text_embeddings, metadatas, ids):
+                self.store[doc_id] = {"id": doc_id, "vector": vector, "text": text, "metadata": metadata}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(50):
+            path = Path(tmp) / f"doc_{i}.txt"
+            path.write_text("\n\n".join(f"文档 {i} 第 {j} 段：LangChain RAG 入库流水线。" * 5 for j in range(20)), encoding="utf-8")
+            paths.append(path)
+
+        splitter = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=20, add_start_index=True)
+        embeddings = SlowEmbedding(size=16)
+
+        for workers in (1, 4):
+            store = MemoryStore(embedding=embeddings)
+            pipeline = IngestPipeline(
+                embeddings, vector_upserter(store), splitter=splitter,
+                embed_batch_size=32, embed_workers=workers,
+            )
+            report = pipeline.run(load_text_files(paths))
+            print(f"embed_workers={workers}: 向量库 {len(store.store)} 条")
+            print(report)
+
+        # 任一阶段出错：其余阶段退出，异常在 run() 中抛出
+        def failing_upsert(ids, texts, vectors, metadatas):
+            raise RuntimeError("向量库不可用")
+
+        try:
+            IngestPipeline(embeddings, failing_upsert, splitter=splitter).run(load_text_files(paths))
+        except RuntimeError as e:
+            print(f"写入失败时抛出: {e}")
@@ -0,0 +1,245 @@
+"""
+近似重复块去重：MinHash 签名 + LSH 分桶
+======================================
+
+重复导入内容相近的文件（示例每次运行都会重写 langchain_intro.txt / langchain_guide.txt），
+向量库里会留下大量几乎相同的块：占用索引内存，还会挤占 top-k 的位置。
+稳定 ID 只能去掉完全相同的块。
+
+NearDuplicateFilter 放在入库之前：
+- 每个块规范化（小写、合并空白）后取字符 n-gram（shingle），用 numpy 计算 MinHash 签名
+- 签名分成 bands 段，每段的哈希作为桶键：只有至少一段完全相同的块才会成为候选，
+  查找候选不需要和全部已保留的块比较
+- 候选的估计 Jaccard 相似度（签名相同位置的比例）>= threshold 时视为重复，丢弃后出现的块
+- bands / rows 按 threshold 自动选择（误判和漏判的加权面积最小）
+- report 记录处理和丢弃的块数、字节数，以及每个重复块对应保留的块
+
+相邻块之间的 chunk_overlap 只占块的一小部分，Jaccard 相似度很低，不会被误删。
+
+用法：
+    dedup = NearDuplicateFilter(threshold=0.8)
+    chunks = list(dedup.filter(chunks))        # 生成器，可直接交给 IngestPipeline.run
+    print(dedup.report)
+"""
+
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import numpy as np
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_SHINGLE_BASE = 1_000_003
+
+
+def _shingle_hashes(text, size):
+    """规范化文本的字符 n-gram，按多项式滚动哈希成 uint64（32 位范围内）"""
+    text = re.sub(r"\s+", " ", text.lower()).strip()
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) == 0:
+        return np.zeros(1, dtype=np.uint64)
+    width = min(size, len(codes))
+    hashes = np.zeros(len(codes) - width + 1, dtype=np.uint64)
+    for offset in range(width):
+        hashes = (hashes * np.uint64(_SHINGLE_BASE) + codes[offset:len(codes) - width + 1 + offset]) & np.uint64(_MAX_HASH)
+    return np.unique(hashes)
+
+
+def _false_positive_area(threshold, bands, rows):
+    s = np.linspace(0.0, threshold, 200)
+    return float(np.mean(1 - (1 - s ** rows) ** bands)) * threshold
+
+
+def _false_negative_area(threshold, bands, rows):
+    s = np.linspace(threshold, 1.0, 200)
+    return float(np.mean((1 - s ** rows) ** bands)) * (1 - threshold)
+
+
+def optimal_bands(threshold, num_perm, false_positive_weight=0.5):
+    """选择 (bands, rows)，使阈值两侧误判 / 漏判概率的加权面积最小"""
+    best, best_error = (1, num_perm), float("inf")
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            error = (false_positive_weight * _false_positive_area(threshold, bands, rows)
+                     + (1 - false_positive_weight) * _false_negative_area(threshold, bands, rows))
+            if error < best_error:
+                best, best_error = (bands, rows), error
+    return best
+
+
+class MinHasher:
+    """
+    MinHash 签名：num_perm 个形如 (a * x + b) mod p 的哈希函数，对每个取所有 shingle 的最小值
+
+    参数:
+        num_perm: 签名长度（哈希函数个数）
+        shingle_size: 字符 n-gram 的长度
+        seed: 随机种子（同一种子的签名可以互相比较）
+    """
+
+    def __init__(self, num_perm=128, shingle_size=5, seed=1):
+        if num_perm < 1 or shingle_size < 1:
+            raise ValueError("num_perm / shingle_size 必须大于 0")
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        hashes = _shingle_hashes(text, self.shingle_size)
+        # a * x 可能超过 64 位，按无符号整数回绕后再取模；各块使用相同的函数，签名仍可比较
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % np.uint64(_MERSENNE_PRIME)
+        return (permuted & np.uint64(_MAX_HASH)).min(axis=1).astype(np.uint32)
+
+
+class MinHashLSH:
+    """
+    LSH 索引：签名分成 bands 段，每段一个桶表
+
+    参数:
+        threshold: Jaccard 相似度阈值（用于自动选择 bands / rows）
+        num_perm: 签名长度
+        bands / rows: 手动指定分段方式（bands * rows <= num_perm）
+    """
+
+    def __init__(self, threshold=0.8, num_perm=128, bands=None, rows=None):
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold 必须在 (0, 1] 之间")
+        if bands is None or rows is None:
+            bands, rows = optimal_bands(threshold, num_perm)
+        if bands * rows > num_perm:
+            raise ValueError(f"bands * rows 不能超过 num_perm: {bands} * {rows} > {num_perm}")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = rows
+        self._tables = [defaultdict(list) for _ in range(bands)]
+        self._signatures = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def insert(self, key, signature):
+        self._signatures[key] = signature
+        for band, bucket in self._band_keys(signature):
+            self._tables[band][bucket].append(key)
+
+    def candidates(self, signature):
+        """至少有一段与 signature 相同的已插入键"""
+        found = set()
+        for band, bucket in self._band_keys(signature):
+            found.update(self._tables[band].get(bucket, ()))
+        return found
+
+    def query(self, signature, candidates=None):
+        """估计 Jaccard 相似度 >= threshold 的已插入键，返回 [(key, similarity)]，相似度从高到低"""
+        if candidates is None:
+            candidates = self.candidates(signature)
+        matches = []
+        for key in candidates:
+            similarity = float(np.mean(self._signatures[key] == signature))
+            if similarity >= self.threshold:
+                matches.append((key, similarity))
+        return sorted(matches, key=lambda item: -item[1])
+
+
+@dataclass
+class DedupReport:
+    """去重结果"""
+    chunks: int = 0
+    removed: int = 0
+    bytes_in: int = 0
+    bytes_removed: int = 0
+    candidates: int = 0         # LSH 返回的候选总数（需要比较签名的次数）
+    seconds: float = 0.0
+    duplicates: list = field(default_factory=list)   # (重复块序号, 保留块序号, 相似度)
+
+    @property
+    def kept(self):
+        return self.chunks - self.removed
+
+    def __str__(self):
+        ratio = self.bytes_removed / self.bytes_in if self.bytes_in else 0.0
+        return (f"近似去重: {self.chunks} 块中去掉 {self.removed} 块，保留 {self.kept}；"
+                f"去掉 {self.bytes_removed:,} / {self.bytes_in:,} 字节（{ratio:.0%}）；"
+                f"候选比较 {self.candidates} 次，耗时 {self.seconds:.2f}s")
+
+
+class NearDuplicateFilter:
+    """
+    入库前的近似重复块过滤器（状态跨多次 filter 调用保留，可分批处理同一批数据）
+
+    参数:
+        threshold: 估计 Jaccard 相似度达到该值视为重复
+        num_perm: MinHash 签名长度（越长估计越准，越慢）
+        shingle_size: 字符 n-gram 长度（中文 3~5 较合适）
+        seed: MinHash 随机种子
+    """
+
+    def __init__(self, threshold=0.8, num_perm=128, shingle_size=5, seed=1):
+        self.hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size, seed=seed)
+        self.lsh = MinHashLSH(threshold=threshold, num_perm=num_perm)
+        self.report = DedupReport()
+
+    def is_duplicate(self, text):
+        """text 是否与已保留的块近似重复；不是时把它加入索引。返回 (保留块序号, 相似度) 或 None"""
+        index = self.report.chunks
+        self.report.chunks += 1
+        size = len(text.encode("utf-8"))
+        self.report.bytes_in += size
+        signature = self.hasher.signature(text)
+        candidates = self.lsh.candidates(signature)
+        self.report.candidates += len(candidates)
+        matches = self.lsh.query(signature, candidates)
+        if matches:
+            kept, similarity = matches[0]
+            self.report.removed += 1
+            self.report.bytes_removed += size
+            self.report.duplicates.append((index, kept, similarity))
+            return kept, similarity
+        self.lsh.insert(index, signature)
+        return None
+
+    def filter(self, chunks):
+        """逐个产出不重复的块（保留先出现的）"""
+        for chunk in chunks:
+            started = time.perf_counter()
+            duplicate = self.is_duplicate(chunk.page_content)
+            self.report.seconds += time.perf_counter() - started
+            if duplicate is None:
+                yield chunk
+
+
+# 测试：两份改写过的文档，重复块被去掉，相邻块的重叠不受影响
+if __name__ == "__main__":
+    from langchain_core.documents import Document
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    paragraphs = [f"第{i}段：LangChain 的组件 {i} 负责检索、嵌入和向量存储中的第 {i} 个步骤，"
+                  f"它把外部知识提供给大模型并记录每一步的中间结果。" for i in range(60)]
+    original = "\n\n".join(paragraphs)
+    rewritten = "\n\n".join(p.replace("大模型", "LLM") if i % 3 == 0 else p for i, p in enumerate(paragraphs))
+    splitter = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=50)
+    chunks = splitter.split_documents([
+        Document(page_content=original, metadata={"source": "langchain_intro.txt"}),
+        Document(page_content=rewritten, metadata={"source": "langchain_guide.txt"}),
+    ])
+
+    dedup = NearDuplicateFilter(threshold=0.8)
+    kept = list(dedup.filter(chunks))
+    print(f"LSH 分段: {dedup.lsh.bands} 段 × {dedup.lsh.rows} 行")
+    print(dedup.report)
+    sources = {c.metadata["source"] for c in kept}
+    print(f"保留的块来自: {sorted(sources)}")
+
+    # 只有一份文档时，相邻块之间的重叠不会被当成重复
+    single = NearDuplicateFilter(threshold=0.8)
+    first_half = [c for c in chunks if c.metadata["source"] == "langchain_intro.txt"]
+    print(f"单个文档: {len(list(single.filter(first_half)))} / {len(first_half)} 块保留")
@@ -0,0 +1,230 @@
+"""
+检索结果缓存：精确匹配 + 语义相似两级缓存
+========================================
+
+Agent 经常在同一轮对话里、或不同线程之间重复（或换个说法）调用 search_knowledge_base，
+每次都要重新检索。RetrievalCache 放在检索器前面：
+
+- 第一级：规范化后的查询文本（Unicode NFKC、小写、合并空白、去掉末尾标点）精确匹配，LRU 淘汰
+- 第二级：精确未命中时计算查询向量，与已缓存查询的向量比较余弦相似度，
+  超过 similarity_threshold 就复用那次的结果（并把新说法也记入第一级）
+- 每条结果有 TTL，过期后重新检索
+- 重新索引后调用 invalidate() 清空；清空前已经开始的检索不会把旧结果写回缓存
+- stats 记录两级的命中次数和命中率
+
+查询向量用 embeddings.embed_query 计算；配合 CachedEmbeddings 时，
+未命中后检索器再次嵌入同一个查询会直接命中嵌入缓存，不会算两遍。
+
+用法：
+    cache = RetrievalCache(embeddings, ttl_seconds=600)
+    docs = cache.get_or_search(query, lambda q: vectorstore.similarity_search(q, k=3))
+    search = cache.wrap(retriever.invoke)      # 或者包装成函数
+    print(cache.stats)
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+_TRAILING_PUNCTUATION = "?？。.!！,，;；:：~～ "
+
+
+def normalize_query(query):
+    """规范化查询文本：NFKC（全角转半角）、小写、合并空白、去掉末尾标点"""
+    text = unicodedata.normalize("NFKC", query).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(_TRAILING_PUNCTUATION)
+
+
+@dataclass
+class CacheStats:
+    """缓存统计"""
+    exact_hits: int = 0
+    semantic_hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+
+    @property
+    def lookups(self):
+        return self.exact_hits + self.semantic_hits + self.misses
+
+    @property
+    def hit_rate(self):
+        return (self.exact_hits + self.semantic_hits) / self.lookups if self.lookups else 0.0
+
+    def __str__(self):
+        return (f"查询 {self.lookups} 次：精确命中 {self.exact_hits}，语义命中 {self.semantic_hits}，"
+                f"未命中 {self.misses}（命中率 {self.hit_rate:.0%}）；"
+                f"过期 {self.expired}，淘汰 {self.evictions}，清空 {self.invalidations}")
+
+
+@dataclass
+class _Entry:
+    result: object
+    created: float
+    vector: np.ndarray = None
+
+
+class RetrievalCache:
+    """
+    两级检索缓存
+
+    参数:
+        embeddings: 用于语义匹配的嵌入模型；为 None 时只有精确匹配
+        max_entries: 最多缓存的查询数（LRU 淘汰）
+        ttl_seconds: 结果的有效期；为 None 时不过期
+        similarity_threshold: 语义命中所需的最低余弦相似度
+        clock: 时间函数（测试时可替换）
+    """
+
+    def __init__(self, embeddings=None, max_entries=256, ttl_seconds=600, similarity_threshold=0.92,
+                 clock=time.monotonic):
+        self.embeddings = embeddings
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.clock = clock
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._matrix = None         # 语义层：缓存查询向量堆叠成的矩阵（按需重建）
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def invalidate(self):
+        """清空缓存（重新索引后调用）"""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._generation += 1
+            self.stats.invalidations += 1
+
+    def _expired(self, entry, now):
+        return self.ttl_seconds is not None and now - entry.created > self.ttl_seconds
+
+    def _remove(self, key):
+        del self._entries[key]
+        self._matrix = None
+
+    def _lookup_exact(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry, now):
+            self._remove(key)
+            self.stats.expired += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _lookup_semantic(self, vector, now):
+        if self._matrix is None:
+            self._matrix_keys = [k for k, e in self._entries.items() if e.vector is not None]
+            self._matrix = (
+                np.vstack([self._entries[k].vector for k in self._matrix_keys]) if self._matrix_keys else None
+            )
+        if self._matrix is None:
+            return None
+        scores = self._matrix @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        return self._lookup_exact(self._matrix_keys[best], now)
+
+    def _embed(self, query):
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._matrix = None
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def get_or_search(self, query, search):
+        """返回 query 的检索结果：命中缓存时直接返回，否则调用 search(query) 并缓存"""
+        key = normalize_query(query)
+        with self._lock:
+            now = self.clock()
+            entry = self._lookup_exact(key, now)
+            if entry is not None:
+                self.stats.exact_hits += 1
+                return entry.result
+            generation = self._generation
+
+        vector = self._embed(query) if self.embeddings is not None else None
+        if vector is not None:
+            with self._lock:
+                entry = self._lookup_semantic(vector, self.clock())
+                if entry is not None:
+                    self.stats.semantic_hits += 1
+                    # 新说法也记入精确层，沿用原结果的创建时间（TTL 不会被续期）
+                    self._store(key, _Entry(entry.result, entry.created, vector))
+                    return entry.result
+
+        result = search(query)
+        with self._lock:
+            self.stats.misses += 1
+            # 检索期间发生了 invalidate()：结果可能来自旧索引，不写入缓存
+            if generation == self._generation:
+                self._store(key, _Entry(result, self.clock(), vector))
+        return result
+
+    def wrap(self, search):
+        """把 search(query) 包装成带缓存的函数"""
+        def cached_search(query):
+            return self.get_or_search(query, search)
+        return cached_search
+
+
+# 测试：精确命中、语义命中、TTL 和 invalidate
+if __name__ == "__main__":
+    from langchain_core.embeddings import Embeddings
+
+    class KeywordEmbeddings(Embeddings):
+        """按关键词出现与否构造向量，同义说法的向量相同"""
+        keywords = ["langchain", "组件", "rag", "性能", "bm25"]
+
+        def embed_documents(self, texts):
+            return [self.embed_query(t) for t in texts]
+
+        def embed_query(self, text):
+            text = text.lower()
+            return [1.0 if k in text else 0.0 for k in self.keywords] + [0.1]
+
+    now = [0.0]
+    cache = RetrievalCache(KeywordEmbeddings(), ttl_seconds=60, clock=lambda: now[0])
+    calls = []
+
+    def search(query):
+        calls.append(query)
+        return [f"关于「{query}」的文档"]
+
+    for query in [
+        "LangChain 有哪些核心组件？",
+        "langchain   有哪些核心组件",     # 规范化后相同 -> 精确命中
+        "LangChain 的组件都有什么",       # 换个说法 -> 语义命中
+        "如何优化 RAG 性能？",            # 新问题 -> 未命中
+    ]:
+        print(f"{query!r:<28} -> {cache.get_or_search(query, search)}")
+    print(cache.stats)
+    print(f"实际检索 {len(calls)} 次")
+
+    now[0] += 61
+    cache.get_or_search("如何优化 RAG 性能？", search)
+    cache.invalidate()
+    cache.get_or_search("LangChain 有哪些核心组件？", search)
+    print(f"过期 + 清空后: {cache.stats}")
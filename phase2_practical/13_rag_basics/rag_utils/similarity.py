@@ -0,0 +1,231 @@
+"""
+向量相似度：预归一化矩阵 + 矩阵乘法
+==================================
+
+示例 3 原来对 Python 列表逐对调用 np.dot / np.linalg.norm，每算一对都要重新求范数。
+SimilarityMatrix 把嵌入一次性归一化后存成连续的矩阵，余弦相似度就是内积：
+
+- 查询 vs 全部向量、全部向量两两之间，都是一次 BLAS 矩阵乘法
+- 存储精度可选 float32 / float16 / int8（每行一个缩放系数），内存分别为 4 / 2 / 1 字节每维
+- top_k / all_pairs_top_k / pairs_above 按块计算，只保留每块的前 k 个，
+  内存占用与 chunk_size 成正比，不需要生成完整的 n × n 相似度矩阵
+- save / load(mmap=True)：矩阵存成 .npy，内存放不下时从磁盘映射，按块读取
+
+用法：
+    matrix = SimilarityMatrix(embeddings.embed_documents(texts), dtype="float16")
+    scores, rows = matrix.top_k(embeddings.embed_query("RAG 是什么"), k=5)
+    matrix.all_pairs()                        # n × n 余弦相似度（小矩阵）
+    for i, j, score in matrix.pairs_above(0.95):   # 近似重复
+        ...
+    matrix.save("sim_index"); SimilarityMatrix.load("sim_index", mmap=True)
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+DTYPES = ("float32", "float16", "int8")
+
+
+def normalize_rows(vectors):
+    """转成 float32 连续矩阵并按行做 L2 归一化（零向量保持为零）"""
+    matrix = np.array(vectors, dtype=np.float32, ndmin=2, copy=True, order="C")
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def cosine_similarity(a, b):
+    """两组向量之间的余弦相似度矩阵（len(a) × len(b)）；传入单个向量时返回标量"""
+    single = np.ndim(a) == 1 and np.ndim(b) == 1
+    scores = normalize_rows(a) @ normalize_rows(b).T
+    return float(scores[0, 0]) if single else scores
+
+
+def _merge_top_k(best_scores, best_rows, scores, offset, k):
+    """把一块分数合并进当前的前 k 个（每行独立）"""
+    if scores.shape[1] > k:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, part, axis=1)
+        rows = part + offset
+    else:
+        rows = np.broadcast_to(np.arange(offset, offset + scores.shape[1]), scores.shape)
+    all_scores = np.concatenate([best_scores, scores], axis=1)
+    all_rows = np.concatenate([best_rows, rows], axis=1)
+    keep = np.argpartition(-all_scores, k - 1, axis=1)[:, :k] if all_scores.shape[1] > k else None
+    if keep is None:
+        return all_scores, all_rows
+    return np.take_along_axis(all_scores, keep, axis=1), np.take_along_axis(all_rows, keep, axis=1)
+
+
+class SimilarityMatrix:
+    """
+    预归一化的嵌入矩阵
+
+    参数:
+        vectors: 嵌入向量（n × d），会先归一化
+        dtype: 存储精度，"float32"、"float16" 或 "int8"
+        chunk_size: 分块计算时每块的行数
+    """
+
+    def __init__(self, vectors, dtype="float32", chunk_size=8192):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype 必须是 {DTYPES} 之一: {dtype}")
+        if chunk_size < 1:
+            raise ValueError("chunk_size 必须大于 0")
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+        self.scales = None
+        normalized = normalize_rows(vectors)
+        if dtype == "float32":
+            self.data = normalized
+        elif dtype == "float16":
+            self.data = normalized.astype(np.float16)
+        else:
+            # 对称量化：每行按最大绝对值缩放到 [-127, 127]
+            peak = np.abs(normalized).max(axis=1)
+            self.scales = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+            self.data = np.rint(normalized / self.scales[:, None]).astype(np.int8)
+
+    @classmethod
+    def _from_arrays(cls, data, scales, dtype, chunk_size):
+        matrix = cls.__new__(cls)
+        matrix.data, matrix.scales, matrix.dtype, matrix.chunk_size = data, scales, dtype, chunk_size
+        return matrix
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    @property
+    def dimension(self):
+        return self.data.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def rows(self, start, stop):
+        """第 start 到 stop 行，解码为 float32（int8 乘回缩放系数）"""
+        block = self.data[start:stop]
+        if self.dtype == "float32":
+            return np.asarray(block)
+        block = block.astype(np.float32)
+        if self.scales is not None:
+            block *= self.scales[start:stop, None]
+        return block
+
+    def _chunks(self):
+        for start in range(0, len(self), self.chunk_size):
+            yield start, self.rows(start, start + self.chunk_size)
+
+    def similarities(self, queries):
+        """queries（单个或多个向量）与全部向量的余弦相似度，形状 (len(queries), n)"""
+        q = normalize_rows(queries)
+        if self.dtype == "float32":
+            return q @ self.data.T
+        return np.concatenate([q @ block.T for _, block in self._chunks()], axis=1)
+
+    def top_k(self, queries, k=5):
+        """
+        每个查询最相似的 k 个向量，按相似度从高到低
+
+        返回 (scores, rows)；传入单个向量时形状为 (k,)，多个时为 (len(queries), k)
+        """
+        single = np.ndim(queries) == 1
+        q = normalize_rows(queries)
+        scores, rows = self._top_k_normalized(q, k)
+        return (scores[0], rows[0]) if single else (scores, rows)
+
+    def _top_k_normalized(self, q, k, exclude_offset=None):
+        k = min(k, len(self) - (1 if exclude_offset is not None else 0))
+        best_scores = np.empty((len(q), 0), dtype=np.float32)
+        best_rows = np.empty((len(q), 0), dtype=np.int64)
+        if k <= 0:
+            return best_scores, best_rows
+        for start, block in self._chunks():
+            scores = q @ block.T
+            if exclude_offset is not None:
+                # all_pairs_top_k：排除查询自身
+                own = np.arange(len(q)) + exclude_offset - start
+                inside = (own >= 0) & (own < scores.shape[1])
+                scores[np.nonzero(inside)[0], own[inside]] = -np.inf
+            best_scores, best_rows = _merge_top_k(best_scores, best_rows, scores, start, k)
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_rows, order, axis=1)
+
+    def all_pairs(self):
+        """全部向量两两之间的余弦相似度（n × n，适合小矩阵）"""
+        return np.concatenate([block @ self.rows(0, len(self)).T for _, block in self._chunks()], axis=0)
+
+    def all_pairs_top_k(self, k=5):
+        """每个向量最相似的 k 个其他向量，返回 (scores, rows)，形状 (n, k)；按块计算"""
+        results = [self._top_k_normalized(block, k, exclude_offset=start) for start, block in self._chunks()]
+        return np.concatenate([s for s, _ in results]), np.concatenate([r for _, r in results])
+
+    def pairs_above(self, threshold):
+        """逐个生成相似度 >= threshold 的向量对 (i, j, score)，i < j；用于查找近似重复"""
+        for start, block in self._chunks():
+            # 只需要和自己及之后的块比较（上三角）
+            for other_start in range(start, len(self), self.chunk_size):
+                other = block if other_start == start else self.rows(other_start, other_start + self.chunk_size)
+                scores = block @ other.T
+                rows, cols = np.nonzero(scores >= threshold)
+                for r, c in zip(rows, cols):
+                    i, j = start + int(r), other_start + int(c)
+                    if i < j:
+                        yield i, j, float(scores[r, c])
+
+    def save(self, folder):
+        """保存为 folder/vectors.npy（int8 另存 scales.npy）和 meta.json"""
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        np.save(folder / "vectors.npy", self.data)
+        if self.scales is not None:
+            np.save(folder / "scales.npy", self.scales)
+        meta = {"dtype": self.dtype, "count": len(self), "dimension": self.dimension}
+        (folder / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+    @classmethod
+    def load(cls, folder, mmap=True, chunk_size=8192):
+        """加载 save() 保存的矩阵；mmap=True 时从磁盘映射（只读，按块读取）"""
+        folder = Path(folder)
+        meta = json.loads((folder / "meta.json").read_text(encoding="utf-8"))
+        mode = "r" if mmap else None
+        data = np.load(folder / "vectors.npy", mmap_mode=mode)
+        scales = np.load(folder / "scales.npy") if meta["dtype"] == "int8" else None
+        return cls._from_arrays(data, scales, meta["dtype"], chunk_size)
+
+
+# 测试：逐对计算 vs 矩阵乘法，以及不同存储精度的误差
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    rng = np.random.default_rng(0)
+    corpus = rng.standard_normal((20_000, 384)).astype(np.float32)
+    queries = corpus[:100] + 0.1 * rng.standard_normal((100, 384)).astype(np.float32)
+
+    started = time.perf_counter()
+    naive = [[float(np.dot(q, v) / (np.linalg.norm(q) * np.linalg.norm(v))) for v in corpus[:2000]]
+             for q in queries[:10]]
+    naive_seconds = (time.perf_counter() - started) * (100 / 10) * (len(corpus) / 2000)
+    print(f"逐对计算（估算 100 × {len(corpus)}）: {naive_seconds:.2f}s")
+
+    exact = SimilarityMatrix(corpus)
+    assert np.allclose(exact.similarities(queries[:10])[:, :2000], naive, atol=1e-5)
+    for dtype in DTYPES:
+        matrix = SimilarityMatrix(corpus, dtype=dtype, chunk_size=4096)
+        started = time.perf_counter()
+        scores, rows = matrix.top_k(queries, k=10)
+        seconds = time.perf_counter() - started
+        error = np.abs(matrix.similarities(queries[:10]) - exact.similarities(queries[:10])).max()
+        print(f"{dtype:>7}: {matrix.nbytes / 1e6:6.1f} MB，top_k {seconds * 1000:6.1f} ms，"
+              f"最大误差 {error:.4f}，top1 正确 {np.mean(rows[:, 0] == np.arange(100)):.0%}")
+
+    with tempfile.TemporaryDirectory() as folder:
+        SimilarityMatrix(corpus[:5000], dtype="int8").save(folder)
+        mapped = SimilarityMatrix.load(folder, mmap=True, chunk_size=1000)
+        pair_scores, pair_rows = mapped.all_pairs_top_k(k=3)
+        print(f"mmap 加载 {len(mapped)} 行，all_pairs_top_k: {pair_scores.shape}，"
+              f"自身被排除: {not np.any(pair_rows == np.arange(len(mapped))[:, None])}")
@@ -0,0 +1,307 @@
+"""
+流式加载 + 分割：大文件按窗口读取，逐块生成 Document
+=================================================
+
+TextLoader(path).load() 会把整个文件读成一个字符串，
+splitter.split_documents() 再一次性生成全部文档块的列表，
+文件越大，峰值内存越高。
+
+StreamingTextLoader 按固定大小的窗口读取文件（增量解码，不会切断多字节字符），
+只在内存中保留一个窗口左右的文本，逐块 yield：
+- 窗口在最后一个一级分隔符（默认 "\n\n"）处截断，保证每个段落是完整的
+- 段落的处理与 RecursiveCharacterTextSplitter 相同：短段落攒起来贪心合并，
+  过长的段落用下一级分隔符单独分割
+- 攒够一个窗口时，输出除最后一块外的所有块；最后一块从它的第一个段落（按分段下标，
+  包括只有空白的分段）开始保留下来，和后面的段落一起重新合并（贪心合并从块的起点重新开始，结果不变）
+- 每块的 metadata 记录字符偏移 start_index 和字节偏移 byte_start / byte_end
+
+只要单个段落不超过 16 个窗口，并且一级分隔符在文件的前 16 个窗口内出现过（否则按文件开头选择的
+分隔符可能与整文件不同），生成的块与整文件 split_text 的结果完全相同，峰值内存与文件大小无关。
+
+用法：
+    splitter = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=50)
+    loader = StreamingTextLoader("big.txt", splitter)
+    for chunk in loader.lazy_load():
+        ...
+"""
+
+import codecs
+import re
+from typing import Iterator
+
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+from langchain_text_splitters.character import _split_text_with_regex
+
+# 默认每次读取 1 MiB
+DEFAULT_WINDOW_BYTES = 1 << 20
+# 单个段落超过这么多个窗口仍没有分隔符时强制截断（保证内存有上限）
+_MAX_PARAGRAPH_WINDOWS = 16
+
+
+def _greedy_merge(splitter, splits, separator):
+    """
+    与 TextSplitter._merge_splits 相同的贪心合并，但记录分段下标
+
+    返回 (已确定的块, start)：splits[start:] 是最后一块（后面还有段落时会继续合并）。
+    从 splits[start] 开始重新合并，结果与不中断时相同；按下标而不是按块文本定位，
+    块首被 strip 掉的空白分段（如连续的 "\n\n"）也会保留下来
+    """
+    length = splitter._length_function
+    separator_len = length(separator)
+    size, overlap = splitter._chunk_size, splitter._chunk_overlap
+    chunks = []
+    start, total = 0, 0         # 当前块是 splits[start:i]
+    for i, split in enumerate(splits):
+        len_ = length(split)
+        if i > start and total + len_ + separator_len > size:
+            chunk = splitter._join_docs(splits[start:i], separator)
+            if chunk is not None:
+                chunks.append(chunk)
+            while total > overlap or (total + len_ + (separator_len if i > start else 0) > size and total > 0):
+                total -= length(splits[start]) + (separator_len if i - start > 1 else 0)
+                start += 1
+        total += len_ + (separator_len if i > start else 0)
+    return chunks, start
+
+
+class StreamingTextLoader(BaseLoader):
+    """
+    边读边分割的文本加载器
+
+    参数:
+        file_path: 文本文件路径
+        splitter: RecursiveCharacterTextSplitter 实例（分隔符、chunk_size、chunk_overlap 都沿用它的设置）
+        encoding: 文件编码
+        window_bytes: 每次读取的字节数
+    """
+
+    def __init__(self, file_path, splitter, encoding="utf-8", window_bytes=DEFAULT_WINDOW_BYTES):
+        self.file_path = str(file_path)
+        self.splitter = splitter
+        self.encoding = encoding
+        self.window_bytes = window_bytes
+
+    def _pattern(self, separator):
+        return separator if self.splitter._is_separator_regex else re.escape(separator)
+
+    def _choose_separators(self, sample):
+        """与 splitter 相同：取第一个出现过的分隔符（这里只看文件开头的 sample）"""
+        separators = self.splitter._separators
+        for i, separator in enumerate(separators):
+            if not separator or re.search(self._pattern(separator), sample):
+                return separator, separators[i + 1:]
+        return separators[-1], []
+
+    def _boundary(self, text, separator):
+        """最后一个完整段落的结束位置（下一段从这里开始）；找不到返回 -1"""
+        matches = list(re.finditer(self._pattern(separator), text))
+        if not matches:
+            return -1
+        # keep_separator="end" 时分隔符属于前一段，否则属于后一段
+        last = matches[-1]
+        return last.end() if self.splitter._keep_separator == "end" else last.start()
+
+    def _read_windows(self):
+        """按窗口读取并增量解码"""
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        with open(self.file_path, "rb") as f:
+            while True:
+                raw = f.read(self.window_bytes)
+                if not raw:
+                    tail = decoder.decode(b"", final=True)
+                    if tail:
+                        yield tail
+                    return
+                yield decoder.decode(raw)
+
+    def lazy_load(self) -> Iterator[Document]:
+        splitter = self.splitter
+        length = splitter._length_function
+        windows = self._read_windows()
+        # 读到第一个一级分隔符为止，据此选择分隔符
+        first = ""
+        for window in windows:
+            first += window
+            if len(first) >= _MAX_PARAGRAPH_WINDOWS * self.window_bytes or re.search(
+                self._pattern(splitter._separators[0]), first
+            ):
+                break
+        separator, sub_separators = self._choose_separators(first)
+        merge_separator = "" if splitter._keep_separator else separator
+
+        # region：尚未输出的原文，从 pending 第一段开始；region_char / region_byte 是它在文件中的偏移
+        region, region_char, region_byte = "", 0, 0
+        pending = []            # [(段落文本, 在 region 中的偏移)]
+        pending_len = 0
+        tail = first            # 还没切成完整段落的文本
+        overlap = splitter._chunk_overlap
+        last_start, last_len = 0, overlap   # 上一个输出块的位置，用于查找下一块（同 add_start_index）
+
+        def locate(chunks):
+            # 块在 region 中的偏移：从上一块的末尾减去 overlap 处开始查找
+            located = []
+            index, previous_len = last_start - region_char, last_len
+            for chunk in chunks:
+                index = region.find(chunk, max(0, index + previous_len - overlap))
+                located.append((chunk, index))
+                previous_len = len(chunk)
+            return located
+
+        # 字节偏移游标（region 内的字符偏移 -> 文件中的字节偏移），只对相邻两块之间的文本编码
+        cursor_char, cursor_byte = 0, 0
+
+        def byte_offset(start):
+            nonlocal cursor_char, cursor_byte
+            if start >= cursor_char:
+                cursor_byte += len(region[cursor_char:start].encode(self.encoding))
+            else:
+                # 很短的块可能在上一块的重叠区内找到更早的位置
+                cursor_byte -= len(region[start:cursor_char].encode(self.encoding))
+            cursor_char = start
+            return cursor_byte
+
+        def emit(located):
+            nonlocal last_start, last_len
+            for chunk, start in located:
+                last_start, last_len = region_char + start, len(chunk)
+                byte_start = byte_offset(start)
+                yield Document(
+                    page_content=chunk,
+                    metadata={
+                        "source": self.file_path,
+                        "start_index": region_char + start,
+                        "byte_start": byte_start,
+                        "byte_end": byte_start + len(chunk.encode(self.encoding)),
+                    },
+                )
+
+        def drop(position):
+            # 丢弃 region 中 position 之前已经输出的原文
+            nonlocal region, region_char, region_byte, pending, cursor_char
+            region_byte = byte_offset(position)
+            region_char += position
+            region = region[position:]
+            cursor_char = 0
+            pending = [(piece, offset - position) for piece, offset in pending]
+
+        def merge_pending():
+            return splitter._merge_splits([p for p, _ in pending], merge_separator)
+
+        def process(text, final):
+            nonlocal region, pending, pending_len
+            base = len(region)      # text[0] 在 region 中的偏移
+            region += text
+            position = 0
+            for piece in _split_text_with_regex(
+                text, self._pattern(separator), keep_separator=splitter._keep_separator
+            ):
+                position = text.find(piece, position)
+                offset = base + position
+                position += len(piece)
+                if length(piece) < splitter._chunk_size:
+                    pending.append((piece, offset))
+                    pending_len += len(piece)
+                    continue
+                # 过长的段落：先输出已攒的段落，再用下一级分隔符单独分割它
+                if pending:
+                    yield from emit(locate(merge_pending()))
+                pieces = splitter._split_text(piece, sub_separators) if sub_separators else [piece]
+                yield from emit(locate(pieces))
+                pending, pending_len = [], 0
+
+            if final:
+                if pending:
+                    yield from emit(locate(merge_pending()))
+                return
+
+            if pending_len >= self.window_bytes:
+                # 输出除最后一块外的所有块；最后一块从它的第一个段落开始保留，
+                # 与后面的段落一起重新合并（贪心合并从块的起点重新开始，结果不变）
+                chunks, keep = _greedy_merge(splitter, [p for p, _ in pending], merge_separator)
+                if keep > 0:
+                    yield from emit(locate(chunks))
+                    pending_len -= sum(len(p) for p, _ in pending[:keep])
+                    pending = pending[keep:]
+
+            # 每个窗口只截断一次 region：保留未输出的段落，以及上一块（查找下一块时要回看 overlap）
+            keep_from = min(pending[0][1] if pending else len(region), max(0, last_start - region_char))
+            drop(keep_from)
+
+        for window in windows:
+            tail += window
+            if len(tail) < self.window_bytes:
+                continue
+            cut = self._boundary(tail, separator) if separator else len(tail)
+            if cut <= 0:
+                # 没有分隔符的超长段落：超过 _MAX_PARAGRAPH_WINDOWS 个窗口时强制截断
+                if len(tail) < _MAX_PARAGRAPH_WINDOWS * self.window_bytes:
+                    continue
+                cut = len(tail)
+            yield from process(tail[:cut], final=False)
+            tail = tail[cut:]
+
+        yield from process(tail, final=True)
+
+
+def stream_split_files(paths, splitter, encoding="utf-8", window_bytes=DEFAULT_WINDOW_BYTES):
+    """依次流式分割多个文件，生成全部文档块"""
+    for path in paths:
+        yield from StreamingTextLoader(path, splitter, encoding, window_bytes).lazy_load()
+
+
+# 测试：与整文件分割的结果对比，并测量不同文件大小下的峰值内存
+if __name__ == "__main__":
+    import random
+    import tempfile
+    import time
+    import tracemalloc
+    from pathlib import Path
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=200, chunk_overlap=50,
+        separators=["\n\n", "\n", "。", "！", "？", " ", ""],
+    )
+    rng = random.Random(0)
+    words = ["LangChain", "检索", "增强", "生成", "向量", "数据库", "分割", "嵌入", "RAG", "文档"]
+
+    def make_text(paragraphs):
+        return "\n\n".join(
+            "\n".join(
+                "".join(rng.choice(words) for _ in range(rng.randint(3, 40))) + "。"
+                for _ in range(rng.randint(1, 6))
+            )
+            for _ in range(paragraphs)
+        )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 1. 小窗口下与整文件分割逐块对比
+        path = Path(tmp) / "sample.txt"
+        text = make_text(2000)
+        path.write_text(text, encoding="utf-8")
+        expected = splitter.split_text(text)
+        streamed = list(StreamingTextLoader(path, splitter, window_bytes=4096).lazy_load())
+        same = [d.page_content for d in streamed] == expected
+        raw = path.read_bytes()
+        offsets_ok = all(
+            raw[d.metadata["byte_start"]:d.metadata["byte_end"]].decode("utf-8") == d.page_content
+            and text[d.metadata["start_index"]:].startswith(d.page_content)
+            for d in streamed
+        )
+        print(f"与整文件分割一致: {same}（{len(streamed)} 块），偏移正确: {offsets_ok}")
+
+        # 2. 峰值内存与文件大小无关
+        for paragraphs in (5_000, 50_000):
+            path = Path(tmp) / f"big_{paragraphs}.txt"
+            path.write_text(make_text(paragraphs), encoding="utf-8")
+            size_mb = path.stat().st_size / 1e6
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            count = sum(1 for _ in StreamingTextLoader(path, splitter).lazy_load())
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{size_mb:6.1f} MB: {count} 块，{elapsed:.1f}s，峰值内存 {peak / 1e6:.1f} MB")
@@ -3,12 +3,16 @@
 """
 
 import os
+import sys
 from pathlib import Path
 
 # 获取脚本所在目录
 SCRIPT_DIR = Path(__file__).parent
 DATA_DIR = SCRIPT_DIR / "data"
 
+# 添加 rag_utils 目录到路径
+sys.path.insert(0, str(SCRIPT_DIR / "rag_utils"))
+
 # 确保 data 目录存在
 DATA_DIR.mkdir(exist_ok=True)
 
@@ -119,6 +123,421 @@ except Exception as e:
     print(f"\n[SKIP] 向量嵌入跳过（可能网络问题）: {e}")
 
 
+# ============================================================================
+# 测试 4：嵌入缓存（使用假 Embeddings，无需下载模型）
+# ============================================================================
+print("\n--- 测试 4: 嵌入缓存 ---")
+
+import tempfile
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from embedding_cache import CachedEmbeddings
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    """记录模型实际被调用的文本数"""
+    calls: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return super().embed_documents(texts)
+
+
+with tempfile.TemporaryDirectory() as cache_dir:
+    texts = [chunk.page_content for chunk in chunks]
+
+    base = CountingEmbedding(size=16)
+    cached = CachedEmbeddings(base, cache_dir=cache_dir)
+    first = cached.embed_documents(texts)
+    cached.close()
+
+    # 模拟重启：重新打开同一个缓存目录
+    base_restarted = CountingEmbedding(size=16)
+    cached = CachedEmbeddings(base_restarted, cache_dir=cache_dir)
+    second = cached.embed_documents(texts)
+    stats = cached.stats()
+    cached.close()
+
+    assert base_restarted.calls == 0, "重启后不应再调用模型"
+    assert [[round(v, 5) for v in vec] for vec in first] == [[round(v, 5) for v in vec] for vec in second]
+
+with tempfile.TemporaryDirectory() as cache_dir:
+    # 命中 + 未命中超过容量时，本批次命中的向量不能被新向量覆盖
+    small = CachedEmbeddings(CountingEmbedding(size=16), cache_dir=cache_dir, max_entries=3)
+    small.embed_documents(["a", "b", "c"])
+    mixed = small.embed_documents(["a", "b", "c", "d"])
+    small.close()
+    expected = DeterministicFakeEmbedding(size=16).embed_documents(["a", "b", "c", "d"])
+    assert [[round(v, 5) for v in vec] for vec in mixed] == [[round(v, 5) for v in vec] for vec in expected]
+
+    print(f"\n[OK] 嵌入缓存生效")
+    print(f"  首次模型调用: {base.calls} 条")
+    print(f"  重启后模型调用: {base_restarted.calls} 条")
+    print(f"  命中率: {stats['hit_rate']:.0%}")
+
+
+# ============================================================================
+# 测试 5：批量入库流水线（写入本地 Chroma，不需要 Pinecone）
+# ============================================================================
+print("\n--- 测试 5: 批量入库流水线 ---")
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import Chroma
+from ingest_pipeline import IngestPipeline, vector_upserter
+
+with tempfile.TemporaryDirectory() as chroma_dir:
+    fake_embeddings = DeterministicFakeEmbedding(size=16)
+    store = Chroma(persist_directory=chroma_dir, embedding_function=fake_embeddings)
+    pipeline = IngestPipeline(
+        fake_embeddings,
+        vector_upserter(store),
+        splitter=RecursiveCharacterTextSplitter(chunk_size=50, chunk_overlap=10, add_start_index=True),
+        embed_batch_size=2,
+        embed_workers=2,
+    )
+    report = pipeline.run(documents)
+
+    assert len(store.get()["ids"]) == report.chunks, "写入数量应与流水线统计一致"
+    pipeline.run(documents)
+    assert len(store.get()["ids"]) == report.chunks, "重复入库应按 ID 覆盖，不产生重复"
+
+    print(f"\n[OK] 流水线入库完成")
+    print(report)
+
+
+# ============================================================================
+# 测试 6：流式加载 + 分割
+# ============================================================================
+print("\n--- 测试 6: 流式加载 + 分割 ---")
+
+from streaming_loader import StreamingTextLoader
+
+with tempfile.TemporaryDirectory() as tmp:
+    big_path = Path(tmp) / "big.txt"
+    paragraphs = [f"第 {i} 段：{test_content.strip()}" for i in range(200)]
+    big_text = "\n\n".join(paragraphs)
+    big_path.write_text(big_text, encoding="utf-8")
+
+    # 很小的窗口，强制出现大量跨窗口的块
+    streamed = list(StreamingTextLoader(big_path, splitter, window_bytes=1024).lazy_load())
+    assert [d.page_content for d in streamed] == splitter.split_text(big_text), "应与整文件分割结果相同"
+
+    raw = big_path.read_bytes()
+    for doc in streamed:
+        assert raw[doc.metadata["byte_start"]:doc.metadata["byte_end"]].decode("utf-8") == doc.page_content
+        assert big_text[doc.metadata["start_index"]:].startswith(doc.page_content)
+
+    # 随机文本：连续空行、空白与各级分隔符混在一起，块首的空白分段会被 strip 掉
+    import random
+
+    rng = random.Random(0)
+    pieces = ["LangChain", "检索", "RAG", "向量数据库", "x" * 40]
+    gaps = ["", " ", "  ", "\n", "\n\n", "\n\n\n", "\n\n\n\n", " \n\n ", "\n \n", "\t", "。"]
+    for case in range(60):
+        random_text = "".join(rng.choice(pieces) + rng.choice(gaps) for _ in range(rng.randint(20, 300)))
+        random_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=rng.choice([20, 50, 100]), chunk_overlap=rng.choice([0, 5, 10]),
+            separators=["\n\n", "\n", "。", " ", ""],
+        )
+        random_path = Path(tmp) / f"random_{case}.txt"
+        random_path.write_text(random_text, encoding="utf-8")
+        loader = StreamingTextLoader(random_path, random_splitter, window_bytes=rng.choice([64, 128, 256]))
+        assert [d.page_content for d in loader.lazy_load()] == random_splitter.split_text(random_text), case
+
+    print(f"\n[OK] 流式分割与整文件分割一致")
+    print(f"  文件大小: {len(raw)} 字节, 块数: {len(streamed)}；随机文本 60 例一致")
+
+
+# ============================================================================
+# 测试 7：目录导入（多进程解析 + 增量跳过）
+# ============================================================================
+print("\n--- 测试 7: 目录导入 ---")
+
+from directory_ingest import DirectoryIngestor, iter_chunks
+
+with tempfile.TemporaryDirectory() as tmp:
+    docs_dir = Path(tmp) / "docs"
+    docs_dir.mkdir()
+    (docs_dir / "intro.txt").write_text(test_content, encoding="utf-8")
+    (docs_dir / "notes.md").write_text("# RAG\n\n**检索**增强生成", encoding="utf-8")
+    (docs_dir / "page.html").write_text("<body><h1>Chroma</h1><p>向量数据库</p></body>", encoding="utf-8")
+    (docs_dir / "ignored.csv").write_text("a,b", encoding="utf-8")
+
+    # 本脚本没有 __main__ 保护，在当前进程中解析（多进程见 rag_utils/directory_ingest.py 的演示）
+    ingestor = DirectoryIngestor(docs_dir, manifest_dir=Path(tmp) / "state", max_workers=0)
+    chunks = list(iter_chunks(ingestor.iter_documents(), splitter))
+    sources = {Path(c.metadata["source"]).name for c in chunks}
+    assert sources == {"intro.txt", "notes.md", "page.html"}, sources
+    assert ingestor.report.parsed == 3
+
+    # 没有 commit 的文件不记入清单，下次重新解析
+    assert len(ingestor.scan()) == 3
+
+    # 交给入库流水线：每个文件的块全部写入后才回调 commit；写入失败时不记录
+    def failing_upsert(ids, texts, vectors, metadatas):
+        raise RuntimeError("向量库不可用")
+
+    try:
+        IngestPipeline(fake_embeddings, failing_upsert, splitter=splitter,
+                       on_committed=ingestor.commit).run(ingestor.iter_documents())
+    except RuntimeError:
+        pass
+    assert len(ingestor.scan()) == 3
+
+    written, committed = [], []
+    pipeline_run = IngestPipeline(
+        fake_embeddings, lambda ids, *_: written.extend(ids), splitter=splitter, embed_batch_size=1,
+        on_committed=lambda source: (committed.append(source), ingestor.commit(source)),
+    ).run(ingestor.iter_documents())
+    assert sorted(Path(s).name for s in committed) == ["intro.txt", "notes.md", "page.html"]
+    assert len(written) == pipeline_run.chunks
+
+    # 未变化（包括只被 touch 过）的文件不再解析
+    (docs_dir / "intro.txt").touch()
+    assert list(ingestor.iter_documents()) == []
+    assert ingestor.report.unchanged == 3
+
+    (docs_dir / "notes.md").write_text("# RAG\n\n内容已修改", encoding="utf-8")
+    (docs_dir / "page.html").unlink()
+    changed = list(ingestor.iter_documents())
+    assert [Path(d.metadata["source"]).name for d in changed] == ["notes.md"]
+    assert len(ingestor.report.removed) == 1
+    ingestor.manifest.close()
+
+    print(f"\n[OK] 目录导入成功")
+    print(f"  首次: {len(chunks)} 块, 来源: {sorted(sources)}")
+    print(f"  最后一次: {ingestor.report}")
+
+
+# ============================================================================
+# 测试 8：本地 FAISS 向量库（flat / IVF / HNSW，保存后 mmap 加载）
+# ============================================================================
+print("\n--- 测试 8: 本地 FAISS 向量库 ---")
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from faiss_store import FaissVectorStore
+
+fake_embeddings = DeterministicFakeEmbedding(size=32)
+texts = [chunk.page_content for chunk in chunks]
+metadatas = [{"source": "test.txt", "row": i} for i in range(len(texts))]
+
+with tempfile.TemporaryDirectory() as tmp:
+    for index_type in ("flat", "ivf", "hnsw"):
+        store = FaissVectorStore.from_texts(texts, fake_embeddings, metadatas=metadatas, index_type=index_type)
+        # 用块本身的文本查询，最相似的应是它自己（分数约为 1）
+        doc, score = store.similarity_search_with_score(texts[-1], k=1)[0]
+        assert doc.page_content == texts[-1] and score > 0.99, (index_type, score)
+
+        folder = Path(tmp) / index_type
+        store.save(folder)
+        loaded = FaissVectorStore.load(folder, fake_embeddings)
+        assert loaded.read_only and len(loaded) == len(texts)
+        assert loaded.similarity_search(texts[0], k=1)[0].page_content == texts[0]
+
+    # 覆盖写入同一 ID、删除、metadata 过滤
+    store = FaissVectorStore(fake_embeddings)
+    store.add_texts(["旧内容", "其他"], ids=["a", "b"])
+    store.add_texts(["新内容"], ids=["a"])
+    assert [d.page_content for d in store.similarity_search("旧内容", k=5)] != ["旧内容"]
+    assert len(store) == 2
+    store.delete(["b"])
+    assert [d.id for d in store.similarity_search("其他", k=5)] == ["a"]
+
+    print(f"\n[OK] FAISS 向量库测试通过")
+    print(f"  flat / ivf / hnsw 检索、保存、mmap 加载: {len(texts)} 块")
+    print(f"  检索器: {type(loaded.as_retriever()).__name__}")
+
+
+# ============================================================================
+# 测试 9：索引就绪轮询（假索引服务 + 假时钟，不需要 Pinecone）
+# ============================================================================
+print("\n--- 测试 9: 索引就绪轮询 ---")
+
+from index_lifecycle import FakeClock, FakeIndexService, IndexManager
+
+clock = FakeClock()
+service = FakeIndexService(clock, ready_after=2.0, existing=["existing-index"])
+manager = IndexManager(service, clock=clock, sleep=clock.sleep, cache_key="test-9")
+
+readiness = manager.ensure_index("new-index", dimension=384)
+assert readiness.created and 2.0 <= readiness.seconds_to_ready < 10
+assert clock.sleeps == [0.5, 1.0, 2.0], clock.sleeps
+
+# 已存在的索引：不再创建，list_indexes 只请求过一次
+again = manager.ensure_index("existing-index", dimension=384)
+assert not again.created and again.polls == 1
+assert service.calls["list_indexes"] == 1 and service.calls["create_index"] == 1
+
+try:
+    IndexManager(FakeIndexService(clock, ready_after=60), deadline=5,
+                 clock=clock, sleep=clock.sleep, cache_key="test-9-slow").ensure_index("slow", dimension=384)
+    raise AssertionError("应当超时")
+except TimeoutError:
+    pass
+
+print(f"\n[OK] 索引就绪轮询测试通过")
+print(f"  {readiness}（固定 sleep 需要 10s）")
+
+
+# ============================================================================
+# 测试 10：检索结果缓存（精确 + 语义两级）
+# ============================================================================
+print("\n--- 测试 10: 检索结果缓存 ---")
+
+from query_cache import RetrievalCache, normalize_query
+
+assert normalize_query("  LangChain  是什么？ ") == normalize_query("langchain 是什么")
+
+now = [0.0]
+# DeterministicFakeEmbedding：相同文本向量相同，不同文本几乎正交
+cache = RetrievalCache(fake_embeddings, ttl_seconds=60, clock=lambda: now[0])
+search_calls = []
+
+def fake_search(query):
+    search_calls.append(query)
+    return [query.upper()]
+
+cache.get_or_search("什么是 RAG？", fake_search)
+cache.get_or_search("什么是  rag", fake_search)               # 规范化后精确命中
+assert len(search_calls) == 1 and cache.stats.exact_hits == 1
+
+# 语义层：相似度阈值放到 0 时，任何已缓存的查询都算相似
+cache.similarity_threshold = 0.0
+assert cache.get_or_search("检索增强生成", fake_search) == ["什么是 RAG？".upper()]
+assert cache.stats.semantic_hits == 1 and len(search_calls) == 1
+cache.similarity_threshold = 0.92
+
+now[0] += 61                                                # TTL 过期
+cache.get_or_search("什么是 RAG？", fake_search)
+assert cache.stats.expired == 1 and len(search_calls) == 2
+
+cache.invalidate()                                          # 重新索引后清空
+cache.get_or_search("什么是 RAG？", fake_search)
+assert len(search_calls) == 3 and len(cache) == 1
+
+print(f"\n[OK] 检索缓存测试通过")
+print(f"  {cache.stats}")
+
+
+# ============================================================================
+# 测试 11：上下文打包（去重叠、合并相邻块、token 预算）
+# ============================================================================
+print("\n--- 测试 11: 上下文打包 ---")
+
+from langchain_core.documents import Document
+from context_packer import estimate_tokens, pack_context
+
+source_text = "".join(f"第{i}句：检索增强生成把外部知识提供给大模型。" for i in range(30))
+pack_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=100, chunk_overlap=30, separators=["。", ""], keep_separator="end", add_start_index=True
+)
+pack_chunks = pack_splitter.split_documents([Document(page_content=source_text, metadata={"source": "rag.txt"})])
+retrieved = [pack_chunks[2], pack_chunks[3], pack_chunks[8]]
+
+packed = pack_context(retrieved, token_budget=1000)
+assert packed.chunks_used == 3 and packed.saved_tokens > 0
+# 块 2、3 重叠：合并为一段连续原文，重叠部分只出现一次
+first, second = packed.text.split("\n\n")
+assert first in source_text and len(first) < len(pack_chunks[2].page_content) + len(pack_chunks[3].page_content)
+assert second == pack_chunks[8].page_content
+
+# 预算不够时按分数取舍，总 token 数不超过预算
+for budget in (200, 120, 50):
+    packed = pack_context(retrieved, token_budget=budget)
+    assert 0 < packed.tokens <= budget, (budget, packed)
+
+# 没有偏移信息的块按完整文本去重
+plain = [Document(page_content="RAG 是检索增强生成"), Document(page_content="RAG 是检索增强生成")]
+packed = pack_context(plain, token_budget=100)
+assert packed.text == "RAG 是检索增强生成" and packed.tokens == estimate_tokens(packed.text)
+
+print(f"\n[OK] 上下文打包测试通过")
+print(f"  {pack_context(retrieved, token_budget=1000)}")
+
+
+# ============================================================================
+# 测试 12：向量相似度（预归一化矩阵 + 分块 top-k）
+# ============================================================================
+print("\n--- 测试 12: 向量相似度 ---")
+
+import numpy as np
+from similarity import SimilarityMatrix, cosine_similarity
+
+rng = np.random.default_rng(0)
+corpus = rng.standard_normal((500, 32))
+full = cosine_similarity(corpus, corpus)
+assert np.isclose(cosine_similarity(corpus[0], corpus[1]),
+                  np.dot(corpus[0], corpus[1]) / (np.linalg.norm(corpus[0]) * np.linalg.norm(corpus[1])))
+
+# 分块 top-k 与完整矩阵排序的结果相同
+matrix = SimilarityMatrix(corpus, chunk_size=64)
+scores, rows = matrix.top_k(corpus[:10], k=5)
+assert (rows == np.argsort(-full[:10], axis=1)[:, :5]).all()
+
+# all_pairs_top_k 排除自身；pairs_above 与上三角阈值一致
+np.fill_diagonal(full, -np.inf)
+pair_scores, pair_rows = matrix.all_pairs_top_k(k=3)
+assert (pair_rows == np.argsort(-full, axis=1)[:, :3]).all()
+assert len(list(matrix.pairs_above(0.5))) == int(np.triu(full >= 0.5, 1).sum())
+
+# float16 / int8 存储：内存减半 / 减到四分之一，误差很小
+for dtype, max_error in (("float16", 1e-3), ("int8", 2e-2)):
+    quantized = SimilarityMatrix(corpus, dtype=dtype, chunk_size=64)
+    assert quantized.data.nbytes <= matrix.data.nbytes // 2
+    assert np.abs(quantized.similarities(corpus[:10]) - matrix.similarities(corpus[:10])).max() < max_error
+
+# 保存后 mmap 加载
+with tempfile.TemporaryDirectory() as tmp:
+    SimilarityMatrix(corpus, dtype="int8").save(tmp)
+    mapped = SimilarityMatrix.load(tmp, mmap=True, chunk_size=100)
+    assert isinstance(mapped.data, np.memmap) and mapped.top_k(corpus[7], k=1)[1][0] == 7
+    del mapped
+
+print(f"\n[OK] 向量相似度测试通过")
+print(f"  {len(matrix)} 个向量，float32 {matrix.nbytes // 1024} KB，int8 {quantized.nbytes // 1024} KB")
+
+
+# ============================================================================
+# 测试 13：近似重复块去重（MinHash + LSH）
+# ============================================================================
+print("\n--- 测试 13: 近似重复块去重 ---")
+
+from near_dedup import MinHasher, MinHashLSH, NearDuplicateFilter
+
+# MinHash 估计的 Jaccard 相似度接近真实值
+hasher = MinHasher(num_perm=256, shingle_size=3)
+text_a = "LangChain 是一个用于构建大语言模型应用的开发框架，提供模型、提示词、链和检索组件。"
+text_b = text_a.replace("开发框架", "开源框架")
+shingles = lambda t: {t[i:i + 3] for i in range(len(t) - 2)}
+true_jaccard = len(shingles(text_a) & shingles(text_b)) / len(shingles(text_a) | shingles(text_b))
+estimated = float(np.mean(hasher.signature(text_a) == hasher.signature(text_b)))
+assert abs(estimated - true_jaccard) < 0.1, (estimated, true_jaccard)
+
+# LSH 分段使阈值附近的候选概率陡峭变化
+lsh = MinHashLSH(threshold=0.8, num_perm=128)
+assert lsh.bands * lsh.rows <= 128 and lsh.bands > 1
+
+paragraphs = [f"第{i}段：组件 {i} 负责检索流程中的第 {i} 个步骤，并把结果交给下一个组件处理。" for i in range(40)]
+intro = Document(page_content="\n\n".join(paragraphs), metadata={"source": "langchain_intro.txt"})
+guide = Document(page_content="\n\n".join(p.replace("处理", "继续处理") for p in paragraphs),
+                 metadata={"source": "langchain_guide.txt"})
+dedup_splitter = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=50)
+intro_chunks = dedup_splitter.split_documents([intro])
+guide_chunks = dedup_splitter.split_documents([guide])
+
+# 同一文档相邻块的重叠不算重复
+dedup = NearDuplicateFilter(threshold=0.8)
+assert len(list(dedup.filter(intro_chunks))) == len(intro_chunks)
+# 改写过的第二份文档整体被去掉，报告块数和字节数
+kept = list(dedup.filter(guide_chunks))
+assert len(kept) == 0 and dedup.report.removed == len(guide_chunks)
+assert dedup.report.bytes_removed == sum(len(c.page_content.encode("utf-8")) for c in guide_chunks)
+# 候选查找只涉及同桶的块，不是和全部已保留的块比较
+assert dedup.report.candidates < len(guide_chunks) * len(intro_chunks)
+
+print(f"\n[OK] 近似去重测试通过")
+print(f"  {dedup.report}")
+
+
 # ============================================================================
 # 总结
 # ============================================================================
@@ -130,9 +549,19 @@ print("\n已验证:")
 print("  [OK] 文档加载 (TextLoader)")
 print("  [OK] 文本分割 (RecursiveCharacterTextSplitter)")
 print("  [OK] 向量嵌入 (HuggingFaceEmbeddings)")
+print("  [OK] 嵌入缓存 (CachedEmbeddings)")
+print("  [OK] 批量入库流水线 (IngestPipeline)")
+print("  [OK] 流式加载 + 分割 (StreamingTextLoader)")
+print("  [OK] 目录导入 (DirectoryIngestor)")
+print("  [OK] 本地向量库 (FaissVectorStore)")
+print("  [OK] 索引就绪轮询 (IndexManager)")
+print("  [OK] 检索结果缓存 (RetrievalCache)")
+print("  [OK] 上下文打包 (pack_context)")
+print("  [OK] 向量相似度 (SimilarityMatrix)")
+print("  [OK] 近似重复块去重 (NearDuplicateFilter)")
 
 print("\nPinecone 向量存储:")
-print("  需要设置 PINECONE_API_KEY 才能测试")
+print("  需要设置 PINECONE_API_KEY 才能测试（未设置时示例使用本地 FAISS）")
 print("  免费注册: https://www.pinecone.io/")
 
 print("\n运行完整示例:")
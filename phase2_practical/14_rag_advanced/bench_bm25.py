@@ -0,0 +1,110 @@
+"""
+基准测试：BM25Retriever (rank_bm25) vs FastBM25Retriever (CSR 稀疏矩阵)
+=====================================================================
+
+用合成语料（Zipf 分布的词表）对比两者的建库时间和查询延迟，
+并校验两者返回结果的分数序列一致。
+
+运行：
+    python bench_bm25.py                    # 默认 100k 文档
+    python bench_bm25.py --docs 20000 --queries 100
+"""
+
+import argparse
+import itertools
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR / "retrieval"))
+
+from langchain_community.retrievers import BM25Retriever
+from bm25_index import FastBM25Retriever
+
+# 目标：100k 文档时查询至少快 10 倍
+TARGET_SPEEDUP = 10
+
+
+def make_corpus(num_docs, vocab_size, seed):
+    """生成合成语料：词频服从 Zipf 分布，文档长度 20-120 个词"""
+    rng = random.Random(seed)
+    vocab = [f"term{i}" for i in range(vocab_size)]
+    cum_weights = list(itertools.accumulate(1 / (i + 1) for i in range(vocab_size)))
+    texts = [
+        " ".join(rng.choices(vocab, cum_weights=cum_weights, k=rng.randint(20, 120)))
+        for _ in range(num_docs)
+    ]
+    queries = [" ".join(rng.choices(vocab[:vocab_size // 2], k=rng.randint(2, 5))) for _ in range(200)]
+    return texts, queries
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 检索器基准测试")
+    parser.add_argument("--docs", type=int, default=100_000, help="文档数")
+    parser.add_argument("--vocab", type=int, default=50_000, help="词表大小")
+    parser.add_argument("--queries", type=int, default=50, help="查询数")
+    parser.add_argument("--k", type=int, default=10, help="top-k")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print(f"BM25 基准测试：{args.docs} 文档，{args.queries} 个查询，k={args.k}")
+    print("=" * 70)
+
+    texts, queries = make_corpus(args.docs, args.vocab, args.seed)
+    queries = (queries * (args.queries // len(queries) + 1))[:args.queries]
+
+    # 建库
+    baseline, baseline_build = timed(BM25Retriever.from_texts, texts)
+    fast, fast_build = timed(FastBM25Retriever.from_texts, texts)
+    baseline.k = fast.k = args.k
+
+    print(f"\n建库时间:")
+    print(f"  BM25Retriever:     {baseline_build:.2f}s")
+    print(f"  FastBM25Retriever: {fast_build:.2f}s")
+
+    # 逐条查询
+    baseline_results, baseline_time = timed(lambda: [baseline.invoke(q) for q in queries])
+    fast_results, fast_time = timed(lambda: [fast.invoke(q) for q in queries])
+    batch_results, batch_time = timed(fast.search_batch, queries)
+
+    # 校验：返回文档的分数序列一致（同分文档之间的先后允许不同）
+    position = {id(doc): i for docs in (baseline.docs, fast.docs) for i, doc in enumerate(docs)}
+    mismatches = 0
+    for query, expected, actual, batched in zip(queries, baseline_results, fast_results, batch_results):
+        scores = baseline.vectorizer.get_scores(query.split())
+        reference = [scores[position[id(doc)]] for doc in expected]
+        ranked = [scores[position[id(doc)]] for doc in actual]
+        ranked_batch = [scores[position[id(doc)]] for doc in batched]
+        if not (np.allclose(ranked, reference) and np.allclose(ranked_batch, reference)):
+            mismatches += 1
+
+    per_query_baseline = baseline_time / len(queries) * 1000
+    per_query_fast = fast_time / len(queries) * 1000
+    per_query_batch = batch_time / len(queries) * 1000
+    speedup = baseline_time / fast_time
+
+    print(f"\n查询延迟（每条平均）:")
+    print(f"  BM25Retriever:           {per_query_baseline:.2f} ms")
+    print(f"  FastBM25Retriever:       {per_query_fast:.2f} ms")
+    print(f"  FastBM25 search_batch:   {per_query_batch:.2f} ms")
+    print(f"\n加速比: {speedup:.1f}x（批量: {baseline_time / batch_time:.1f}x）")
+    print(f"排序一致: {len(queries) - mismatches}/{len(queries)}")
+
+    ok = mismatches == 0 and (args.docs < 100_000 or speedup >= TARGET_SPEEDUP)
+    print(f"\n{'[OK]' if ok else '[FAIL]'} 目标: 排序一致，且 100k 文档时加速 >= {TARGET_SPEEDUP}x")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,36 +9,48 @@ LangChain 1.0 - RAG Advanced (RAG 进阶)
 4. 参数优化 - 权重调整和 k 值选择
 """
 
-import os
+import sys
+import time
 from pathlib import Path
-from dotenv import load_dotenv
-from langchain.chat_models import init_chat_model
-from langchain_community.document_loaders import TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
-from langchain_community.retrievers import BM25Retriever
-from langchain_classic.retrievers import EnsembleRetriever
 from langchain_core.tools import tool
-from langchain.agents import create_agent
 
 # 获取脚本所在目录
 SCRIPT_DIR = Path(__file__).parent
 DATA_DIR = SCRIPT_DIR / "data"
 CHROMA_DIR = SCRIPT_DIR / "chroma_db"
+EMBEDDING_CACHE_DIR = SCRIPT_DIR / "embedding_cache"
+TOKEN_CACHE_DIR = SCRIPT_DIR / "token_cache"
+
+# 复用 13_rag_basics 的 RAG 工具模块，并添加本模块的 retrieval 目录
+sys.path.insert(0, str(SCRIPT_DIR.parent / "13_rag_basics" / "rag_utils"))
+sys.path.insert(0, str(SCRIPT_DIR / "retrieval"))
+# 仓库根目录的 shared/（共享组件）
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "shared"))
+
+# 重量级依赖（langgraph、chromadb 等）和模型在第一次使用时才导入 / 创建
+from startup import get_model, lazy_import
+
+TextLoader = lazy_import("langchain_community.document_loaders", "TextLoader")
+RecursiveCharacterTextSplitter = lazy_import("langchain_text_splitters", "RecursiveCharacterTextSplitter")
+Chroma = lazy_import("langchain_community.vectorstores", "Chroma")
+create_agent = lazy_import("langchain.agents", "create_agent")
+
+from embedding_cache import build_cached_embeddings
+from ingest_pipeline import IngestPipeline, vector_upserter
+from chroma_indexer import ChromaIndexer
+from bm25_index import FastBM25Retriever
+from bm25_tokenizers import build_tokenizer
+from hybrid_retriever import ParallelEnsembleRetriever
+from weight_sweep import WeightSweep, load_labeled_queries, weight_grid
+from query_cache import RetrievalCache
+from reranker import CrossEncoderReranker, RerankRetriever
+from context_packer import pack_context
+from near_dedup import NearDuplicateFilter
 
 # 确保目录存在
 DATA_DIR.mkdir(exist_ok=True)
 CHROMA_DIR.mkdir(exist_ok=True)
 
-load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-
-if not GROQ_API_KEY or GROQ_API_KEY == "your_groq_api_key_here_replace_this":
-    raise ValueError("请先设置 GROQ_API_KEY")
-
-model = init_chat_model("groq:llama-3.3-70b-versatile", api_key=GROQ_API_KEY)
-
 
 # ============================================================================
 # 示例 1：准备测试数据
@@ -152,14 +164,21 @@ A: Best Match 25，一种基于词频的检索算法，适合精确匹配
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=300,
         chunk_overlap=50,
-        separators=["\n## ", "\n### ", "\n\n", "\n", " ", ""]
+        separators=["\n## ", "\n### ", "\n\n", "\n", " ", ""],
+        add_start_index=True   # 记录块在原文中的偏移，用于生成稳定 ID
     )
 
     chunks = splitter.split_documents(documents)
+    split_count = len(chunks)
+
+    # 近似重复块只保留第一个：BM25 和向量索引都不再存重复内容
+    dedup = NearDuplicateFilter(threshold=0.8)
+    chunks = list(dedup.filter(chunks))
 
     print(f"\n分割结果:")
     print(f"  原文档: {len(documents)} 个")
-    print(f"  分割后: {len(chunks)} 块")
+    print(f"  分割后: {split_count} 块")
+    print(f"  {dedup.report}")
     print(f"\n前 3 块示例:")
     for i, chunk in enumerate(chunks[:3], 1):
         preview = chunk.page_content[:60].replace("\n", " ")
@@ -185,17 +204,18 @@ def example_2_vector_retriever(chunks):
     print("  使用: HuggingFaceEmbeddings (all-MiniLM-L6-v2)")
     print("  存储: Chroma (本地)")
 
-    # 创建嵌入模型
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
+    # 创建嵌入模型（带磁盘缓存，重复运行不再重新计算向量）
+    embeddings = build_cached_embeddings(EMBEDDING_CACHE_DIR)
 
-    # 创建 Chroma 向量存储
-    vectorstore = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory=str(CHROMA_DIR)
+    # 打开持久化的 Chroma 集合，增量同步文档块
+    # （from_documents 每次运行都会追加一份重复向量）
+    vectorstore = Chroma(
+        persist_directory=str(CHROMA_DIR),
+        embedding_function=embeddings
     )
+    # 新增/变化的块交给入库流水线：每批 32 个块嵌入，嵌入和写入重叠执行
+    pipeline = IngestPipeline(embeddings, vector_upserter(vectorstore), embed_batch_size=32)
+    report = ChromaIndexer(vectorstore, pipeline=pipeline).sync(chunks)
 
     # 创建检索器
     vector_retriever = vectorstore.as_retriever(
@@ -204,6 +224,11 @@ def example_2_vector_retriever(chunks):
 
     print(f"\n[OK] 向量检索器已创建")
     print(f"  检索数量: k=3")
+    print(f"  增量索引: {report}")
+    if report.added or report.updated:
+        print(f"  入库流水线: {pipeline.last_report}")
+    stats = embeddings.stats()
+    print(f"  嵌入缓存: 命中 {stats['hits']} / 未命中 {stats['misses']}")
 
     # 测试查询
     test_queries = [
@@ -245,11 +270,26 @@ def example_3_bm25_retriever(chunks):
 
     print("\n创建 BM25 检索器...")
 
+    # 中文分词：默认按空白切分会把整句中文当成一个词
+    # 这里用字符 n-gram 分词，并把文档块的分词结果缓存到磁盘
+    tokenizer = build_tokenizer("ngram", cache_dir=TOKEN_CACHE_DIR)
+    sample = "LangChain 有哪些核心组件？"
+    print(f"\n分词对比: {sample}")
+    print(f"  按空白: {sample.split()}")
+    print(f"  字符 n-gram: {tokenizer(sample)}")
+
     # 创建 BM25 检索器
-    bm25_retriever = BM25Retriever.from_documents(chunks)
+    # FastBM25Retriever 与 BM25Retriever 用法、排序一致，
+    # 但用 CSR 稀疏矩阵一次算完所有文档的分数（见 bench_bm25.py）
+    bm25_retriever = FastBM25Retriever.from_documents(chunks, preprocess_func=tokenizer)
     bm25_retriever.k = 3
 
+    stats = tokenizer.stats()
     print(f"\n[OK] BM25 检索器已创建")
+    print(f"  实现: FastBM25Retriever (稀疏矩阵，可替换 BM25Retriever)")
+    print(f"  分词: {tokenizer.name}，缓存命中 {stats['hits']} / 新分词 {stats['misses']} 块")
+    if stats["misses"]:
+        print(f"  分词吞吐: {stats['tokens_per_sec']:,.0f} tokens/秒")
     print(f"  检索数量: k=3")
 
     # 测试查询
@@ -295,14 +335,18 @@ def example_4_ensemble_retriever(vector_retriever, bm25_retriever):
     print("  weights=[0.3, 0.7] - 偏向 BM25")
 
     # 创建混合检索器
-    ensemble_retriever = EnsembleRetriever(
+    # ParallelEnsembleRetriever 与 EnsembleRetriever 用法相同，
+    # 但两路检索同时执行，延迟约等于较慢的一路；超时的一路按空结果降级
+    ensemble_retriever = ParallelEnsembleRetriever(
         retrievers=[bm25_retriever, vector_retriever],
-        weights=[0.4, 0.6]  # 稍微偏向向量搜索
+        weights=[0.4, 0.6],  # 稍微偏向向量搜索
+        timeouts=[1.0, 3.0]  # 每路超时（秒）
     )
 
     print(f"\n[OK] 混合检索器已创建")
     print(f"  组合: BM25 (40%) + Vector (60%)")
     print(f"  算法: RRF (Reciprocal Rank Fusion)")
+    print(f"  执行: 两路并行，超时降级")
 
     # 对比测试
     test_queries = [
@@ -330,11 +374,17 @@ def example_4_ensemble_retriever(vector_retriever, bm25_retriever):
         print(f"    BM25:    {bm25_preview}...")
         print(f"    Vector:  {vector_preview}...")
         print(f"    Hybrid:  {ensemble_preview}...")
+        latency = ", ".join(
+            f"{leg['retriever']} {leg['latency_ms']:.0f}ms ({leg['status']})"
+            for leg in ensemble_retriever.last_run
+        )
+        print(f"    耗时:    {latency}")
 
     print("\n关键点:")
     print("  - 混合检索结合了两者的优势")
     print("  - 对大多数查询都能获得更好的结果")
     print("  - 适用于生产环境")
+    print("  - 并行执行各路检索，延迟取决于最慢的一路")
 
     return ensemble_retriever
 
@@ -346,13 +396,20 @@ def example_5_weight_optimization(vector_retriever, bm25_retriever):
     """
     示例5：权重优化
 
-    测试不同权重配置的效果
+    每路检索器对每个标注查询只执行一次，之后在内存中扫描权重 × c 网格，
+    用 recall@k / MRR / nDCG 评估（不再为每组权重重新检索）
     """
     print("\n" + "="*70)
     print("示例 5：权重优化实验")
     print("="*70)
 
-    print("\n测试不同的权重配置...")
+    labeled = load_labeled_queries(DATA_DIR / "labeled_queries.jsonl")
+    print(f"\n标注查询: {len(labeled)} 条")
+
+    sweep = WeightSweep(
+        [bm25_retriever, vector_retriever], names=["BM25", "向量"]
+    ).collect(labeled)
+    print(f"[OK] 检索结果已缓存（检索耗时 {sweep.retrieval_seconds:.2f}s）")
 
     weight_configs = [
         (0.0, 1.0, "纯向量"),
@@ -362,37 +419,41 @@ def example_5_weight_optimization(vector_retriever, bm25_retriever):
         (1.0, 0.0, "纯 BM25"),
     ]
 
-    test_query = "LangChain 1.0 有什么新特性？"
-
-    print(f"\n测试查询: {test_query}")
-    print("\n权重配置对比:")
-
-    for bm25_weight, vector_weight, description in weight_configs:
-        ensemble = EnsembleRetriever(
-            retrievers=[bm25_retriever, vector_retriever],
-            weights=[bm25_weight, vector_weight]
-        )
-
-        results = ensemble.invoke(test_query)
-        if results:
-            preview = results[0].page_content[:60].replace("\n", " ")
-            print(f"\n  {description} [{bm25_weight:.1f}, {vector_weight:.1f}]:")
-            print(f"    最相关: {preview}...")
+    print("\n权重配置对比 (c=60, k=3):")
+    results = sweep.evaluate([(b, v) for b, v, _ in weight_configs], c_values=[60], k=3)
+    descriptions = {(b, v): d for b, v, d in weight_configs}
+    for row in results:
+        bm25_weight, vector_weight = row["weights"]
+        print(f"  {descriptions[row['weights']]:<8} [{bm25_weight:.1f}, {vector_weight:.1f}]: "
+              f"recall@3={row['recall']:.2f}  MRR={row['mrr']:.2f}  nDCG@3={row['ndcg']:.2f}")
+
+    # 完整网格：11 组权重 × 9 个 c 值，全部在内存中完成
+    grid = weight_grid(2, step=0.1)
+    c_values = [1, 5, 10, 20, 30, 40, 60, 80, 100]
+    start = time.perf_counter()
+    best = sweep.evaluate(grid, c_values=c_values, k=3)
+    print(f"\n网格扫描: {len(grid) * len(c_values)} 个组合，耗时 {(time.perf_counter() - start) * 1000:.1f} ms")
+    print("  nDCG@3 最高的配置:")
+    for row in best[:3]:
+        print(f"    权重 {list(row['weights'])}, c={row['c']}: "
+              f"recall@3={row['recall']:.2f}  MRR={row['mrr']:.2f}  nDCG@3={row['ndcg']:.2f}")
 
     print("\n推荐配置:")
     print("  - 技术文档: [0.4, 0.6] - 稍偏向语义")
     print("  - 代码搜索: [0.6, 0.4] - 稍偏向精确匹配")
     print("  - 通用场景: [0.5, 0.5] - 平衡")
+    print("  - 最可靠的做法：用自己的标注查询跑一遍网格扫描")
 
 
 # ============================================================================
 # 示例 6：RAG Agent with Hybrid Search
 # ============================================================================
-def example_6_rag_agent_hybrid(ensemble_retriever):
+def example_6_rag_agent_hybrid(ensemble_retriever, embeddings):
     """
     示例6：使用混合检索的 RAG Agent
 
-    将混合检索集成到 Agent 中
+    将混合检索集成到 Agent 中：混合检索召回候选，交叉编码器重排序取前 4 个，
+    结果经 RetrievalCache 缓存，再按 token 预算组装成工具输出
     """
     print("\n" + "="*70)
     print("示例 6：RAG Agent with Hybrid Search")
@@ -400,18 +461,36 @@ def example_6_rag_agent_hybrid(ensemble_retriever):
 
     print("\n创建混合检索工具...")
 
-    # 创建检索工具
+    # 重排序：对混合检索的前 10 个候选用交叉编码器打分，取前 4 个，最终用多少由 token 预算决定
+    # （首次运行会下载模型；加载失败时退回按混合检索的排名组装）
+    reranker = CrossEncoderReranker(top_n=4, max_candidates=10)
+    try:
+        reranker.load()
+        retriever = RerankRetriever(base_retriever=ensemble_retriever, reranker=reranker)
+        print(f"[OK] 重排序模型已加载: {reranker.model_name}")
+    except Exception as e:
+        print(f"[警告] 重排序模型加载失败，直接使用混合检索结果: {str(e)[:80]}")
+        reranker = None
+        retriever = ensemble_retriever
+
+    # 检索结果缓存：Agent 重复或换个说法的查询直接复用结果
+    cache = RetrievalCache(embeddings, ttl_seconds=600)
+    packed_runs = []
+
+    # 创建检索工具：重叠的块只发送一次，总长度不超过 token 预算
     @tool
     def search_knowledge_base(query: str) -> str:
-        """在知识库中搜索相关信息（混合检索）"""
-        docs = ensemble_retriever.invoke(query)
-        return "\n\n".join([doc.page_content for doc in docs[:2]])  # 只取前2个
+        """在知识库中搜索相关信息（混合检索 + 重排序）"""
+        docs = cache.get_or_search(query, retriever.invoke)
+        packed = pack_context(docs, token_budget=500)
+        packed_runs.append(packed)
+        return packed.text
 
     print(f"[OK] 工具已创建: search_knowledge_base")
 
     # 创建 Agent
     agent = create_agent(
-        model=model,
+        model=get_model(),
         tools=[search_knowledge_base],
         system_prompt="""你是一个 LangChain 专家助手。
 
@@ -442,10 +521,21 @@ def example_6_rag_agent_hybrid(ensemble_retriever):
             print(f"[错误] 查询失败（Groq 工具调用问题）\n")
         print("-" * 70 + "\n")
 
+    print(f"检索缓存: {cache.stats}")
+    if packed_runs:
+        sent = sum(p.tokens for p in packed_runs)
+        naive = sum(p.naive_tokens for p in packed_runs)
+        print(f"上下文打包: {len(packed_runs)} 次工具调用共 {sent} tokens（直接拼接 {naive} tokens）")
+    if reranker is not None:
+        print(f"{reranker.stats}")
+    print()
+
     print("关键点:")
     print("  - 混合检索提供更全面的上下文")
     print("  - 同时覆盖语义和精确匹配")
     print("  - 提高 RAG 系统的准确性和鲁棒性")
+    print("  - 交叉编码器重排序：分批打分、分数缓存，只保留最相关的块")
+    print("  - pack_context 按 token 预算组装：重叠只发一次，相邻块合并成连续原文")
 
 
 # ============================================================================
@@ -480,7 +570,7 @@ def main():
         input("\n按 Enter 继续...")
 
         # 6. RAG Agent
-        example_6_rag_agent_hybrid(ensemble_retriever)
+        example_6_rag_agent_hybrid(ensemble_retriever, vectorstore.embeddings)
 
         print("\n" + "="*70)
         print(" 完成！")
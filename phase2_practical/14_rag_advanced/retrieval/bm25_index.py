@@ -0,0 +1,238 @@
+"""
+向量化 BM25：基于 CSR 稀疏矩阵的 BM25 检索器
+============================================
+
+BM25Retriever 内部使用 rank_bm25，每个查询都要在 Python 循环里遍历
+全部文档，文档一多就很慢。
+
+这里把 BM25 的 "IDF × 词频饱和 × 长度归一化" 预先算进一个
+词项-文档 CSR 矩阵 W（形状：词表大小 × 文档数）：
+
+    W[t, d] = idf(t) * tf(t,d) * (k1 + 1) / (tf(t,d) + k1 * (1 - b + b * |d| / avgdl))
+
+查询时只需一次稀疏矩阵乘法：scores = q @ W，再用 argpartition 取 top-k。
+批量查询同理：Q (查询数 × 词表) @ W。
+
+公式、IDF 的 epsilon 下限与 rank_bm25.BM25Okapi 完全一致，分数相同，
+排序结果也相同（仅同分文档之间的先后可能不同）。
+
+用法（与 BM25Retriever 相同）：
+    retriever = FastBM25Retriever.from_documents(chunks)
+    retriever.k = 3
+    docs = retriever.invoke("BM25 算法")
+"""
+
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+from scipy import sparse
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict, Field
+
+# 批量查询时每次参与矩阵乘法的查询数，限制稠密分数矩阵的内存
+_QUERY_BATCH = 256
+
+
+def default_preprocessing_func(text: str) -> List[str]:
+    """与 BM25Retriever 默认预处理一致：按空白切分"""
+    return text.split()
+
+
+class BM25Index:
+    """
+    BM25 稀疏矩阵索引
+
+    参数:
+        corpus: 已分词的文档列表（list[list[str]]）
+        k1, b, epsilon: 与 rank_bm25.BM25Okapi 相同的参数
+    """
+
+    def __init__(self, corpus, k1=1.5, b=0.75, epsilon=0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.vocab: Dict[str, int] = {}
+
+        rows, cols, tfs = [], [], []
+        doc_len = np.zeros(len(corpus), dtype=np.float64)
+        for doc_id, tokens in enumerate(corpus):
+            doc_len[doc_id] = len(tokens)
+            for token, tf in Counter(tokens).items():
+                rows.append(self.vocab.setdefault(token, len(self.vocab)))
+                cols.append(doc_id)
+                tfs.append(tf)
+
+        self.corpus_size = len(corpus)
+        self.doc_len = doc_len
+        self.avgdl = doc_len.sum() / self.corpus_size if self.corpus_size else 0.0
+
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        tfs = np.asarray(tfs, dtype=np.float64)
+
+        # IDF：负值替换为 epsilon * 平均 IDF（与 BM25Okapi 相同）
+        df = np.bincount(rows, minlength=len(self.vocab)).astype(np.float64)
+        idf = np.log(self.corpus_size - df + 0.5) - np.log(df + 0.5)
+        if len(idf):
+            idf[idf < 0] = epsilon * idf.mean()
+        self.idf = idf
+
+        # 预先计算每个 (词项, 文档) 的 BM25 权重
+        norm = k1 * (1 - b + b * doc_len[cols] / self.avgdl) if self.avgdl else k1 * (1 - b)
+        weights = idf[rows] * tfs * (k1 + 1) / (tfs + norm)
+        self.matrix = sparse.csr_matrix(
+            (weights, (rows, cols)), shape=(len(self.vocab), self.corpus_size)
+        )
+
+    def _query_matrix(self, queries):
+        """把分词后的查询转成 (查询数 × 词表) 的稀疏计数矩阵，未登录词忽略"""
+        rows, cols, counts = [], [], []
+        for query_id, tokens in enumerate(queries):
+            for token, count in Counter(tokens).items():
+                term_id = self.vocab.get(token)
+                if term_id is not None:
+                    rows.append(query_id)
+                    cols.append(term_id)
+                    counts.append(count)
+        return sparse.csr_matrix(
+            (np.asarray(counts, dtype=np.float64), (rows, cols)),
+            shape=(len(queries), len(self.vocab)),
+        )
+
+    def get_scores(self, query_tokens) -> np.ndarray:
+        """单个查询对全部文档的 BM25 分数"""
+        return self.get_batch_scores([query_tokens])[0]
+
+    def get_batch_scores(self, queries) -> np.ndarray:
+        """批量查询的分数矩阵（查询数 × 文档数），一次稀疏矩阵乘法"""
+        return (self._query_matrix(queries) @ self.matrix).toarray()
+
+    def top_k(self, scores: np.ndarray, k: int) -> np.ndarray:
+        """
+        用 argpartition 取分数最高的 k 个文档下标
+
+        同分时按文档下标升序排，结果是确定的
+        （rank_bm25 用不稳定的 np.argsort，同分文档的先后顺序不固定）
+        """
+        n = len(scores)
+        k = min(k, n)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        if k < n:
+            part = np.argpartition(-scores, k - 1)[:k]
+            candidates = np.flatnonzero(scores >= scores[part].min())
+        else:
+            candidates = np.arange(n)
+        order = np.lexsort((candidates, -scores[candidates]))
+        return candidates[order[:k]]
+
+    def search(self, query_tokens, k: int) -> np.ndarray:
+        """单个查询的 top-k 文档下标"""
+        return self.top_k(self.get_scores(query_tokens), k)
+
+    def search_batch(self, queries, k: int) -> List[np.ndarray]:
+        """批量查询的 top-k 文档下标"""
+        results = []
+        for start in range(0, len(queries), _QUERY_BATCH):
+            scores = self.get_batch_scores(queries[start:start + _QUERY_BATCH])
+            results.extend(self.top_k(row, k) for row in scores)
+        return results
+
+
+class FastBM25Retriever(BaseRetriever):
+    """基于 BM25Index 的检索器，可直接替换 BM25Retriever"""
+
+    index: Any = None
+    """ BM25 稀疏矩阵索引"""
+    docs: List[Document] = Field(repr=False)
+    """ 文档列表"""
+    k: int = 4
+    """ 返回的文档数"""
+    preprocess_func: Callable[[str], List[str]] = default_preprocessing_func
+    """ 分词函数（建库和查询使用同一个）"""
+
+    model_config = ConfigDict(
+        arbitrary_types_allowed=True,
+    )
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: Iterable[str],
+        metadatas: Optional[Iterable[dict]] = None,
+        ids: Optional[Iterable[str]] = None,
+        bm25_params: Optional[Dict[str, Any]] = None,
+        preprocess_func: Callable[[str], List[str]] = default_preprocessing_func,
+        **kwargs: Any,
+    ) -> "FastBM25Retriever":
+        """从文本列表创建检索器（参数与 BM25Retriever.from_texts 相同）"""
+        texts = list(texts)
+        # 带缓存的分词器（bm25_tokenizers.CachedTokenizer）支持批量分词
+        tokenize_many = getattr(preprocess_func, "tokenize_many", None)
+        corpus = tokenize_many(texts) if tokenize_many else [preprocess_func(t) for t in texts]
+        index = BM25Index(corpus, **(bm25_params or {}))
+        metadatas = metadatas or ({} for _ in texts)
+        ids = ids or (None for _ in texts)
+        docs = [
+            Document(page_content=t, metadata=m, id=i)
+            for t, m, i in zip(texts, metadatas, ids)
+        ]
+        return cls(index=index, docs=docs, preprocess_func=preprocess_func, **kwargs)
+
+    @classmethod
+    def from_documents(
+        cls,
+        documents: Iterable[Document],
+        *,
+        bm25_params: Optional[Dict[str, Any]] = None,
+        preprocess_func: Callable[[str], List[str]] = default_preprocessing_func,
+        **kwargs: Any,
+    ) -> "FastBM25Retriever":
+        """从 Document 列表创建检索器"""
+        texts, metadatas, ids = zip(
+            *((d.page_content, d.metadata, d.id) for d in documents)
+        )
+        return cls.from_texts(
+            texts=texts,
+            metadatas=metadatas,
+            ids=ids,
+            bm25_params=bm25_params,
+            preprocess_func=preprocess_func,
+            **kwargs,
+        )
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        top = self.index.search(self.preprocess_func(query), self.k)
+        return [self.docs[i] for i in top]
+
+    def search_batch(self, queries: List[str], k: Optional[int] = None) -> List[List[Document]]:
+        """批量检索：所有查询共用一次稀疏矩阵乘法"""
+        tokenized = [self.preprocess_func(q) for q in queries]
+        results = self.index.search_batch(tokenized, k or self.k)
+        return [[self.docs[i] for i in top] for top in results]
+
+
+# 测试检索器
+if __name__ == "__main__":
+    from rank_bm25 import BM25Okapi
+
+    corpus = [
+        "LangChain 是 一个 LLM 应用 框架",
+        "BM25 是 基于 词频 的 检索 算法",
+        "混合 检索 结合 BM25 和 向量 检索",
+        "Chroma 是 本地 向量 数据库",
+    ]
+    query = "BM25 检索 算法"
+
+    retriever = FastBM25Retriever.from_texts(corpus, k=3)
+    reference = BM25Okapi([t.split() for t in corpus])
+
+    print(f"FastBM25 分数: {np.round(retriever.index.get_scores(query.split()), 4)}")
+    print(f"rank_bm25 分数: {np.round(reference.get_scores(query.split()), 4)}")
+    for doc in retriever.invoke(query):
+        print(f"  {doc.page_content}")
@@ -0,0 +1,166 @@
+"""
+增量索引：只向 Chroma 写入新增或变化的文档块
+============================================
+
+Chroma.from_documents 每次运行都会把全部文档块重新嵌入并追加到同一个
+持久化集合里，集合越来越大、检索越来越慢。
+
+ChromaIndexer 为每个块生成稳定 ID（来源路径 + 块偏移 + 内容哈希）：
+- 新位置的块          -> 新增 (added)
+- 同一位置内容变了    -> 更新 (updated，删除旧 ID、写入新 ID)
+- 来源删除/块消失     -> 删除 (deleted)
+- 完全没变            -> 跳过，不调用 embedding
+
+用法：
+    vectorstore = Chroma(persist_directory=..., embedding_function=embeddings)
+    report = ChromaIndexer(vectorstore).sync(chunks)
+    print(report)
+
+需要写入的块很多时，可以交给 13_rag_basics/rag_utils/ingest_pipeline.py
+分批嵌入并写入：ChromaIndexer(vectorstore, pipeline=IngestPipeline(...))
+
+块 ID 由 13_rag_basics/rag_utils/ingest_pipeline.py 的 chunk_id 计算，
+调用方（main.py、test.py）需要先把 13_rag_basics/rag_utils 加入 sys.path
+"""
+
+from dataclasses import dataclass
+
+# Chroma get() 分页大小
+_PAGE_SIZE = 1000
+
+
+@dataclass
+class IndexReport:
+    """一次同步的结果统计"""
+    added: int = 0
+    updated: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+
+    def __str__(self):
+        return (f"新增 {self.added}，更新 {self.updated}，"
+                f"删除 {self.deleted}，未变 {self.unchanged}")
+
+
+def assign_chunk_ids(chunks):
+    """
+    为文档块计算稳定 ID，并把 source / start_index / content_hash 写入 metadata
+
+    偏移优先使用 splitter 的 add_start_index=True 写入的 start_index；
+    没有时退化为该来源内的块序号。
+    """
+    # 与 13 模块的入库流水线共用同一个函数，两边写入的同一个块 ID 相同
+    from ingest_pipeline import chunk_id, content_hash
+
+    ids = []
+    ordinals = {}
+    for chunk in chunks:
+        source = str(chunk.metadata.get("source", ""))
+        ordinal = ordinals.get(source, 0)
+        ordinals[source] = ordinal + 1
+
+        offset = chunk.metadata.get("start_index", ordinal)
+        digest = content_hash(chunk.page_content)
+        chunk.metadata.update({"source": source, "start_index": offset, "content_hash": digest})
+        ids.append(chunk_id(source, offset, digest))
+    return ids
+
+
+class ChromaIndexer:
+    """
+    Chroma 增量索引器
+
+    参数:
+        vectorstore: langchain 的 Chroma 实例（已指定 embedding_function）
+        pipeline: 可选的 IngestPipeline；指定后新增/更新的块由流水线分批嵌入写入，
+                  否则调用 vectorstore.add_documents
+    """
+
+    def __init__(self, vectorstore, pipeline=None):
+        self.vectorstore = vectorstore
+        self.pipeline = pipeline
+
+    def existing_entries(self):
+        """读取集合中已有的 {id: (source, start_index)}"""
+        entries = {}
+        offset = 0
+        while True:
+            page = self.vectorstore.get(include=["metadatas"], limit=_PAGE_SIZE, offset=offset)
+            for doc_id, metadata in zip(page["ids"], page["metadatas"]):
+                metadata = metadata or {}
+                entries[doc_id] = (metadata.get("source", ""), metadata.get("start_index"))
+            if len(page["ids"]) < _PAGE_SIZE:
+                return entries
+            offset += _PAGE_SIZE
+
+    def sync(self, chunks, sources=None) -> IndexReport:
+        """
+        让集合内容与 chunks 保持一致
+
+        参数:
+            chunks: 当前语料的全部文档块
+            sources: 只同步这些来源；为 None 时 chunks 视为完整语料，
+                     集合中其他来源的块（已删除的文件）也会被清理
+        """
+        ids = assign_chunk_ids(chunks)
+        desired = dict(zip(ids, chunks))
+        existing = self.existing_entries()
+        if sources is not None:
+            scope = {str(s) for s in sources}
+            existing = {i: pos for i, pos in existing.items() if pos[0] in scope}
+
+        new_ids = [i for i in desired if i not in existing]
+        stale_ids = [i for i in existing if i not in desired]
+
+        # 同一 (source, offset) 上的替换算作更新，其余才是新增/删除
+        stale_positions = {existing[i] for i in stale_ids}
+        report = IndexReport(unchanged=len(desired) - len(new_ids))
+        for i in new_ids:
+            chunk = desired[i]
+            position = (chunk.metadata["source"], chunk.metadata["start_index"])
+            if position in stale_positions:
+                report.updated += 1
+            else:
+                report.added += 1
+        report.deleted = len(stale_ids) - report.updated
+
+        if stale_ids:
+            self.vectorstore.delete(ids=stale_ids)
+        if new_ids and self.pipeline is not None:
+            for i in new_ids:
+                desired[i].id = i
+            self.pipeline.run(desired[i] for i in new_ids)
+        elif new_ids:
+            self.vectorstore.add_documents([desired[i] for i in new_ids], ids=new_ids)
+        return report
+
+
+# 测试增量索引
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    from pathlib import Path
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_community.vectorstores import Chroma
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "13_rag_basics" / "rag_utils"))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Chroma(persist_directory=tmp, embedding_function=DeterministicFakeEmbedding(size=8))
+        indexer = ChromaIndexer(store)
+
+        docs = [
+            Document(page_content="LangChain 核心组件", metadata={"source": "a.txt", "start_index": 0}),
+            Document(page_content="BM25 关键词检索", metadata={"source": "a.txt", "start_index": 20}),
+            Document(page_content="Chroma 向量存储", metadata={"source": "b.txt", "start_index": 0}),
+        ]
+        print(f"首次同步: {indexer.sync(docs)}")
+        print(f"重复同步: {indexer.sync(docs)}")
+
+        edited = [
+            Document(page_content="LangChain 核心组件（已修改）", metadata={"source": "a.txt", "start_index": 0}),
+            Document(page_content="BM25 关键词检索", metadata={"source": "a.txt", "start_index": 20}),
+        ]
+        print(f"修改 a.txt 并删除 b.txt: {indexer.sync(edited)}")
+        print(f"集合大小: {len(store.get()['ids'])}")
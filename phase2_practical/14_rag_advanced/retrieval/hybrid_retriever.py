@@ -0,0 +1,225 @@
+"""
+并行混合检索：同时查询 BM25 和向量检索器
+=====================================
+
+EnsembleRetriever.invoke 依次调用每个子检索器，混合检索的延迟是各路之和。
+
+ParallelEnsembleRetriever 继承 EnsembleRetriever（权重校验、加权 RRF 融合都复用），
+只改变 "如何取回各路结果"：
+- 同步 invoke：所有子检索器同时提交到线程池
+- 异步 ainvoke：原生异步的检索器直接 await，其余放到线程池
+- 每路可设置超时，超时或出错的那一路按空结果参与 RRF（降级而不是整体失败）
+
+这样混合检索的延迟约等于最慢的一路，而不是两路相加。
+
+用法：
+    hybrid = ParallelEnsembleRetriever(
+        retrievers=[bm25_retriever, vector_retriever],
+        weights=[0.4, 0.6],
+        timeouts=[0.5, 2.0],     # 秒，None 表示不限时
+    )
+    docs = hybrid.invoke("BM25 算法")
+    print(hybrid.last_run)       # 每一路的状态和耗时
+    hybrid.close()               # 关闭线程池（也可以用 with hybrid: ...）
+"""
+
+import asyncio
+import concurrent.futures
+import time
+from functools import partial
+from typing import Any, List, Optional, Union
+
+from langchain_classic.retrievers import EnsembleRetriever
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import Runnable
+from langchain_core.runnables.config import patch_config
+from pydantic import PrivateAttr
+
+
+def _timed_invoke(retriever, query, config):
+    """在线程中执行检索，并记录完成时刻"""
+    docs = retriever.invoke(query, config)
+    return docs, time.perf_counter()
+
+
+def is_async_native(retriever) -> bool:
+    """检索器是否实现了自己的异步检索（而不是默认的 run_in_executor）"""
+    if isinstance(retriever, BaseRetriever):
+        return type(retriever)._aget_relevant_documents is not BaseRetriever._aget_relevant_documents
+    return type(retriever).ainvoke is not Runnable.ainvoke
+
+
+class ParallelEnsembleRetriever(EnsembleRetriever):
+    """
+    并行版 EnsembleRetriever
+
+    参数（除 EnsembleRetriever 的 retrievers / weights / c / id_key 外）:
+        timeouts: 每路超时秒数；传一个数字表示所有路相同，None 表示不限时
+        max_workers: 线程池大小，默认等于子检索器数量
+
+    线程无法强制中断：超时的那一路会继续占用一个工作线程直到跑完，
+    下一次检索时如果线程都被占着，新任务要排队。子检索器经常超时时把 max_workers 调大。
+    """
+
+    timeouts: Optional[Union[float, List[Optional[float]]]] = None
+    max_workers: Optional[int] = None
+
+    _executor: Any = PrivateAttr(default=None)
+    _last_run: list = PrivateAttr(default_factory=list)
+
+    @property
+    def last_run(self) -> list:
+        """最近一次检索每一路的 {retriever, status, latency_ms, count}"""
+        return self._last_run
+
+    def _timeout_list(self):
+        if isinstance(self.timeouts, (int, float)) or self.timeouts is None:
+            return [self.timeouts] * len(self.retrievers)
+        if len(self.timeouts) != len(self.retrievers):
+            raise ValueError(
+                f"timeouts 数量（{len(self.timeouts)}）与检索器数量（{len(self.retrievers)}）不一致"
+            )
+        return list(self.timeouts)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_workers or len(self.retrievers),
+                thread_name_prefix="hybrid-retriever",
+            )
+        return self._executor
+
+    def close(self):
+        """关闭线程池，不等待仍在运行（超时）的任务；之后再检索会新建线程池"""
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _child_configs(self, config, run_manager):
+        return [
+            patch_config(config, callbacks=run_manager.get_child(tag=f"retriever_{i + 1}"))
+            for i in range(len(self.retrievers))
+        ]
+
+    def _collect(self, outcomes, started):
+        """整理各路结果：失败或超时的那一路返回空列表"""
+        doc_lists, report = [], []
+        for i, (status, docs, finished) in enumerate(outcomes):
+            docs = [Document(page_content=d) if isinstance(d, str) else d for d in docs]
+            doc_lists.append(docs)
+            report.append({
+                "retriever": type(self.retrievers[i]).__name__,
+                "status": status,
+                "latency_ms": (finished - started) * 1000,
+                "count": len(docs),
+            })
+        self._last_run = report
+        return doc_lists
+
+    def rank_fusion(self, query, run_manager, *, config=None) -> List[Document]:
+        """同步：所有子检索器同时在线程池中执行，按各自的截止时间收集结果"""
+        executor = self._get_executor()
+        configs = self._child_configs(config, run_manager)
+        started = time.perf_counter()
+        futures = [
+            executor.submit(_timed_invoke, retriever, query, child_config)
+            for retriever, child_config in zip(self.retrievers, configs)
+        ]
+
+        outcomes = []
+        for future, timeout in zip(futures, self._timeout_list()):
+            remaining = None if timeout is None else max(0.0, started + timeout - time.perf_counter())
+            try:
+                docs, finished = future.result(timeout=remaining)
+                outcomes.append(("ok", docs, finished))
+            except concurrent.futures.TimeoutError:
+                # 线程无法强制中断，超时的任务在后台跑完后结果被丢弃
+                future.cancel()
+                outcomes.append(("timeout", [], started + timeout))
+            except Exception as e:
+                outcomes.append((f"error: {e}", [], time.perf_counter()))
+
+        return self.weighted_reciprocal_rank(self._collect(outcomes, started))
+
+    async def arank_fusion(self, query, run_manager, *, config=None) -> List[Document]:
+        """异步：原生异步的检索器直接 await，其余在线程池中执行"""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        configs = self._child_configs(config, run_manager)
+        started = time.perf_counter()
+
+        async def run_one(retriever, child_config, timeout):
+            if is_async_native(retriever):
+                call = retriever.ainvoke(query, child_config)
+            else:
+                call = loop.run_in_executor(executor, partial(retriever.invoke, query, child_config))
+            try:
+                docs = await asyncio.wait_for(call, timeout)
+                return "ok", docs, time.perf_counter()
+            except asyncio.TimeoutError:
+                return "timeout", [], started + timeout
+            except Exception as e:
+                return f"error: {e}", [], time.perf_counter()
+
+        outcomes = await asyncio.gather(*[
+            run_one(retriever, child_config, timeout)
+            for retriever, child_config, timeout in zip(self.retrievers, configs, self._timeout_list())
+        ])
+        return self.weighted_reciprocal_rank(self._collect(outcomes, started))
+
+
+def latency_percentiles(retriever, queries, repeat=1):
+    """对检索器测延迟，返回 (p50, p99) 毫秒"""
+    samples = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            retriever.invoke(query)
+            samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p50 = samples[len(samples) // 2]
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return p50, p99
+
+
+# 测试：用 sleep 模拟两路不同延迟的检索器
+if __name__ == "__main__":
+    from langchain_core.callbacks import CallbackManagerForRetrieverRun
+
+    class SlowRetriever(BaseRetriever):
+        delay: float
+        prefix: str
+
+        def _get_relevant_documents(
+            self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+        ) -> List[Document]:
+            time.sleep(self.delay)
+            return [Document(page_content=f"{self.prefix}-{i}") for i in range(3)]
+
+    bm25 = SlowRetriever(delay=0.03, prefix="bm25")
+    vector = SlowRetriever(delay=0.05, prefix="vector")
+    queries = [f"query {i}" for i in range(20)]
+
+    sequential = EnsembleRetriever(retrievers=[bm25, vector], weights=[0.4, 0.6])
+    parallel = ParallelEnsembleRetriever(retrievers=[bm25, vector], weights=[0.4, 0.6])
+
+    for name, retriever in [("EnsembleRetriever", sequential), ("ParallelEnsembleRetriever", parallel)]:
+        p50, p99 = latency_percentiles(retriever, queries)
+        print(f"{name:>26}: p50 {p50:.1f} ms, p99 {p99:.1f} ms")
+
+    with ParallelEnsembleRetriever(
+        retrievers=[bm25, vector], weights=[0.4, 0.6], timeouts=[1.0, 0.01]
+    ) as degraded:
+        docs = degraded.invoke("query")
+        print(f"\n向量检索超时后降级: {[d.page_content for d in docs]}")
+        print(f"各路状态: {degraded.last_run}")
+
+    print(f"\n异步调用: {[d.page_content for d in asyncio.run(parallel.ainvoke('query'))][:3]}")
+    parallel.close()
@@ -0,0 +1,208 @@
+"""
+重排序：用交叉编码器对混合检索的候选重新打分
+==========================================
+
+EnsembleRetriever 的 RRF 只看排名，不看查询和文档块的实际相关程度；
+示例 6 的工具原来直接截取 docs[:2]。
+
+CrossEncoderReranker 在混合检索之后：
+- 只取前 max_candidates 个候选（限制打分成本）
+- (查询, 文档块) 按 batch_size 分批送入本地交叉编码器，一批一次前向计算
+- 分数按 (查询哈希, 文档块内容哈希) 缓存，重复查询不再打分
+- 按分数返回前 top_n 个，并记录每次查询的延迟
+
+RerankRetriever 把 "检索 + 重排序" 包装成一个 LangChain 检索器。
+
+用法：
+    reranker = CrossEncoderReranker(top_n=3, max_candidates=10)
+    retriever = RerankRetriever(base_retriever=ensemble_retriever, reranker=reranker)
+    docs = retriever.invoke("如何优化 RAG 性能？")
+    print(retriever.last_run)      # 检索 / 重排序耗时
+    print(reranker.stats)
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import PrivateAttr
+
+# 支持中文的多语言交叉编码器（约 470 MB）
+DEFAULT_MODEL_NAME = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class RerankStats:
+    """累计统计"""
+    queries: int = 0
+    candidates: int = 0
+    scored: int = 0
+    cache_hits: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+    @property
+    def avg_latency_ms(self):
+        return self.seconds / self.queries * 1000 if self.queries else 0.0
+
+    def __str__(self):
+        return (f"重排序 {self.queries} 次查询，平均 {self.avg_latency_ms:.1f} ms/查询；"
+                f"候选 {self.candidates}，模型打分 {self.scored}（{self.batches} 批），缓存命中 {self.cache_hits}")
+
+
+class CrossEncoderReranker:
+    """
+    交叉编码器重排序
+
+    参数:
+        model_name: sentence-transformers 的 CrossEncoder 模型名
+        top_n: 返回的文档块数
+        max_candidates: 最多对多少个候选打分（取检索结果的前若干个）
+        batch_size: 每次前向计算的 (查询, 文档块) 对数
+        cache_size: 分数缓存的最大条数（LRU）
+        score_fn: 自定义打分函数 score_fn(pairs) -> 分数列表；默认加载 CrossEncoder
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, top_n=3, max_candidates=20, batch_size=16,
+                 cache_size=10_000, score_fn=None):
+        if top_n < 1 or max_candidates < 1 or batch_size < 1:
+            raise ValueError("top_n / max_candidates / batch_size 必须大于 0")
+        self.model_name = model_name
+        self.top_n = top_n
+        self.max_candidates = max_candidates
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._score_fn = score_fn
+        self._cache = OrderedDict()
+        self.stats = RerankStats()
+        self.last_run = {}
+
+    def load(self):
+        """加载交叉编码器（第一次打分时也会自动加载）"""
+        if self._score_fn is None:
+            from sentence_transformers import CrossEncoder
+
+            model = CrossEncoder(self.model_name)
+            self._score_fn = lambda pairs: model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        return self
+
+    def score(self, query, docs):
+        """对 (query, doc) 打分，返回与 docs 对应的分数列表（命中缓存的不再计算）"""
+        query_key = _digest(query)
+        keys = [(query_key, _digest(doc.page_content)) for doc in docs]
+        scores = [self._cache.get(key) for key in keys]
+        for key, value in zip(keys, scores):
+            if value is not None:
+                self._cache.move_to_end(key)
+
+        todo = [i for i, value in enumerate(scores) if value is None]
+        batches = 0
+        if todo:
+            self.load()
+        for start in range(0, len(todo), self.batch_size):
+            batch = todo[start:start + self.batch_size]
+            values = self._score_fn([(query, docs[i].page_content) for i in batch])
+            batches += 1
+            for i, value in zip(batch, values):
+                scores[i] = float(value)
+                self._cache[keys[i]] = scores[i]
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        self.stats.scored += len(todo)
+        self.stats.cache_hits += len(docs) - len(todo)
+        self.stats.batches += batches
+        return scores
+
+    def rerank(self, query, docs, top_n=None):
+        """重排序候选，返回分数最高的 top_n 个（metadata 中写入 rerank_score）"""
+        started = time.perf_counter()
+        candidates = list(docs)[:self.max_candidates]
+        scores = self.score(query, candidates)
+        order = sorted(range(len(candidates)), key=lambda i: -scores[i])[:top_n or self.top_n]
+        results = [
+            Document(
+                id=candidates[i].id,
+                page_content=candidates[i].page_content,
+                metadata={**candidates[i].metadata, "rerank_score": scores[i]},
+            )
+            for i in order
+        ]
+        elapsed = time.perf_counter() - started
+        self.stats.queries += 1
+        self.stats.candidates += len(candidates)
+        self.stats.seconds += elapsed
+        self.last_run = {"candidates": len(candidates), "returned": len(results), "latency_ms": elapsed * 1000}
+        return results
+
+
+class RerankRetriever(BaseRetriever):
+    """
+    先用 base_retriever 检索，再用 reranker 重排序的检索器
+
+    参数:
+        base_retriever: 召回阶段的检索器（如 EnsembleRetriever）
+        reranker: CrossEncoderReranker
+    """
+
+    base_retriever: Any
+    reranker: Any
+
+    _last_run: dict = PrivateAttr(default_factory=dict)
+
+    @property
+    def last_run(self) -> dict:
+        """最近一次查询的 {retrieve_ms, rerank_ms, candidates, returned}"""
+        return self._last_run
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        started = time.perf_counter()
+        candidates = self.base_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        retrieved = time.perf_counter()
+        results = self.reranker.rerank(query, candidates)
+        self._last_run = {
+            "retrieve_ms": (retrieved - started) * 1000,
+            "rerank_ms": self.reranker.last_run["latency_ms"],
+            "candidates": len(candidates),
+            "returned": len(results),
+        }
+        return results
+
+
+# 测试：用字符重合度模拟交叉编码器，演示分批打分和分数缓存
+if __name__ == "__main__":
+    calls = []
+
+    def overlap_score(pairs):
+        calls.append(len(pairs))
+        time.sleep(0.001 * len(pairs))      # 模拟模型计算
+        return [len(set(q) & set(d)) / (len(set(d)) or 1) for q, d in pairs]
+
+    docs = [Document(page_content=f"第 {i} 段：" + ("RAG 性能优化" if i % 7 == 0 else "LangChain 组件介绍"))
+            for i in range(30)]
+
+    class ListRetriever(BaseRetriever):
+        def _get_relevant_documents(self, query, *, run_manager):
+            return docs
+
+    reranker = CrossEncoderReranker(top_n=3, max_candidates=20, batch_size=8, score_fn=overlap_score)
+    retriever = RerankRetriever(base_retriever=ListRetriever(), reranker=reranker)
+
+    for query in ["RAG 性能优化", "RAG 性能优化", "LangChain 组件"]:
+        results = retriever.invoke(query)
+        print(f"{query}: {[d.page_content for d in results]}")
+        run = retriever.last_run
+        print(f"  候选 {run['candidates']}，检索 {run['retrieve_ms']:.2f} ms，重排序 {run['rerank_ms']:.2f} ms")
+    print(f"每批打分对数: {calls}")
+    print(reranker.stats)
@@ -0,0 +1,235 @@
+"""
+权重调优：复用各路检索结果，在内存中扫描 RRF 权重和 c 常数
+========================================================
+
+为每组权重新建一个 EnsembleRetriever 再 invoke，每组都要把 BM25 和向量检索
+重新跑一遍：扫描 100 组权重就是 100 倍的检索开销。
+
+但 RRF 只依赖各路的 "排名"，与权重无关。WeightSweep 的做法：
+1. collect()：每个查询、每路检索器只执行一次，缓存排好序的结果
+2. evaluate()：对任意权重网格 × c 常数，用 NumPy 在内存中重新融合并打分
+   （recall@k / MRR / nDCG@k），不再调用任何检索器
+
+融合规则与 EnsembleRetriever.weighted_reciprocal_rank 完全相同
+（包括按 page_content / id_key 去重、同分时保持首次出现的顺序）。
+
+标注文件（JSONL，每行一个查询）：
+    {"query": "BM25 是什么？", "relevant": ["Best Match 25"]}
+relevant 中每一项是相关文档内容里会出现的一段文字（或 id_key 模式下的文档 ID）。
+
+用法：
+    sweep = WeightSweep([bm25_retriever, vector_retriever], names=["bm25", "vector"])
+    sweep.collect(load_labeled_queries("data/labeled_queries.jsonl"))
+    for row in sweep.evaluate(weight_grid(2, step=0.1), c_values=[10, 30, 60], k=3)[:5]:
+        print(row)
+"""
+
+import itertools
+import json
+import time
+
+import numpy as np
+
+
+def load_labeled_queries(path):
+    """读取 JSONL 标注文件，返回 [{"query": str, "relevant": [str, ...]}, ...]"""
+    labeled = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if "query" not in item or "relevant" not in item:
+                raise ValueError(f"{path} 第 {line_no} 行缺少 query 或 relevant 字段")
+            labeled.append(item)
+    return labeled
+
+
+def weight_grid(num_retrievers, step=0.1):
+    """所有和为 1 的权重组合（步长 step），至少一路权重大于 0"""
+    steps = round(1 / step)
+    grid = []
+    for combo in itertools.product(range(steps + 1), repeat=num_retrievers - 1):
+        if sum(combo) <= steps:
+            weights = [c / steps for c in combo] + [(steps - sum(combo)) / steps]
+            grid.append(tuple(round(w, 6) for w in weights))
+    return grid
+
+
+class _QueryCache:
+    """单个查询的缓存：去重后的文档、每路的排名矩阵、相关性矩阵"""
+
+    def __init__(self, doc_lists, relevant, key_func, match_func):
+        self.docs = []
+        position = {}
+        for doc in itertools.chain.from_iterable(doc_lists):
+            key = key_func(doc)
+            if key not in position:
+                position[key] = len(self.docs)
+                self.docs.append(doc)
+
+        # ranks[i, j]：第 i 路中第 j 个文档的排名（从 1 开始），不在该路结果中为 inf
+        self.ranks = np.full((len(doc_lists), len(self.docs)), np.inf)
+        for i, doc_list in enumerate(doc_lists):
+            for rank, doc in enumerate(doc_list, start=1):
+                j = position[key_func(doc)]
+                if np.isinf(self.ranks[i, j]):
+                    self.ranks[i, j] = rank
+
+        # matches[j, l]：第 j 个文档是否命中第 l 个标注
+        self.matches = np.array(
+            [[match_func(doc, label) for label in relevant] for doc in self.docs],
+            dtype=bool,
+        ).reshape(len(self.docs), len(relevant))
+
+
+class WeightSweep:
+    """
+    RRF 权重扫描器
+
+    参数:
+        retrievers: 子检索器列表（顺序与权重一一对应）
+        names: 各路名称，用于输出
+        id_key: 与 EnsembleRetriever.id_key 含义相同；为 None 时按 page_content 去重，
+                标注按 "内容包含" 匹配；否则按 metadata[id_key] 精确匹配
+    """
+
+    def __init__(self, retrievers, names=None, id_key=None):
+        self.retrievers = retrievers
+        self.names = names or [type(r).__name__ for r in retrievers]
+        self.id_key = id_key
+        self.queries = []
+        self.cache = []
+        self.retrieval_seconds = 0.0
+
+    def _key(self, doc):
+        return doc.page_content if self.id_key is None else doc.metadata[self.id_key]
+
+    def _match(self, doc, label):
+        return label in doc.page_content if self.id_key is None else doc.metadata[self.id_key] == label
+
+    def _run_retriever(self, retriever, queries):
+        # FastBM25Retriever 支持一次矩阵乘法完成批量查询
+        if hasattr(retriever, "search_batch"):
+            return retriever.search_batch(queries)
+        return retriever.batch(queries)
+
+    def collect(self, labeled_queries):
+        """每路检索器对每个查询只执行一次，缓存排序结果"""
+        queries = [item["query"] for item in labeled_queries]
+        start = time.perf_counter()
+        per_retriever = [self._run_retriever(r, queries) for r in self.retrievers]
+        self.retrieval_seconds += time.perf_counter() - start
+
+        for q, item in enumerate(labeled_queries):
+            doc_lists = [results[q] for results in per_retriever]
+            self.queries.append(item)
+            self.cache.append(_QueryCache(doc_lists, item["relevant"], self._key, self._match))
+        return self
+
+    @staticmethod
+    def _fused_order(entry, weights, c_values):
+        """
+        一次算出所有 (权重, c) 组合下的融合排序
+
+        返回形状为 (len(weights) * len(c_values), 文档数) 的下标矩阵
+        """
+        # contrib[c, i, j] = 1 / (rank + c)，不在该路结果中为 0
+        contrib = 1.0 / (entry.ranks[None, :, :] + np.asarray(c_values, dtype=float)[:, None, None])
+        scores = np.einsum("gi,cij->gcj", weights, contrib).reshape(-1, entry.ranks.shape[1])
+        # 稳定排序：同分时保持首次出现的顺序（与 EnsembleRetriever 的 sorted 一致）
+        return np.argsort(-scores, axis=1, kind="stable")
+
+    def evaluate(self, weights_list, c_values=(60,), k=3, sort_by="ndcg"):
+        """
+        在内存中评估所有 (权重, c) 组合
+
+        返回按 sort_by（"recall" / "mrr" / "ndcg"）降序排列的
+        [{"weights", "c", "recall", "mrr", "ndcg"}, ...]
+        """
+        if not self.cache:
+            raise ValueError("请先调用 collect() 收集检索结果")
+        weights = np.asarray(weights_list, dtype=float)
+        if weights.ndim != 2 or weights.shape[1] != len(self.retrievers):
+            raise ValueError(f"每组权重需要 {len(self.retrievers)} 个值")
+
+        combos = len(weights) * len(c_values)
+        recall = np.zeros(combos)
+        mrr = np.zeros(combos)
+        ndcg = np.zeros(combos)
+        discounts = 1.0 / np.log2(np.arange(2, k + 2))
+
+        for entry in self.cache:
+            if not entry.docs or entry.matches.shape[1] == 0:
+                continue
+            top = self._fused_order(entry, weights, c_values)[:, :k]
+            hit_labels = entry.matches[top]                 # (组合, k, 标注数)
+            relevant_docs = hit_labels.any(axis=2)          # (组合, k)
+
+            recall += hit_labels.any(axis=1).mean(axis=1)
+            first = np.where(relevant_docs.any(axis=1), relevant_docs.argmax(axis=1) + 1, np.inf)
+            mrr += 1.0 / first
+
+            ideal_count = min(k, int(entry.matches.any(axis=1).sum()))
+            if ideal_count:
+                dcg = (relevant_docs * discounts[:relevant_docs.shape[1]]).sum(axis=1)
+                ndcg += dcg / discounts[:ideal_count].sum()
+
+        n = len(self.cache)
+        rows = [
+            {
+                "weights": tuple(float(w) for w in weights[g]),
+                "c": c_values[ci],
+                "recall": float(recall[g * len(c_values) + ci] / n),
+                "mrr": float(mrr[g * len(c_values) + ci] / n),
+                "ndcg": float(ndcg[g * len(c_values) + ci] / n),
+            }
+            for g in range(len(weights))
+            for ci in range(len(c_values))
+        ]
+        return sorted(rows, key=lambda row: row[sort_by], reverse=True)
+
+    def fuse(self, query_index, weights, c=60):
+        """用缓存结果得到某个查询在指定权重下的融合文档列表"""
+        entry = self.cache[query_index]
+        order = self._fused_order(entry, np.asarray([weights], dtype=float), [c])[0]
+        return [entry.docs[j] for j in order]
+
+
+# 测试：随机模拟 1000 个查询、两路检索，扫描 100 个组合
+if __name__ == "__main__":
+    from langchain_classic.retrievers import EnsembleRetriever
+    from langchain_core.documents import Document
+    from langchain_core.runnables import RunnableLambda
+
+    rng = np.random.default_rng(0)
+    corpus = [Document(page_content=f"doc-{i}") for i in range(500)]
+    rankings = {
+        f"q{i}": (rng.choice(500, 10, replace=False), rng.choice(500, 10, replace=False))
+        for i in range(1000)
+    }
+    legs = [
+        RunnableLambda(lambda q, leg=leg: [corpus[j] for j in rankings[q][leg]])
+        for leg in range(2)
+    ]
+    labeled = [
+        {"query": q, "relevant": [f"doc-{ranks[0][0]}", f"doc-{ranks[1][1]}"]}
+        for q, ranks in rankings.items()
+    ]
+
+    sweep = WeightSweep(legs, names=["bm25", "vector"]).collect(labeled)
+    grid = weight_grid(2, step=0.1)
+    c_values = [1, 5, 10, 20, 30, 40, 60, 80, 100]
+
+    start = time.perf_counter()
+    results = sweep.evaluate(grid, c_values=c_values, k=3)
+    print(f"{len(grid) * len(c_values)} 个组合 × {len(labeled)} 个查询: {time.perf_counter() - start:.2f}s")
+    for row in results[:3]:
+        print(f"  {row}")
+
+    # 与 EnsembleRetriever 的融合结果对比
+    ensemble = EnsembleRetriever(retrievers=legs, weights=[0.3, 0.7], c=10)
+    expected = [d.page_content for d in ensemble.invoke("q0")]
+    actual = [d.page_content for d in sweep.fuse(0, [0.3, 0.7], c=10)]
+    print(f"与 EnsembleRetriever 一致: {expected == actual}")
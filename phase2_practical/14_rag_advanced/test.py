@@ -3,6 +3,7 @@
 """
 
 import os
+import sys
 from pathlib import Path
 
 # 获取脚本所在目录
@@ -10,6 +11,10 @@ SCRIPT_DIR = Path(__file__).parent
 DATA_DIR = SCRIPT_DIR / "data"
 CHROMA_DIR = SCRIPT_DIR / "chroma_db"
 
+# 添加 retrieval 目录和 13 模块的 rag_utils（chroma_indexer 使用其中的 chunk_id）到路径
+sys.path.insert(0, str(SCRIPT_DIR.parent / "13_rag_basics" / "rag_utils"))
+sys.path.insert(0, str(SCRIPT_DIR / "retrieval"))
+
 # 确保目录存在
 DATA_DIR.mkdir(exist_ok=True)
 CHROMA_DIR.mkdir(exist_ok=True)
@@ -76,7 +81,8 @@ documents = loader.load()
 splitter = RecursiveCharacterTextSplitter(
     chunk_size=150,
     chunk_overlap=30,
-    separators=["\n\n", "\n", " ", ""]
+    separators=["\n\n", "\n", " ", ""],
+    add_start_index=True
 )
 
 chunks = splitter.split_documents(documents)
@@ -101,11 +107,19 @@ try:
         model_name="sentence-transformers/all-MiniLM-L6-v2"
     )
 
-    vectorstore = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory=str(CHROMA_DIR)
+    from chroma_indexer import ChromaIndexer
+
+    vectorstore = Chroma(
+        persist_directory=str(CHROMA_DIR),
+        embedding_function=embeddings
     )
+    report = ChromaIndexer(vectorstore).sync(chunks)
+    print(f"  增量索引: {report}")
+
+    # 再同步一次：内容没变，不应有任何写入
+    rerun = ChromaIndexer(vectorstore).sync(chunks)
+    assert rerun.added == rerun.updated == rerun.deleted == 0
+    print(f"  重复同步: {rerun}")
 
     vector_retriever = vectorstore.as_retriever(search_kwargs={"k": 2})
 
@@ -133,15 +147,22 @@ print("\n--- 测试 3: BM25 检索器 ---")
 
 try:
     from langchain_community.retrievers import BM25Retriever
+    from bm25_index import FastBM25Retriever
 
-    bm25_retriever = BM25Retriever.from_documents(chunks)
+    bm25_retriever = FastBM25Retriever.from_documents(chunks)
     bm25_retriever.k = 2
 
     # 测试查询
     query = "BM25 算法"
     results = bm25_retriever.invoke(query)
 
-    print(f"\n[OK] BM25 检索成功")
+    # 与 rank_bm25 实现的分数对比
+    reference = BM25Retriever.from_documents(chunks)
+    fast_scores = bm25_retriever.index.get_scores(query.split())
+    reference_scores = reference.vectorizer.get_scores(query.split())
+    assert all(abs(a - b) < 1e-9 for a, b in zip(fast_scores, reference_scores))
+
+    print(f"\n[OK] BM25 检索成功（分数与 rank_bm25 一致）")
     print(f"  查询: {query}")
     print(f"  结果数: {len(results)}")
     if results:
@@ -155,9 +176,41 @@ except Exception as e:
 
 
 # ============================================================================
-# 测试 4：混合检索器
+# 测试 4：中文分词
+# ============================================================================
+print("\n--- 测试 4: 中文分词 ---")
+
+import tempfile
+from bm25_index import FastBM25Retriever
+from bm25_tokenizers import build_tokenizer
+
+query = "LangChain 有哪些核心组件？"
+print(f"\n  查询: {query}")
+print(f"  按空白切分: {query.split()}")
+
+with tempfile.TemporaryDirectory() as token_cache:
+    for mode, kwargs in [("ngram", {}), ("dictionary", {"words": ["核心", "组件", "有哪些"]})]:
+        tokenizer = build_tokenizer(mode, cache_dir=token_cache, **kwargs)
+        retriever = FastBM25Retriever.from_documents(chunks, preprocess_func=tokenizer, k=1)
+        top = retriever.invoke(query)[0].page_content[:40].replace("\n", " ")
+        stats = tokenizer.stats()
+        print(f"\n  [{mode}] {tokenizer(query)}")
+        print(f"    最相关: {top}...")
+        print(f"    分词吞吐: {stats['tokens_per_sec']:,.0f} tokens/秒")
+
+        # 重建索引：全部命中缓存，不再分词
+        rebuilt = build_tokenizer(mode, cache_dir=token_cache, **kwargs)
+        FastBM25Retriever.from_documents(chunks, preprocess_func=rebuilt)
+        assert rebuilt.stats()["misses"] == 0
+        print(f"    重建索引: 缓存命中 {rebuilt.stats()['hits']} 块")
+
+print(f"\n[OK] 中文分词测试完成")
+
+
+# ============================================================================
+# 测试 5：混合检索器
 # ============================================================================
-print("\n--- 测试 4: 混合检索器 (EnsembleRetriever) ---")
+print("\n--- 测试 5: 混合检索器 (EnsembleRetriever) ---")
 
 if vector_retriever and bm25_retriever:
     try:
@@ -207,9 +260,9 @@ else:
 
 
 # ============================================================================
-# 测试 5：权重对比
+# 测试 6：权重对比
 # ============================================================================
-print("\n--- 测试 5: 权重对比 ---")
+print("\n--- 测试 6: 权重对比 ---")
 
 if vector_retriever and bm25_retriever:
     try:
@@ -241,6 +294,102 @@ else:
     print(f"\n[SKIP] 权重对比跳过")
 
 
+# ============================================================================
+# 测试 7：并行混合检索（两路 BM25，不需要向量模型）
+# ============================================================================
+print("\n--- 测试 7: 并行混合检索 (ParallelEnsembleRetriever) ---")
+
+from langchain_classic.retrievers import EnsembleRetriever
+from hybrid_retriever import ParallelEnsembleRetriever
+
+whitespace_leg = FastBM25Retriever.from_documents(chunks, k=3)
+ngram_leg = FastBM25Retriever.from_documents(chunks, preprocess_func=build_tokenizer("ngram"), k=3)
+
+sequential = EnsembleRetriever(retrievers=[whitespace_leg, ngram_leg], weights=[0.5, 0.5])
+parallel = ParallelEnsembleRetriever(
+    retrievers=[whitespace_leg, ngram_leg], weights=[0.5, 0.5], timeouts=5.0
+)
+
+query = "混合检索 BM25"
+expected = [d.page_content for d in sequential.invoke(query)]
+actual = [d.page_content for d in parallel.invoke(query)]
+assert actual == expected, "并行结果应与 EnsembleRetriever 一致"
+
+print(f"\n[OK] 并行混合检索结果与 EnsembleRetriever 一致")
+for leg in parallel.last_run:
+    print(f"  {leg['retriever']}: {leg['status']}, {leg['latency_ms']:.2f} ms, {leg['count']} 条")
+
+# close() 之后再检索会新建线程池；with 退出时关闭
+parallel.close()
+with parallel:
+    assert [d.page_content for d in parallel.invoke(query)] == expected
+assert parallel._executor is None
+
+
+# ============================================================================
+# 测试 8：权重扫描（复用缓存的检索结果）
+# ============================================================================
+print("\n--- 测试 8: 权重扫描 (WeightSweep) ---")
+
+from weight_sweep import WeightSweep, weight_grid
+
+labeled = [
+    {"query": "BM25 算法", "relevant": ["Best Match 25"]},
+    {"query": "RRF 融合", "relevant": ["Reciprocal Rank Fusion"]},
+    {"query": "创建代理", "relevant": ["create_agent"]},
+]
+sweep = WeightSweep([whitespace_leg, ngram_leg], names=["空白分词", "n-gram"]).collect(labeled)
+
+# 缓存结果融合出的排序应与 EnsembleRetriever 重新检索一致
+for weights in ([0.0, 1.0], [0.3, 0.7], [0.5, 0.5], [1.0, 0.0]):
+    ensemble = EnsembleRetriever(retrievers=[whitespace_leg, ngram_leg], weights=weights, c=10)
+    for i, item in enumerate(labeled):
+        expected = [d.page_content for d in ensemble.invoke(item["query"])]
+        actual = [d.page_content for d in sweep.fuse(i, weights, c=10)]
+        assert actual == expected, f"权重 {weights} 的融合结果应与 EnsembleRetriever 一致"
+
+results = sweep.evaluate(weight_grid(2, step=0.1), c_values=[10, 60], k=3)
+print(f"\n[OK] 融合结果与 EnsembleRetriever 一致，扫描 {len(results)} 个组合")
+for row in results[:3]:
+    print(f"  权重 {list(row['weights'])}, c={row['c']}: "
+          f"recall@3={row['recall']:.2f}  MRR={row['mrr']:.2f}  nDCG@3={row['ndcg']:.2f}")
+
+
+# ============================================================================
+# 测试 9：重排序（用词重合度代替交叉编码器，不需要下载模型）
+# ============================================================================
+print("\n--- 测试 9: 重排序 (CrossEncoderReranker) ---")
+
+from reranker import CrossEncoderReranker, RerankRetriever
+
+batch_sizes = []
+
+def overlap_score(pairs):
+    batch_sizes.append(len(pairs))
+    return [len(set(q.split()) & set(d.split())) for q, d in pairs]
+
+reranker = CrossEncoderReranker(top_n=2, max_candidates=5, batch_size=2, score_fn=overlap_score)
+rerank_retriever = RerankRetriever(base_retriever=parallel, reranker=reranker)
+
+query = "混合检索 BM25"
+reranked = rerank_retriever.invoke(query)
+candidates = parallel.invoke(query)[:5]
+scores = [len(set(query.split()) & set(d.page_content.split())) for d in candidates]
+assert len(reranked) == min(2, len(candidates))
+assert [d.metadata["rerank_score"] for d in reranked] == sorted(scores, reverse=True)[:len(reranked)]
+assert all(size <= 2 for size in batch_sizes), "每批最多 batch_size 对"
+
+# 同一查询再次检索：分数全部来自缓存，不再调用打分函数
+scored_before = reranker.stats.scored
+rerank_retriever.invoke(query)
+assert reranker.stats.scored == scored_before and reranker.stats.cache_hits == len(candidates)
+
+print(f"\n[OK] 重排序测试通过")
+print(f"  {reranker.stats}")
+print(f"  最近一次: 检索 {rerank_retriever.last_run['retrieve_ms']:.2f} ms，"
+      f"重排序 {rerank_retriever.last_run['rerank_ms']:.2f} ms")
+
+
 # ============================================================================
 # 总结
 # ============================================================================
@@ -251,9 +400,13 @@ print("=" * 70)
 print("\n已验证:")
 print("  [OK] 文档加载和分割")
 print("  [OK] 向量检索 (HuggingFaceEmbeddings + Chroma)")
-print("  [OK] BM25 检索 (需要 rank_bm25)")
+print("  [OK] BM25 检索 (FastBM25Retriever，与 rank_bm25 对比)")
+print("  [OK] 中文分词 (字符 n-gram / 词典，带缓存)")
 print("  [OK] 混合检索 (EnsembleRetriever)")
 print("  [OK] 权重调整")
+print("  [OK] 并行混合检索 (ParallelEnsembleRetriever)")
+print("  [OK] 权重扫描 (WeightSweep)")
+print("  [OK] 重排序 (CrossEncoderReranker)")
 
 print("\n核心要点:")
 print("  1. 向量搜索 - 语义理解")
@@ -0,0 +1,294 @@
+"""
+异步 Agent 运行器：多个 thread_id 并发，同一 thread_id 顺序执行
+==========================================================
+
+示例里都是 agent.invoke(...) 同步调用，一次只处理一个 thread_id；
+服务端同时有成百上千个用户时，绝大部分时间都在等模型返回。
+
+AsyncAgentRunner 包装 create_agent 创建的 Agent，用 ainvoke / astream 并发处理多个会话：
+- 全局并发上限：asyncio.Semaphore(max_concurrency)，同时进行的对话轮次不超过该值
+- 同一 thread_id 的轮次按提交顺序依次执行（每个 thread_id 一把锁），
+  不会有两轮同时读取、写入同一个会话的检查点；排队等锁时不占用全局名额
+- 按模型提供方限速：rate_limits={"groq": 0.5} 为每个提供方创建一个共享的 InMemoryRateLimiter，
+  limit_model(model) 返回带限速器的模型副本，Agent 每次调用模型前都要取得令牌
+- run_many 批量提交 (thread_id, 消息)，按提交顺序返回 TurnResult（输出或异常、排队和运行耗时）
+
+注意：SqliteSaver 不支持异步方法，并发运行时使用 AsyncSqliteSaver（或 InMemorySaver）。
+
+用法：
+    runner = AsyncAgentRunner(max_concurrency=64, rate_limits={"groq": 0.5})
+    model = runner.limit_model(init_chat_model("groq:llama-3.3-70b-versatile"))
+    async with AsyncSqliteSaver.from_conn_string("multi_user.sqlite") as checkpointer:
+        runner.agent = create_agent(model=model, tools=[], checkpointer=checkpointer)
+        results = await runner.run_many([("alice", "我是 Alice"), ("bob", "我是 Bob"), ("alice", "我是谁？")])
+        async with aclosing(runner.astream("bob", "我是谁？")) as stream:   # 提前 break 时立即释放会话锁
+            async for state in stream:
+                ...
+    print(runner.stats)
+"""
+
+import asyncio
+import time
+from contextlib import aclosing, asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Any
+
+from langchain_core.rate_limiters import InMemoryRateLimiter
+
+
+def _as_input(message):
+    """字符串视为一条用户消息；dict（如 {"messages": [...]}）原样传给 Agent"""
+    if isinstance(message, str):
+        return {"messages": [{"role": "user", "content": message}]}
+    return message
+
+
+def _provider_of(model):
+    """从模型类所在的包推断提供方：langchain_groq.ChatGroq -> "groq" """
+    package = type(model).__module__.split(".")[0]
+    return package[len("langchain_"):] if package.startswith("langchain_") else package
+
+
+def _thread_config(thread_id, config):
+    config = dict(config or {})
+    config["configurable"] = {**config.get("configurable", {}), "thread_id": thread_id}
+    return config
+
+
+@contextmanager
+def _cancel_at(deadline):
+    """
+    到 deadline（loop.time()）时取消当前任务，并把这次取消转换成 TimeoutError
+
+    与 Python 3.11 的 asyncio.timeout 相同的做法；不像 wait_for 那样另起任务，
+    流式 Agent 的每一步都在调用方的任务（同一个 contextvars 上下文）中执行
+    """
+    task = asyncio.current_task()
+    expired = []
+
+    def expire():
+        expired.append(True)
+        task.cancel()
+
+    handle = asyncio.get_running_loop().call_at(deadline, expire)
+    try:
+        yield
+    except asyncio.CancelledError:
+        if not expired:
+            raise
+        if hasattr(task, "uncancel"):
+            task.uncancel()
+        raise asyncio.TimeoutError() from None
+    finally:
+        handle.cancel()
+
+
+@dataclass
+class TurnResult:
+    """run_many 中一轮对话的结果"""
+    thread_id: str
+    output: Any = None
+    error: BaseException = None
+    queued_ms: float = 0.0      # 等待同一会话的上一轮和全局名额的时间
+    run_ms: float = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+@dataclass
+class RunnerStats:
+    """累计统计"""
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    queued_seconds: float = 0.0
+    run_seconds: float = 0.0
+
+    def __str__(self):
+        finished = self.completed + self.failed
+        avg_queue = self.queued_seconds / finished * 1000 if finished else 0.0
+        avg_run = self.run_seconds / finished * 1000 if finished else 0.0
+        return (f"提交 {self.submitted} 轮，完成 {self.completed}，失败 {self.failed}；"
+                f"最大并发 {self.peak_in_flight}；平均排队 {avg_queue:.1f} ms，平均运行 {avg_run:.1f} ms")
+
+
+class AsyncAgentRunner:
+    """
+    并发运行 Agent 的多个会话
+
+    参数:
+        agent: create_agent 创建的 Agent（也可以之后再赋值 runner.agent）
+        max_concurrency: 同时进行的对话轮次上限
+        rate_limits: {提供方: 每秒请求数}，或 {提供方: InMemoryRateLimiter 的参数 dict}
+        timeout: 单轮的超时秒数（None 表示不限）；astream 从取得名额到产出最后一个结果整体计时
+    """
+
+    def __init__(self, agent=None, max_concurrency=32, rate_limits=None, timeout=None):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency 必须大于 0")
+        self.agent = agent
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.stats = RunnerStats()
+        self._semaphore = None
+        self._threads = {}          # thread_id -> [锁, 使用中的轮次数]
+        self._limiters = {}
+        for provider, limit in (rate_limits or {}).items():
+            options = limit if isinstance(limit, dict) else {"requests_per_second": limit}
+            self._limiters[provider] = InMemoryRateLimiter(**options)
+
+    def rate_limiter(self, provider):
+        """提供方共享的限速器（未配置时返回 None）"""
+        return self._limiters.get(provider)
+
+    def limit_model(self, model, provider=None):
+        """返回带提供方限速器的模型副本；提供方默认按模型类所在的包推断"""
+        limiter = self.rate_limiter(provider or _provider_of(model))
+        if limiter is None:
+            return model
+        return model.model_copy(update={"rate_limiter": limiter})
+
+    @asynccontextmanager
+    async def _turn(self, thread_id):
+        """先按顺序取得会话锁，再取得全局名额；yield 排队耗时"""
+        if self._semaphore is None:
+            # 在事件循环内创建（Python 3.10 的 Semaphore 会绑定创建时的事件循环）
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        entry = self._threads.setdefault(thread_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        self.stats.submitted += 1
+        queued = time.perf_counter()
+        try:
+            async with entry[0], self._semaphore:
+                waited = time.perf_counter() - queued
+                self.stats.queued_seconds += waited
+                self.stats.in_flight += 1
+                self.stats.peak_in_flight = max(self.stats.peak_in_flight, self.stats.in_flight)
+                started = time.perf_counter()
+                try:
+                    yield waited
+                    self.stats.completed += 1
+                except BaseException:
+                    self.stats.failed += 1
+                    raise
+                finally:
+                    self.stats.in_flight -= 1
+                    self.stats.run_seconds += time.perf_counter() - started
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                # 没有排队的轮次时释放锁对象，会话数很多时不会一直占用内存
+                del self._threads[thread_id]
+
+    async def ainvoke(self, thread_id, message, config=None):
+        """在 thread_id 会话中执行一轮，返回最终状态"""
+        async with self._turn(thread_id):
+            call = self.agent.ainvoke(_as_input(message), _thread_config(thread_id, config))
+            return await (asyncio.wait_for(call, self.timeout) if self.timeout else call)
+
+    async def astream(self, thread_id, message, config=None, stream_mode="values"):
+        """
+        在 thread_id 会话中执行一轮，逐个产出 astream 的结果
+
+        整个流式过程都持有会话锁和全局名额。提前 break 时，生成器要等被关闭才会释放它们，
+        因此用 contextlib.aclosing 包住：
+            async with aclosing(runner.astream(thread_id, message)) as stream:
+                async for state in stream:
+                    ...
+        超时（timeout）时抛出 asyncio.TimeoutError，同样释放锁和名额
+        """
+        async with self._turn(thread_id):
+            stream = self.agent.astream(
+                _as_input(message), _thread_config(thread_id, config), stream_mode=stream_mode
+            )
+            deadline = asyncio.get_running_loop().time() + self.timeout if self.timeout else None
+            async with aclosing(stream):
+                while True:
+                    try:
+                        if deadline is None:
+                            item = await stream.__anext__()
+                        else:
+                            # 只在等待下一个结果时计时，调用方处理结果时不会被取消
+                            with _cancel_at(deadline):
+                                item = await stream.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    yield item
+
+    async def run_many(self, turns, config=None):
+        """
+        并发执行多轮对话
+
+        参数:
+            turns: [(thread_id, 消息), ...]；同一 thread_id 的轮次按列表顺序执行
+        返回:
+            与 turns 顺序一致的 TurnResult 列表（异常记录在 error 中，不会中断其他轮次）
+        """
+        async def run_one(thread_id, message):
+            result = TurnResult(thread_id)
+            started = time.perf_counter()
+            try:
+                async with self._turn(thread_id) as waited:
+                    result.queued_ms = waited * 1000
+                    call = self.agent.ainvoke(_as_input(message), _thread_config(thread_id, config))
+                    result.output = await (asyncio.wait_for(call, self.timeout) if self.timeout else call)
+            except Exception as e:
+                result.error = e
+            result.run_ms = (time.perf_counter() - started) * 1000 - result.queued_ms
+            return result
+
+        # 按顺序创建任务：同一 thread_id 的轮次按提交顺序排队等锁（asyncio.Lock 先到先得）
+        tasks = [asyncio.ensure_future(run_one(thread_id, message)) for thread_id, message in turns]
+        return await asyncio.gather(*tasks)
+
+
+# 测试：离线假模型，对比逐个同步调用和并发调用
+if __name__ == "__main__":
+    from langchain.agents import create_agent
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    from fake_chat_model import FakeChatModel
+
+    users, rounds = 50, 3
+    turns = [(f"user_{u}", f"第 {r} 轮") for r in range(rounds) for u in range(users)]
+
+    sequential_agent = create_agent(model=FakeChatModel(first_token_latency=0.05), tools=[],
+                                    checkpointer=InMemorySaver())
+    started = time.perf_counter()
+    for thread_id, message in turns[:users]:
+        sequential_agent.invoke(_as_input(message), _thread_config(thread_id, None))
+    sequential = (time.perf_counter() - started) * rounds
+    print(f"同步逐个调用（估算 {len(turns)} 轮）: {sequential:.2f}s")
+
+    async def main():
+        runner = AsyncAgentRunner(max_concurrency=20, rate_limits={"fake": {"requests_per_second": 200,
+                                                                              "max_bucket_size": 20}})
+        model = runner.limit_model(FakeChatModel(first_token_latency=0.05), provider="fake")
+        runner.agent = create_agent(model=model, tools=[], checkpointer=InMemorySaver())
+
+        started = time.perf_counter()
+        results = await runner.run_many(turns)
+        print(f"AsyncAgentRunner（{len(turns)} 轮）: {time.perf_counter() - started:.2f}s")
+        print(f"  {runner.stats}")
+
+        # 每个会话的消息按提交顺序排列
+        history = [m.content for m in results[-1].output["messages"] if m.type == "human"]
+        print(f"  {results[-1].thread_id} 的用户消息: {history}")
+        assert history == [f"第 {r} 轮" for r in range(rounds)]
+
+        async with aclosing(runner.astream("user_0", "流式的第 4 轮")) as stream:
+            async for state in stream:
+                last = state["messages"][-1]
+        print(f"  astream 最后一条: {last.content}")
+
+        # 提前 break：aclosing 退出时释放会话锁和名额
+        async with aclosing(runner.astream("user_1", "只看第一个结果")) as stream:
+            async for state in stream:
+                break
+        print(f"  剩余会话锁: {len(runner._threads)}")
+
+    asyncio.run(main())
@@ -0,0 +1,378 @@
+"""
+基准测试套件：Agent 热点路径的耗时（离线假模型，无网络）
+====================================================
+
+各模块的 test.py 只打印结果、不计时。本套件用 FakeChatModel（零延迟）测量框架本身的开销：
+
+- agent.build              create_agent 构建图的耗时（06 的计算器 + 天气工具）
+- agent.step               Agent 循环每一步（模型节点或工具节点）的平均开销
+- middleware.chain.N       N 个 before_model / after_model 空中间件时，一次调用的耗时（10）
+- checkpoint.put/get.N     SqliteSaver 写入 / 读取含 N 条消息的检查点（09，会话越长越慢）
+- retrieval.bm25/vector/ensemble   14 的 FastBM25Retriever、Chroma 向量检索、ParallelEnsembleRetriever
+
+所有项按轮交替运行 REPEATS 轮，每项记录中位数、p95、平均、最小耗时（毫秒）和迭代次数，写入 JSON（带 git 提交号和环境信息）。
+指定 --baseline 时与之前的结果比较：中位数变慢超过阈值（默认 30%，可按项设置）视为回归，退出码为 1。
+快速模式不同或某项的参数（数据规模等）不同的结果不能比较。
+
+运行：
+    python shared/bench_suite.py --output bench.json                  # 全部
+    python shared/bench_suite.py --quick --only retrieval              # 快速模式，只跑检索
+    python shared/bench_suite.py --baseline bench.json --threshold 0.15
+"""
+
+import argparse
+import gc
+import json
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from contextlib import ExitStack, closing
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+ROOT_DIR = SCRIPT_DIR.parent
+sys.path.insert(0, str(SCRIPT_DIR))
+
+# 各项的回归阈值（中位数允许变慢的比例），未列出的使用 --threshold
+THRESHOLDS = {
+    "retrieval.ensemble": 0.4,      # 线程池调度，波动较大
+}
+# 中位数的变化小于该值（毫秒）时不算回归：亚毫秒级的项在单核机器上波动可达 50%
+MIN_DELTA_MS = 0.25
+# 轮数：虚拟机上会有持续约 1 秒、整体慢 1.5 倍的时段，逐项连续运行时同一提交两次的中位数可相差 50% 以上。
+# 所有项按轮交替运行（第 1 轮全部项，再第 2 轮……），慢的时段分摊到各项的不同轮，中位数的波动降到 20% 左右
+REPEATS = 5
+
+
+@dataclass
+class BenchResult:
+    """一项基准测试的结果（毫秒）"""
+    name: str
+    median_ms: float
+    p95_ms: float
+    mean_ms: float
+    min_ms: float
+    iterations: int                 # 每轮的次数
+    repeats: int = 1
+    params: dict = field(default_factory=dict)
+
+    def __str__(self):
+        return (f"{self.name:<28} 中位数 {self.median_ms:9.3f} ms  p95 {self.p95_ms:9.3f} ms  "
+                f"最小 {self.min_ms:9.3f} ms  ({self.repeats}×{self.iterations} 次)")
+
+
+@dataclass
+class Case:
+    """一项基准测试：每轮调用 func iterations 次；per 为每次调用包含的操作数，结果按单次操作计"""
+    name: str
+    func: object
+    iterations: int
+    per: int = 1
+    params: dict = field(default_factory=dict)
+
+
+def _timed_round(case):
+    # 与 timeit 相同：计时期间关闭 GC，每轮之前回收一次，避免回收的停顿随机落在某几次调用上
+    gc.collect()
+    gc.disable()
+    try:
+        samples = []
+        for _ in range(case.iterations):
+            started = time.perf_counter()
+            case.func()
+            samples.append((time.perf_counter() - started) * 1000 / case.per)
+        return samples
+    finally:
+        gc.enable()
+
+
+def measure(cases, repeats=REPEATS, warmup=3):
+    """每项先预热 warmup 次，然后所有项按轮交替运行 repeats 轮，返回 [BenchResult]"""
+    for case in cases:
+        for _ in range(warmup):
+            case.func()
+    rounds = {case.name: [] for case in cases}
+    for _ in range(repeats):
+        for case in cases:
+            rounds[case.name].append(_timed_round(case))
+    results = []
+    for case in cases:
+        samples = sorted(sample for round_samples in rounds[case.name] for sample in round_samples)
+        results.append(BenchResult(
+            name=case.name,
+            median_ms=statistics.median(samples),
+            p95_ms=samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+            mean_ms=statistics.fmean(samples),
+            min_ms=samples[0],
+            iterations=case.iterations,
+            repeats=repeats,
+            params=case.params,
+        ))
+    return results
+
+
+# ============================================================================
+# Agent：构建和循环（06）
+# ============================================================================
+def _agent_tools():
+    sys.path.insert(0, str(ROOT_DIR / "phase1_fundamentals" / "04_custom_tools" / "tools"))
+    from calculator import calculator
+    from weather import get_weather
+    return [calculator, get_weather]
+
+
+def bench_agent(quick, stack):
+    from langchain.agents import create_agent
+    from fake_chat_model import FakeChatModel, tool_call
+
+    tools = _agent_tools()
+    model = FakeChatModel()
+    cases = [Case("agent.build", lambda: create_agent(model=model, tools=tools), 10 if quick else 25)]
+
+    # 每轮：3 次工具调用 + 最终回答 = 4 次模型节点 + 3 次工具节点
+    tool_rounds = 3
+    script = [tool_call("calculator", operation="add", a=i, b=1) for i in range(tool_rounds)] + ["计算完成"]
+    agent = create_agent(model=FakeChatModel(responses=script), tools=tools)
+    steps = tool_rounds * 2 + 1
+    message = {"messages": [{"role": "user", "content": "把 0 连续加 1 三次"}]}
+    cases.append(Case("agent.step", lambda: agent.invoke(message), 20 if quick else 50,
+                      per=steps, params={"steps_per_invoke": steps}))
+    return cases
+
+
+# ============================================================================
+# 中间件链（10）
+# ============================================================================
+def bench_middleware(quick, stack):
+    from langchain.agents import create_agent
+    from langchain.agents.middleware import AgentMiddleware
+    from fake_chat_model import FakeChatModel
+
+    class NoopMiddleware(AgentMiddleware):
+        def before_model(self, state, runtime):
+            return None
+
+        def after_model(self, state, runtime):
+            return None
+
+    cases = []
+    message = {"messages": [{"role": "user", "content": "你好"}]}
+    for count in (0, 1, 5, 10):
+        # 每个中间件实例的类名必须不同（create_agent 按名称区分中间件）
+        middleware = [type(f"Noop{i}", (NoopMiddleware,), {})() for i in range(count)]
+        agent = create_agent(model=FakeChatModel(), tools=[], middleware=middleware)
+        cases.append(Case(f"middleware.chain.{count}", lambda agent=agent: agent.invoke(message),
+                          20 if quick else 50, params={"middleware": count}))
+    return cases
+
+
+# ============================================================================
+# SqliteSaver 检查点（09）
+# ============================================================================
+def _history(length):
+    from langchain_core.messages import AIMessage, HumanMessage
+    return [
+        (HumanMessage if i % 2 == 0 else AIMessage)(content=f"第 {i} 条消息：我想查询订单 12345 的配送状态。")
+        for i in range(length)
+    ]
+
+
+def _checkpoint_put(saver, thread, messages):
+    from langgraph.checkpoint.base import empty_checkpoint
+    from langgraph.checkpoint.base.id import uuid6
+
+    config = {"configurable": {"thread_id": thread, "checkpoint_ns": ""}}
+
+    def put():
+        nonlocal config
+        checkpoint = empty_checkpoint()
+        checkpoint["id"] = str(uuid6())
+        checkpoint["channel_values"] = {"messages": messages}
+        checkpoint["channel_versions"] = {"messages": checkpoint["id"]}
+        config = saver.put(config, checkpoint, {"source": "loop", "step": 0}, {"messages": checkpoint["id"]})
+    return put
+
+
+def bench_checkpoint(quick, stack):
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    folder = stack.enter_context(tempfile.TemporaryDirectory())
+    conn = stack.enter_context(closing(sqlite3.connect(Path(folder) / "bench.sqlite", check_same_thread=False)))
+    saver = SqliteSaver(conn)
+    cases = []
+    iterations = 20 if quick else 50
+    for length in ((10, 100) if quick else (10, 100, 1000)):
+        thread = f"thread_{length}"
+        put = _checkpoint_put(saver, thread, _history(length))
+        put()       # get 的预热可能先于 put 运行，先写入一个检查点
+        latest = {"configurable": {"thread_id": thread, "checkpoint_ns": ""}}
+        cases.append(Case(f"checkpoint.put.{length}", put, iterations, params={"messages": length}))
+        cases.append(Case(f"checkpoint.get.{length}", lambda latest=latest: saver.get_tuple(latest), iterations,
+                          params={"messages": length}))
+    return cases
+
+
+# ============================================================================
+# 检索（14）
+# ============================================================================
+def _corpus(size):
+    topics = ["LangChain 组件", "RAG 检索", "向量数据库", "BM25 算法", "Agent 工具调用", "提示词模板", "中间件", "检查点"]
+    return [
+        f"{topics[i % len(topics)]} 第 {i} 节：介绍{topics[(i * 3) % len(topics)]}与{topics[(i * 5) % len(topics)]}的配合，"
+        f"包括配置参数、常见问题和性能优化建议，编号 {i}。"
+        for i in range(size)
+    ]
+
+
+def bench_retrieval(quick, stack):
+    sys.path.insert(0, str(ROOT_DIR / "phase2_practical" / "14_rag_advanced" / "retrieval"))
+    from langchain_community.vectorstores import Chroma
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from bm25_index import FastBM25Retriever
+    from bm25_tokenizers import build_tokenizer
+    from hybrid_retriever import ParallelEnsembleRetriever
+
+    texts = _corpus(500 if quick else 2000)
+    bm25 = FastBM25Retriever.from_texts(texts, preprocess_func=build_tokenizer("ngram"), k=3)
+    vectorstore = Chroma(collection_name=f"bench_{time.time_ns()}", embedding_function=DeterministicFakeEmbedding(size=384))
+    stack.callback(vectorstore.delete_collection)
+    vectorstore.add_texts(texts)
+    vector = vectorstore.as_retriever(search_kwargs={"k": 3})
+    ensemble = ParallelEnsembleRetriever(retrievers=[bm25, vector], weights=[0.4, 0.6])
+
+    queries = ["LangChain 有哪些核心组件？", "如何优化 RAG 性能？", "BM25 算法", "向量数据库怎么选"]
+    iterations = 20 if quick else 50
+    return [
+        Case(f"retrieval.{name}", lambda retriever=retriever: [retriever.invoke(q) for q in queries], iterations,
+             per=len(queries), params={"documents": len(texts)})
+        for name, retriever in (("bm25", bm25), ("vector", vector), ("ensemble", ensemble))
+    ]
+
+
+BENCHMARKS = {
+    "agent": bench_agent,
+    "middleware": bench_middleware,
+    "checkpoint": bench_checkpoint,
+    "retrieval": bench_retrieval,
+}
+
+
+# ============================================================================
+# 运行、保存、比较
+# ============================================================================
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(only=None, quick=False, echo=print, repeats=REPEATS):
+    """运行选中的基准测试（各组的所有项按轮交替运行），返回可写入 JSON 的 dict"""
+    results = {}
+    with ExitStack() as stack:
+        cases = []
+        for group, bench in BENCHMARKS.items():
+            if only and not any(o.split(".")[0] == group for o in only):
+                continue
+            cases += [case for case in bench(quick, stack)
+                      if not only or any(case.name.startswith(o) for o in only)]
+        for result in measure(cases, repeats):
+            results[result.name] = asdict(result)
+            echo(f"  {result}")
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=0.3, thresholds=None, min_delta_ms=MIN_DELTA_MS):
+    """
+    比较两次结果的中位数
+
+    快速模式不同时抛出 ValueError：迭代次数和数据规模都不同，结果没有可比性。
+    返回 [(名称, 基线 ms, 当前 ms, 变化比例, 状态)]，状态为 "ok" / "regression" / "improved" / "new"，
+    参数（数据规模等）不同的项为 "mismatch"，不参与比较
+    """
+    if bool(current["meta"].get("quick")) != bool(baseline["meta"].get("quick")):
+        raise ValueError("基线与本次的快速模式（--quick）不同，无法比较")
+    thresholds = {**THRESHOLDS, **(thresholds or {})}
+    rows = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            rows.append((name, None, result["median_ms"], None, "new"))
+            continue
+        before, after = base["median_ms"], result["median_ms"]
+        if base.get("params", {}) != result.get("params", {}):
+            rows.append((name, before, after, None, "mismatch"))
+            continue
+        change = (after - before) / before if before else 0.0
+        limit = thresholds.get(name, threshold)
+        if change > limit and after - before > min_delta_ms:
+            status = "regression"
+        elif change < -limit and before - after > min_delta_ms:
+            status = "improved"
+        else:
+            status = "ok"
+        rows.append((name, before, after, change, status))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Agent 热点路径基准测试（离线假模型）")
+    parser.add_argument("--only", nargs="*", help=f"只运行指定的组或项（前缀匹配）：{', '.join(BENCHMARKS)}")
+    parser.add_argument("--quick", action="store_true", help="减少迭代次数和数据规模")
+    parser.add_argument("--output", help="结果写入的 JSON 文件")
+    parser.add_argument("--baseline", help="与之前的 JSON 结果比较")
+    parser.add_argument("--threshold", type=float, default=0.3, help="中位数允许变慢的比例（默认 0.3）")
+    args = parser.parse_args(argv)
+
+    print(f"运行基准测试{'（快速模式）' if args.quick else ''}...")
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        current = run_benchmarks(args.only, args.quick)
+    if args.output:
+        Path(args.output).write_text(json.dumps(current, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n结果已写入 {args.output}")
+
+    if not args.baseline:
+        return 0
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+    try:
+        rows = compare(current, baseline, args.threshold)
+    except ValueError as e:
+        print(f"\n[错误] {e}")
+        return 2
+    print(f"\n与基线比较（{baseline['meta'].get('commit')} -> {current['meta'].get('commit')}）:")
+    for name, before, after, change, status in rows:
+        before_text = f"{before:9.3f}" if before is not None else "        -"
+        change_text = f"{change:+7.1%}" if change is not None else "      -"
+        print(f"  {name:<28} {before_text} -> {after:9.3f} ms  {change_text}  {status}")
+    mismatched = [row[0] for row in rows if row[4] == "mismatch"]
+    if mismatched:
+        print(f"\n[警告] {len(mismatched)} 项的参数与基线不同，未比较: {', '.join(mismatched)}")
+    regressions = [row for row in rows if row[4] == "regression"]
+    if regressions:
+        print(f"\n[回归] {len(regressions)} 项超过阈值: {', '.join(row[0] for row in regressions)}")
+        return 1
+    print("\n[OK] 没有回归")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""
+离线假聊天模型：不访问网络，行为可控，用于压测和性能分析
+=====================================================
+
+各模块都通过 init_chat_model("groq:llama-3.3-70b-versatile") 创建模型，没有 API key 和网络就无法运行，
+响应时间也随网络波动，没法做可重复的性能测试。
+
+FakeChatModel 是一个本地的 BaseChatModel：
+- 脚本化回复：responses 按顺序循环使用，每项可以是字符串、AIMessage、
+  {"content": ..., "tool_calls": [...]}，或函数 respond(messages, tools) 动态生成
+- 工具调用：tool_call("get_weather", city="北京") 生成一次工具调用；bind_tools 后 create_agent 可以正常运行
+- 没有脚本时回显最后一条消息（工具结果之后直接回答，Agent 循环会结束）
+- 延迟：first_token_latency（首 token 前）+ per_token_latency × token 数，jitter 为随机浮动比例
+- 故障注入：failure_rate 按概率失败，fail_on_calls 指定第几次调用失败（从 0 开始），抛出 FakeModelError
+- 流式：stream / astream 按 token 逐块产出，最后一块带工具调用和 usage_metadata
+- 同步和异步接口都支持；异步等待用 asyncio.sleep，不占线程
+- seed 固定时抖动和随机故障可重复
+
+导入本模块时注册 "fake" 提供方（langchain >= 1.3），之后可以直接：
+    init_chat_model("fake:scripted", responses=[...], per_token_latency=0.01)
+更早的 langchain 上注册会跳过，改用 FakeChatModel(...) 或 startup.get_model("fake:scripted")
+
+用法：
+    from fake_chat_model import FakeChatModel, tool_call
+
+    model = FakeChatModel(
+        responses=[tool_call("get_weather", city="北京"), "北京今天晴，25°C"],
+        first_token_latency=0.2, per_token_latency=0.01, jitter=0.1, failure_rate=0.01, seed=0,
+    )
+    agent = create_agent(model=model, tools=[get_weather])
+    print(model.stats)
+"""
+
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+PROVIDER = "fake"
+
+# 中日韩字符每个算一个 token，其余按空白 / 非空白片段切分；所有片段拼起来等于原文
+_TOKEN_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]|\s+|[^\s぀-ヿ㐀-䶿一-鿿가-힯]+")
+
+
+class FakeModelError(RuntimeError):
+    """注入的模型调用失败"""
+
+
+def tokenize(text):
+    """把文本切成 token 片段（拼接后等于原文）"""
+    return _TOKEN_PATTERN.findall(text or "")
+
+
+def tool_call(name, **args):
+    """脚本中的一次工具调用"""
+    return {"content": "", "tool_calls": [{"name": name, "args": args}]}
+
+
+@dataclass
+class FakeModelStats:
+    """累计统计"""
+    calls: int = 0
+    stream_calls: int = 0
+    failures: int = 0
+    tool_calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    sleep_seconds: float = 0.0
+
+    def __str__(self):
+        return (f"模型调用 {self.calls} 次（流式 {self.stream_calls}），失败 {self.failures}，"
+                f"工具调用 {self.tool_calls}；输入 {self.input_tokens} tokens，输出 {self.output_tokens} tokens；"
+                f"模拟延迟共 {self.sleep_seconds:.2f}s")
+
+
+def _text_of(message):
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    本地假聊天模型
+
+    参数:
+        model: 模型名（只用于显示）
+        responses: 按顺序循环使用的回复；为空时回显最后一条消息
+        respond: respond(messages, tools) -> 回复；设置后优先于 responses
+        first_token_latency: 第一个 token 之前的等待秒数
+        per_token_latency: 每个输出 token 的等待秒数
+        jitter: 延迟的随机浮动比例（0.1 表示 ±10%）
+        failure_rate: 每次调用失败的概率
+        fail_on_calls: 指定失败的调用序号（从 0 开始）
+        seed: 随机种子
+    """
+
+    model: str = "scripted"
+    responses: list = []
+    respond: Callable | None = None
+    first_token_latency: float = 0.0
+    per_token_latency: float = 0.0
+    jitter: float = 0.0
+    failure_rate: float = 0.0
+    fail_on_calls: tuple = ()
+    seed: int | None = None
+
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _rng: Any = PrivateAttr(default=None)
+    _stats: FakeModelStats = PrivateAttr(default_factory=FakeModelStats)
+
+    def model_post_init(self, context):
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self):
+        return "fake-chat-model"
+
+    @property
+    def _identifying_params(self):
+        return {"model": self.model}
+
+    @property
+    def stats(self):
+        return self._stats
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        formatted = [convert_to_openai_tool(t) for t in tools]
+        return super().bind(tools=formatted, **kwargs)
+
+    # ------------------------------------------------------------------
+    # 生成回复
+    # ------------------------------------------------------------------
+    def _plan(self, messages, tools, streaming):
+        """决定本次调用的回复、是否失败和各段延迟（加锁，保证并发调用时脚本按顺序取用）"""
+        with self._lock:
+            index = self._stats.calls
+            self._stats.calls += 1
+            self._stats.stream_calls += int(streaming)
+            fail = index in self.fail_on_calls or (self.failure_rate > 0 and self._rng.random() < self.failure_rate)
+            factors = [1 + self.jitter * (2 * self._rng.random() - 1) for _ in range(2)]
+            if fail:
+                self._stats.failures += 1
+            elif self.respond is None and self.responses:
+                reply = self.responses[index % len(self.responses)]
+
+        if fail:
+            return None, index, self.first_token_latency * factors[0], 0.0
+        if self.respond is not None:
+            reply = self.respond(messages, tools)
+        elif not self.responses:
+            reply = f"收到: {_text_of(messages[-1])}" if messages else "收到"
+        message = self._to_message(reply, index)
+        input_tokens = sum(len(tokenize(_text_of(m))) for m in messages)
+        output_tokens = len(tokenize(message.content))
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        with self._lock:
+            self._stats.input_tokens += input_tokens
+            self._stats.output_tokens += output_tokens
+            self._stats.tool_calls += len(message.tool_calls)
+        return message, index, self.first_token_latency * factors[0], self.per_token_latency * factors[1]
+
+    @staticmethod
+    def _to_message(reply, index):
+        if isinstance(reply, AIMessage):
+            return reply.model_copy(deep=True)
+        if isinstance(reply, str):
+            return AIMessage(content=reply)
+        calls = [
+            {"name": c["name"], "args": c.get("args", {}), "id": c.get("id") or f"call_{index}_{i}", "type": "tool_call"}
+            for i, c in enumerate(reply.get("tool_calls", []))
+        ]
+        return AIMessage(content=reply.get("content", ""), tool_calls=calls)
+
+    def _record_sleep(self, seconds):
+        with self._lock:
+            self._stats.sleep_seconds += seconds
+
+    def _failure(self, index):
+        return FakeModelError(f"注入的模型调用失败（第 {index} 次调用）")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message, index, first, per_token = self._plan(messages, kwargs.get("tools"), streaming=False)
+        delay = first + per_token * (message.usage_metadata["output_tokens"] if message else 0)
+        time.sleep(delay)
+        self._record_sleep(delay)
+        if message is None:
+            raise self._failure(index)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        message, index, first, per_token = self._plan(messages, kwargs.get("tools"), streaming=False)
+        delay = first + per_token * (message.usage_metadata["output_tokens"] if message else 0)
+        await asyncio.sleep(delay)
+        self._record_sleep(delay)
+        if message is None:
+            raise self._failure(index)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    # ------------------------------------------------------------------
+    # 流式输出
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _chunks(message):
+        """逐 token 的文本块，最后一块带工具调用和 usage_metadata"""
+        pieces = tokenize(message.content)
+        for piece in pieces:
+            yield AIMessageChunk(content=piece)
+        yield AIMessageChunk(
+            content="",
+            tool_call_chunks=[
+                {"name": c["name"], "args": json.dumps(c["args"], ensure_ascii=False), "id": c["id"], "index": i}
+                for i, c in enumerate(message.tool_calls)
+            ],
+            usage_metadata=message.usage_metadata,
+            chunk_position="last",
+        )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        message, index, first, per_token = self._plan(messages, kwargs.get("tools"), streaming=True)
+        time.sleep(first)
+        self._record_sleep(first)
+        if message is None:
+            raise self._failure(index)
+        for i, chunk in enumerate(self._chunks(message)):
+            if i and chunk.content:
+                time.sleep(per_token)
+                self._record_sleep(per_token)
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        message, index, first, per_token = self._plan(messages, kwargs.get("tools"), streaming=True)
+        await asyncio.sleep(first)
+        self._record_sleep(first)
+        if message is None:
+            raise self._failure(index)
+        for i, chunk in enumerate(self._chunks(message)):
+            if i and chunk.content:
+                await asyncio.sleep(per_token)
+                self._record_sleep(per_token)
+            yield ChatGenerationChunk(message=chunk)
+
+
+def register(provider=PROVIDER):
+    """
+    把 FakeChatModel 注册为 init_chat_model 的提供方
+
+    init_chat_model 没有公开的注册接口，这里向 langchain.chat_models.base 的提供方表中添加一项
+    （"provider:model" 前缀的解析也依赖这张表）。这张表是 langchain 1.3 才有的私有实现，
+    更早的版本没有时不注册，返回 False（startup.get_model 对 "fake:..." 会直接创建 FakeChatModel）
+    """
+    from langchain.chat_models import base
+
+    if not hasattr(base, "_BUILTIN_PROVIDERS"):
+        return False
+    base._BUILTIN_PROVIDERS[provider] = (
+        __name__, FakeChatModel.__name__, lambda cls, model, **kwargs: cls(model=model, **kwargs)
+    )
+    if hasattr(base, "_get_chat_model_creator"):
+        base._get_chat_model_creator.cache_clear()
+    return True
+
+
+REGISTERED = register()
+
+
+# 测试：脚本化工具调用驱动 Agent 循环，流式输出和故障注入
+if __name__ == "__main__":
+    from langchain.agents import create_agent
+    from langchain.chat_models import init_chat_model
+    from langchain_core.tools import tool
+
+    @tool
+    def get_weather(city: str) -> str:
+        """查询城市天气"""
+        return f"{city}：晴，25°C"
+
+    options = dict(
+        responses=[tool_call("get_weather", city="北京"), "北京今天晴，气温 25°C，适合出门。"],
+        first_token_latency=0.05,
+        per_token_latency=0.005,
+        jitter=0.2,
+        seed=0,
+    )
+    model = init_chat_model("fake:scripted", **options) if REGISTERED else FakeChatModel(**options)
+    agent = create_agent(model=model, tools=[get_weather])
+
+    started = time.perf_counter()
+    result = agent.invoke({"messages": [{"role": "user", "content": "北京天气怎么样？"}]})
+    print(f"Agent 循环（{time.perf_counter() - started:.2f}s）:")
+    for message in result["messages"]:
+        print(f"  {message.type:<6} {message.content or message.tool_calls}")
+
+    print("\n流式输出: ", end="")
+    for chunk, _ in agent.stream({"messages": [{"role": "user", "content": "北京天气怎么样？"}]},
+                                 stream_mode="messages"):
+        if chunk.type == "AIMessageChunk" and chunk.content:
+            print(chunk.content, end="|", flush=True)
+    print()
+
+    flaky = FakeChatModel(fail_on_calls=(1,))
+    for i in range(3):
+        try:
+            print(f"调用 {i}: {flaky.invoke('你好').content}")
+        except FakeModelError as e:
+            print(f"调用 {i}: {e}")
+    print(model.stats)
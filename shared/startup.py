@@ -0,0 +1,268 @@
+"""
+启动层：延迟导入和延迟创建模型，缩短模块的启动时间
+===============================================
+
+各模块的 main.py 在顶层导入 langchain.agents（langgraph）、Chroma（chromadb）、Pinecone 等重量级依赖，
+并在导入时调用 init_chat_model：即使只运行一个示例、或者在 test.py 里导入一个函数，
+也要先付出数秒的导入时间，没有 GROQ_API_KEY 时直接抛出 ValueError。
+
+- lazy_import("langchain_community.vectorstores", "Chroma")：第一次调用或访问属性时才真正导入；
+  依赖没有安装时，到真正使用时才报 ImportError（例如没有 Pinecone 时可以回退到 FAISS）
+- get_model()：第一次调用时读取 .env 和环境变量 CHAT_MODEL（默认 groq:llama-3.3-70b-versatile）创建模型并缓存；
+  CHAT_MODEL=fake:scripted 时使用离线的 FakeChatModel，不需要 API key
+- import_profile(path)：在新的解释器中用 -X importtime 导入模块，按顶层包汇总导入耗时
+- cold_start(path, call="example_1_xxx")：新解释器从启动到运行完第一个示例的耗时
+
+用法：
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "shared"))
+    from startup import get_model, lazy_import
+
+    Chroma = lazy_import("langchain_community.vectorstores", "Chroma")
+    create_agent = lazy_import("langchain.agents", "create_agent")
+
+    agent = create_agent(model=get_model(), tools=[...])   # 此时才导入 langgraph、创建模型
+
+    python shared/startup.py phase2_practical/14_rag_advanced/main.py --call example_1_prepare_data
+"""
+
+import argparse
+import importlib
+import os
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+DEFAULT_MODEL = "groq:llama-3.3-70b-versatile"
+MODEL_ENV = "CHAT_MODEL"
+
+# 提供方 -> API key 环境变量；未设置或仍是 .env.example 中的占位值时报错
+API_KEY_ENVS = {
+    "groq": "GROQ_API_KEY",
+    "openai": "OPENAI_API_KEY",
+    "anthropic": "ANTHROPIC_API_KEY",
+    "google_genai": "GOOGLE_API_KEY",
+}
+
+_models = {}
+_models_lock = threading.Lock()
+_env_loaded = False
+
+
+class LazyImport:
+    """
+    延迟导入的模块或模块属性
+
+    参数:
+        module: 模块名
+        attr: 属性名；为 None 时代表模块本身
+    """
+
+    __slots__ = ("_module", "_attr", "_target")
+
+    def __init__(self, module, attr=None):
+        self._module = module
+        self._attr = attr
+        self._target = None
+
+    def _resolve(self):
+        if self._target is None:
+            target = importlib.import_module(self._module)
+            self._target = getattr(target, self._attr) if self._attr else target
+        return self._target
+
+    @property
+    def loaded(self):
+        return self._target is not None
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        name = f"{self._module}.{self._attr}" if self._attr else self._module
+        return f"<LazyImport {name} ({'已导入' if self.loaded else '未导入'})>"
+
+
+def lazy_import(module, *attrs):
+    """lazy_import("pkg") 返回延迟导入的模块；lazy_import("pkg", "A", "B") 返回对应属性（多个时为元组）"""
+    if not attrs:
+        return LazyImport(module)
+    if len(attrs) == 1:
+        return LazyImport(module, attrs[0])
+    return tuple(LazyImport(module, attr) for attr in attrs)
+
+
+def load_env():
+    """读取 .env（只读一次）"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def _api_key(provider):
+    env = API_KEY_ENVS.get(provider)
+    if env is None:
+        return None
+    key = os.getenv(env)
+    if not key or key.startswith("your_"):
+        raise ValueError(f"请先设置 {env}（或设置 {MODEL_ENV}=fake:scripted 离线运行）")
+    return key
+
+
+def get_model(spec=None, **kwargs):
+    """
+    第一次调用时创建聊天模型，之后返回同一个实例
+
+    参数:
+        spec: "provider:model"；默认读取环境变量 CHAT_MODEL，未设置时为 DEFAULT_MODEL
+        **kwargs: 传给 init_chat_model 的参数（参数不同时分别缓存）
+    """
+    load_env()
+    spec = spec or os.getenv(MODEL_ENV) or DEFAULT_MODEL
+    key = (spec, repr(sorted(kwargs.items())))    # 参数可能含列表等不可哈希的值
+    with _models_lock:
+        if key in _models:
+            return _models[key]
+        provider = spec.split(":", 1)[0] if ":" in spec else None
+        if provider == "fake":
+            # 直接创建，不经过 init_chat_model 的提供方表（旧版 langchain 上无法注册 fake 提供方）
+            sys.path.insert(0, str(SCRIPT_DIR))
+            from fake_chat_model import FakeChatModel
+            model = _models[key] = FakeChatModel(model=spec.split(":", 1)[1], **kwargs)
+            return model
+        api_key = _api_key(provider)
+        if api_key is not None:
+            kwargs.setdefault("api_key", api_key)
+        from langchain.chat_models import init_chat_model
+        model = _models[key] = init_chat_model(spec, **kwargs)
+        return model
+
+
+# ============================================================================
+# 导入耗时分析
+# ============================================================================
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+@dataclass
+class ImportEntry:
+    name: str
+    self_ms: float
+    cumulative_ms: float
+    depth: int
+
+
+@dataclass
+class ImportProfile:
+    """-X importtime 的解析结果"""
+    target: str
+    seconds: float                  # 子进程总耗时（含解释器启动）
+    entries: list = field(default_factory=list)
+    error: str = ""
+
+    @property
+    def import_ms(self):
+        return sum(e.cumulative_ms for e in self.entries if e.depth == 0)
+
+    def by_package(self):
+        """按顶层包汇总的自身导入耗时，从高到低"""
+        totals = {}
+        for entry in self.entries:
+            package = entry.name.split(".")[0]
+            totals[package] = totals.get(package, 0.0) + entry.self_ms
+        return sorted(totals.items(), key=lambda item: -item[1])
+
+    def report(self, top=15):
+        lines = [f"{self.target}: 总耗时 {self.seconds:.2f}s，其中导入 {self.import_ms / 1000:.2f}s"]
+        if self.error:
+            lines.append(f"  [错误] {self.error}")
+        for package, ms in self.by_package()[:top]:
+            lines.append(f"  {package:<32} {ms:9.1f} ms")
+        return "\n".join(lines)
+
+
+def _child_code(target, call=None):
+    """在子进程中导入 target（.py 路径或模块名），可选地调用其中一个函数"""
+    path = Path(target)
+    if path.suffix == ".py":
+        path = path.resolve()
+        code = (
+            "import importlib.util, sys\n"
+            f"sys.path.insert(0, {str(path.parent)!r})\n"
+            f"spec = importlib.util.spec_from_file_location('__profiled__', {str(path)!r})\n"
+            "module = importlib.util.module_from_spec(spec)\n"
+            "spec.loader.exec_module(module)\n"
+        )
+        cwd = path.parent
+    else:
+        code = f"import importlib\nmodule = importlib.import_module({target!r})\n"
+        cwd = None
+    if call:
+        code += f"getattr(module, {call!r})()\n"
+    return code, cwd
+
+
+def _run_child(target, call=None, importtime=False, env=None):
+    code, cwd = _child_code(target, call)
+    args = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    started = time.perf_counter()
+    result = subprocess.run(args, cwd=cwd, env={**os.environ, **(env or {})}, capture_output=True, text=True)
+    return result, time.perf_counter() - started
+
+
+def import_profile(target, call=None, env=None):
+    """在新的解释器中导入 target 并记录每个模块的导入耗时"""
+    result, seconds = _run_child(target, call, importtime=True, env=env)
+    entries = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append(ImportEntry(name, int(self_us) / 1000, int(cumulative_us) / 1000, (len(indent) - 1) // 2))
+    error = ""
+    if result.returncode != 0:
+        error = next((l for l in reversed(result.stderr.splitlines()) if l and not l.startswith("import time:")), "")
+    return ImportProfile(str(target), seconds, entries, error)
+
+
+def cold_start(target, call=None, repeat=3, env=None):
+    """新解释器从启动到导入 target（并运行 call）完成的耗时，返回 (中位数秒数, 每次秒数)"""
+    samples = []
+    for _ in range(repeat):
+        result, seconds = _run_child(target, call, env=env)
+        if result.returncode != 0:
+            raise RuntimeError(f"{target} 运行失败: {result.stderr.strip().splitlines()[-1:]}")
+        samples.append(seconds)
+    return statistics.median(samples), samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="模块导入耗时分析（-X importtime）和冷启动计时")
+    parser.add_argument("targets", nargs="+", help="main.py 路径或模块名")
+    parser.add_argument("--call", help="导入后调用的函数（例如第一个示例），计入冷启动时间")
+    parser.add_argument("--top", type=int, default=15, help="显示耗时最多的前 N 个包")
+    parser.add_argument("--repeat", type=int, default=3, help="冷启动计时次数（取中位数）")
+    args = parser.parse_args(argv)
+
+    for target in args.targets:
+        print(import_profile(target).report(args.top))
+        try:
+            median, _ = cold_start(target, args.call, args.repeat)
+            print(f"  冷启动{f'（含 {args.call}）' if args.call else ''}: {median:.2f}s（{args.repeat} 次中位数）\n")
+        except RuntimeError as e:
+            print(f"  [错误] {e}\n")
+
+
+if __name__ == "__main__":
+    main()
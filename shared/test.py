@@ -0,0 +1,304 @@
+"""
+简单测试：验证共享组件（不需要 API key）
+"""
+
+import asyncio
+import sys
+import time
+from contextlib import aclosing
+from pathlib import Path
+
+# 获取脚本所在目录
+SCRIPT_DIR = Path(__file__).parent
+sys.path.insert(0, str(SCRIPT_DIR))
+
+from langchain.agents import create_agent
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langgraph.checkpoint.memory import InMemorySaver
+
+print("=" * 70)
+print("测试：共享组件")
+print("=" * 70)
+
+
+class SlowEchoModel(BaseChatModel):
+    """异步等待 latency 秒后回复最后一条消息；记录同时进行的调用"""
+    latency: float = 0.02
+    active: dict = {}
+
+    @property
+    def _llm_type(self):
+        return "slow-echo"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        content = messages[-1].content
+        if content == "fail":
+            raise RuntimeError("模拟模型错误")
+        thread = content.split(":")[0]
+        # 同一会话的两轮不能同时进行
+        assert not self.active.get(thread), f"{thread} 的两轮同时执行"
+        self.active[thread] = True
+        self.active["_now"] = self.active.get("_now", 0) + 1
+        self.active["_peak"] = max(self.active.get("_peak", 0), self.active["_now"])
+        await asyncio.sleep(self.latency)
+        self.active[thread] = False
+        self.active["_now"] -= 1
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(f"收到 {content}"))])
+
+
+# ============================================================================
+# 测试 1：异步运行器（并发上限、会话内顺序、限速）
+# ============================================================================
+print("\n--- 测试 1: 异步运行器 ---")
+
+from async_runner import AsyncAgentRunner
+
+
+async def test_runner():
+    model = SlowEchoModel(active={})
+    runner = AsyncAgentRunner(max_concurrency=5)
+    runner.agent = create_agent(model=model, tools=[], checkpointer=InMemorySaver())
+
+    turns = [(f"t{u}", f"t{u}:{r}") for r in range(4) for u in range(10)]
+    turns.append(("t0", "fail"))
+    results = await runner.run_many(turns)
+
+    # 结果按提交顺序返回，失败的轮次记录异常
+    assert [r.thread_id for r in results] == [t for t, _ in turns]
+    assert not results[-1].ok and isinstance(results[-1].error, RuntimeError)
+    assert all(r.ok for r in results[:-1])
+    # 全局并发上限
+    assert model.active["_peak"] <= 5 and runner.stats.peak_in_flight <= 5
+    # 每个会话的消息按提交顺序排列
+    state = await runner.agent.aget_state({"configurable": {"thread_id": "t3"}})
+    humans = [m.content for m in state.values["messages"] if m.type == "human"]
+    assert humans == [f"t3:{r}" for r in range(4)], humans
+    # 没有排队的轮次时不保留会话锁
+    assert runner._threads == {}
+
+    streamed = [s async for s in runner.astream("t1", "t1:stream")]
+    assert streamed[-1]["messages"][-1].content == "收到 t1:stream"
+
+    # 提前 break：aclosing 退出时立即释放会话锁和名额
+    async with aclosing(runner.astream("t2", "t2:stream")) as stream:
+        async for _ in stream:
+            break
+    assert runner._threads == {} and runner.stats.in_flight == 0
+
+    # astream 同样受 timeout 限制，超时后释放会话锁
+    slow = AsyncAgentRunner(timeout=0.05)
+    slow.agent = create_agent(model=SlowEchoModel(latency=1.0, active={}), tools=[], checkpointer=InMemorySaver())
+    started = time.perf_counter()
+    try:
+        async for _ in slow.astream("t4", "t4:slow"):
+            pass
+        raise AssertionError("astream 应该超时")
+    except asyncio.TimeoutError:
+        pass
+    assert time.perf_counter() - started < 0.5
+    assert slow._threads == {} and slow.stats.failed == 1
+    return runner
+
+
+runner = asyncio.run(test_runner())
+print(f"\n[OK] 异步运行器测试通过")
+print(f"  {runner.stats}")
+
+
+async def test_rate_limit():
+    runner = AsyncAgentRunner(max_concurrency=50,
+                              rate_limits={"slow-echo": {"requests_per_second": 50, "max_bucket_size": 1,
+                                                         "check_every_n_seconds": 0.005}})
+    model = runner.limit_model(SlowEchoModel(latency=0, active={}), provider="slow-echo")
+    assert model.rate_limiter is runner.rate_limiter("slow-echo")
+    runner.agent = create_agent(model=model, tools=[], checkpointer=InMemorySaver())
+    started = time.perf_counter()
+    await runner.run_many([(f"r{i}", f"r{i}:0") for i in range(10)])
+    return time.perf_counter() - started
+
+
+elapsed = asyncio.run(test_rate_limit())
+# 每秒 50 次、桶容量 1：10 次调用至少需要约 0.18 秒
+assert elapsed >= 0.15, elapsed
+print(f"[OK] 限速测试通过：10 次模型调用耗时 {elapsed:.2f}s（限速 50 次/秒）")
+
+
+# ============================================================================
+# 测试 2：离线假模型（脚本、工具调用、流式、延迟、故障注入）
+# ============================================================================
+print("\n--- 测试 2: 离线假模型 ---")
+
+from langchain.chat_models import init_chat_model
+from langchain_core.tools import tool
+from fake_chat_model import REGISTERED, FakeChatModel, FakeModelError, tool_call
+
+
+@tool
+def get_order_status(order_id: str) -> str:
+    """查询订单状态"""
+    return {"12345": "已发货"}.get(order_id, "订单不存在")
+
+
+# 通过 init_chat_model 创建（langchain < 1.3 无法注册 fake 提供方时直接创建），脚本驱动一次完整的工具调用循环
+script = [tool_call("get_order_status", order_id="12345"), "订单已发货"]
+model = init_chat_model("fake:scripted", responses=script) if REGISTERED else FakeChatModel(responses=script)
+assert isinstance(model, FakeChatModel) and model.model == "scripted"
+agent = create_agent(model=model, tools=[get_order_status])
+result = agent.invoke({"messages": [{"role": "user", "content": "订单 12345 到哪了？"}]})
+assert [m.type for m in result["messages"]] == ["human", "ai", "tool", "ai"]
+assert result["messages"][2].content == "已发货" and result["messages"][-1].content == "订单已发货"
+assert model.stats.calls == 2 and model.stats.tool_calls == 1
+
+# respond 根据输入动态生成回复
+upper = FakeChatModel(respond=lambda messages, tools: messages[-1].content.upper())
+assert upper.invoke("hello").content == "HELLO"
+
+# 流式：逐 token 产出，拼接后与完整回复相同，最后一块带 usage_metadata
+streamer = FakeChatModel(responses=["LangChain 是一个 LLM 应用框架"])
+chunks = list(streamer.stream("介绍一下"))
+assert len(chunks) > 5 and "".join(c.content for c in chunks) == "LangChain 是一个 LLM 应用框架"
+assert chunks[-1].usage_metadata["output_tokens"] == len(chunks) - 1
+
+# 延迟：首 token + 每 token；异步调用并发等待
+slow = FakeChatModel(responses=["一二三四五"], first_token_latency=0.05, per_token_latency=0.01)
+started = time.perf_counter()
+slow.invoke("hi")
+assert 0.09 <= time.perf_counter() - started < 0.3
+
+
+async def concurrent_calls():
+    await asyncio.gather(*[slow.ainvoke("hi") for _ in range(20)])
+
+
+started = time.perf_counter()
+asyncio.run(concurrent_calls())
+assert time.perf_counter() - started < 0.5          # 20 次 × 0.1s，并发执行
+
+# 故障注入：指定序号失败；相同 seed 的随机故障可重复
+flaky = FakeChatModel(fail_on_calls=(1,))
+flaky.invoke("a")
+try:
+    flaky.invoke("b")
+    raise AssertionError("第 1 次调用应该失败")
+except FakeModelError:
+    pass
+assert flaky.invoke("c").content == "收到: c" and flaky.stats.failures == 1
+
+
+def failure_pattern(seed):
+    model = FakeChatModel(failure_rate=0.3, seed=seed)
+    pattern = []
+    for _ in range(30):
+        try:
+            model.invoke("x")
+            pattern.append(0)
+        except FakeModelError:
+            pattern.append(1)
+    return pattern
+
+
+assert failure_pattern(7) == failure_pattern(7) and 0 < sum(failure_pattern(7)) < 30
+
+print(f"\n[OK] 离线假模型测试通过")
+print(f"  {model.stats}")
+
+
+# ============================================================================
+# 测试 3：基准测试套件（快速运行 + 回归判断）
+# ============================================================================
+print("\n--- 测试 3: 基准测试套件 ---")
+
+import copy
+from bench_suite import compare, run_benchmarks
+
+current = run_benchmarks(only=["agent.step", "checkpoint.get"], quick=True, echo=lambda line: None)
+assert set(current["results"]) == {"agent.step", "checkpoint.get.10", "checkpoint.get.100"}, current["results"].keys()
+assert current["results"]["agent.step"]["params"]["steps_per_invoke"] == 7
+assert all(r["median_ms"] > 0 and r["p95_ms"] >= r["median_ms"] for r in current["results"].values())
+assert all(r["repeats"] == 5 and r["params"] for r in current["results"].values())
+
+# 基线快一倍 -> 回归；基线慢一倍 -> 改进；差值小于噪声下限 -> ok；基线没有的项 -> new
+baseline = copy.deepcopy(current)
+baseline["results"]["agent.step"]["median_ms"] /= 2
+baseline["results"]["checkpoint.get.100"]["median_ms"] = current["results"]["checkpoint.get.100"]["median_ms"] * 2 + 1
+del baseline["results"]["checkpoint.get.10"]
+status = {name: s for name, _, _, _, s in compare(current, baseline, threshold=0.2)}
+assert status == {"agent.step": "regression", "checkpoint.get.100": "improved", "checkpoint.get.10": "new"}, status
+tiny = copy.deepcopy(current)
+tiny["results"]["agent.step"]["median_ms"] -= 0.1
+assert compare(current, tiny, threshold=0.01, min_delta_ms=0.25)[0][4] == "ok"
+# 参数（数据规模）不同的项不比较；快速模式不同时拒绝比较
+other = copy.deepcopy(current)
+other["results"]["checkpoint.get.100"]["params"]["messages"] = 1000
+assert {name: s for name, _, _, _, s in compare(current, other)}["checkpoint.get.100"] == "mismatch"
+other["meta"]["quick"] = False
+try:
+    compare(current, other)
+    raise AssertionError("快速模式不同时应拒绝比较")
+except ValueError:
+    pass
+
+print(f"\n[OK] 基准测试套件测试通过")
+print(f"  agent.step 每步 {current['results']['agent.step']['median_ms']:.3f} ms（中位数）")
+
+
+# ============================================================================
+# 测试 4：启动层（延迟导入、延迟创建模型、导入耗时分析）
+# ============================================================================
+print("\n--- 测试 4: 启动层 ---")
+
+import os
+from startup import get_model, import_profile, lazy_import
+
+# 访问属性前不导入；不存在的模块到使用时才报错
+json_dumps = lazy_import("json", "dumps")
+assert json_dumps('{"a": 1}') and json_dumps.loaded
+missing = lazy_import("module_that_is_not_installed", "Client")
+assert not missing.loaded
+try:
+    missing(api_key="x")
+    raise AssertionError("应该抛出 ImportError")
+except ImportError:
+    pass
+
+# CHAT_MODEL 选择模型；同样的参数返回同一个实例；缺少 API key 时第一次使用才报错
+os.environ["CHAT_MODEL"] = "fake:startup-test"
+first = get_model(responses=["你好"])
+assert isinstance(first, FakeChatModel) and first.model == "startup-test"
+assert get_model(responses=["你好"]) is first and get_model() is not first
+os.environ.pop("GROQ_API_KEY", None)
+try:
+    get_model("groq:llama-3.3-70b-versatile")
+    raise AssertionError("应该提示设置 GROQ_API_KEY")
+except ValueError as e:
+    assert "GROQ_API_KEY" in str(e)
+del os.environ["CHAT_MODEL"]
+
+# 导入 09 的 main.py 不再需要 API key，也不导入 langgraph 的 Agent 模块
+profile = import_profile(SCRIPT_DIR.parent / "phase2_practical" / "09_checkpointing" / "main.py")
+names = {e.name for e in profile.entries}
+assert not profile.error, profile.error
+assert "async_runner" in names and "langchain.agents" not in names and "langgraph.checkpoint.sqlite" not in names
+assert profile.by_package()[0][1] > 0
+
+print(f"\n[OK] 启动层测试通过")
+print(f"  {profile.report(top=3)}")
+
+
+# ============================================================================
+# 总结
+# ============================================================================
+print("\n" + "=" * 70)
+print("共享组件测试完成！")
+print("=" * 70)
+
+print("\n已验证:")
+print("  [OK] 异步运行器 (AsyncAgentRunner)")
+print("  [OK] 离线假模型 (FakeChatModel, init_chat_model(\"fake:...\"))")
+print("  [OK] 基准测试套件 (bench_suite.py, compare)")
+print("  [OK] 启动层 (lazy_import, get_model, import_profile)")